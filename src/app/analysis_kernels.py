@@ -0,0 +1,328 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+"""
+Pure compute kernels of FundingRateChart.
+
+Every kernel takes plain (n, 7) float candle arrays [timestamp, open, high, low, close, volume,
+notional] and returns plain Python values, so it can run in a worker process (see
+src.app.compute) without pickling DataFrames. Keep this module free of I/O and app imports: it
+is what worker processes import.
+"""
+
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional']
+
+DAILY_VOLATILITY_THRESHOLD = 2.0
+WEEKLY_VOLATILITY_THRESHOLD = 2.0
+WEEKLY_PRICE_CHANGE_THRESHOLD = 5.0  # Percentage change threshold for strong trends
+MINUTES_PER_YEAR = 252 * 1440
+EVENT_STUDY_QUANTILES = (0.1, 0.25, 0.75, 0.9)
+
+
+def _frame(candles: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(candles, columns=CANDLE_COLUMNS[:candles.shape[1]])
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def classify_daily_trend(latest_close: float, ma5: float, ma15: float, volatility: float) -> str:
+    """Daily (15m) trend from the last close, MA5 / MA15 and the std of pct changes"""
+    # Analyze trend
+    if latest_close < ma5 and ma5 < ma15:
+        trend = "strongly bearish"
+    elif latest_close > ma5 and ma5 > ma15:
+        trend = "strongly bullish"
+    elif latest_close < ma5:
+        trend = "bearish"
+    elif latest_close > ma5:
+        trend = "bullish"
+    else:
+        trend = "neutral"
+
+    # Adjust sideways movement detection
+    if abs(ma5 - ma15) / ma15 < 0.003:
+        trend = "sideways"
+
+    # Adjust for volatility without overriding the trend completely
+    if volatility > DAILY_VOLATILITY_THRESHOLD:
+        if "bearish" in trend:
+            trend = "volatile bearish"
+        elif "bullish" in trend:
+            trend = "volatile bullish"
+        else:
+            trend = "volatile"
+
+    return trend
+
+
+def classify_weekly_trend(latest_close: float, ma20: float, ma50: float, weekly_change_pct: float, volatility: float) -> str:
+    """Weekly (1H) trend from the last close, MA20 / MA50, the change over the week and the std of pct changes"""
+    # Analyze trend based on moving averages and price changes
+    if latest_close > ma20 > ma50:
+        if weekly_change_pct > WEEKLY_PRICE_CHANGE_THRESHOLD:
+            trend = "strongly bullish"
+        else:
+            trend = "bullish"
+    elif latest_close < ma20 < ma50:
+        if weekly_change_pct < -WEEKLY_PRICE_CHANGE_THRESHOLD:
+            trend = "strongly bearish"
+        else:
+            trend = "bearish"
+    elif abs(weekly_change_pct) < 1.0:
+        trend = "neutral"
+    else:
+        # Check for corrective or sideways movement
+        if abs(ma20 - ma50) / ma50 < 0.01:
+            trend = "sideways"
+        elif weekly_change_pct > 0:
+            trend = "corrective"
+        else:
+            trend = "volatile"
+
+    # Adjust for high volatility
+    if volatility > WEEKLY_VOLATILITY_THRESHOLD:
+        trend = "volatile"
+
+    return trend
+
+
+def annualized_volatility_index(log_return_std: float, periods_per_year: int = MINUTES_PER_YEAR) -> float:
+    """Std of 1m log returns -> annualized volatility in percent"""
+    return log_return_std * np.sqrt(periods_per_year) * 100
+
+
+def variation_8h(candles: np.ndarray) -> float:
+    """Open of the first candle vs close of the last one, in percent"""
+    df = _frame(candles)
+    start_price = df['open'].iloc[0]
+    end_price = df['close'].iloc[-1]
+    return float(((start_price - end_price) / end_price) * 100)
+
+
+def variation_10m(candles: np.ndarray) -> float:
+    """Drop from the first open to the lowest low"""
+    df = _frame(candles)
+    df['close'] = pd.to_numeric(df['close'], errors='coerce')
+    df.dropna(subset=['close'], inplace=True)
+
+    # Check if there are enough data points
+    if len(df) < 2:
+        print("Not enough data points in df10m.")
+        return 0.0
+
+    start_price = df['open'].iloc[0]
+    lowest_price = df['low'].min()
+    return float((start_price - lowest_price) / lowest_price)
+
+
+def daily_trend(candles: np.ndarray) -> str:
+    """15m candles of one day -> trend descriptor"""
+    df = _frame(candles)
+    df.dropna(subset=['close'], inplace=True)
+
+    # Sort by time in ascending order
+    df.sort_values('timestamp', inplace=True)
+    df.reset_index(drop=True, inplace=True)
+
+    if len(df) == 0:
+        print("No data available after cleaning. Cannot proceed with analysis.")
+        return "neutral"
+
+    price_change_pct = df['close'].pct_change() * 100
+    latest_ma5 = df['close'].rolling(window=5).mean().iloc[-1]
+    latest_ma15 = df['close'].rolling(window=15).mean().iloc[-1]
+
+    # Calculate volatility (standard deviation of price changes)
+    volatility = price_change_pct.std()
+
+    # Ensure moving averages are valid
+    if pd.isna(latest_ma5) or pd.isna(latest_ma15):
+        print("Moving averages are NaN. Not enough data points.")
+        return "neutral"
+
+    return classify_daily_trend(df['close'].iloc[-1], latest_ma5, latest_ma15, volatility)
+
+
+def weekly_trend(candles: np.ndarray) -> str:
+    """1H candles of one week -> trend descriptor"""
+    df = _frame(candles)
+
+    price_change_pct = df['close'].pct_change() * 100
+    latest_ma20 = df['close'].rolling(window=20).mean().iloc[-1]
+    latest_ma50 = df['close'].rolling(window=50).mean().iloc[-1]
+
+    # Calculate volatility (standard deviation of price changes)
+    volatility = price_change_pct.std()
+
+    latest_close = df['close'].iloc[-1]
+    # Calculate total percentage change over the week
+    weekly_change_pct = ((latest_close - df['open'].iloc[0]) / df['open'].iloc[0]) * 100
+
+    return classify_weekly_trend(latest_close, latest_ma20, latest_ma50, weekly_change_pct, volatility)
+
+
+def volatility_index(candles: np.ndarray):
+    """Annualized std of 1m log returns, in percent (None without enough data)"""
+    close = candles[:, 4]
+    close = close[~np.isnan(close)]
+
+    # Remove non-positive prices
+    close = close[close > 0]
+    log_return = np.log(close[1:] / close[:-1])
+
+    # Ensure there are enough data points
+    if len(log_return) < 2:
+        print("Not enough data points to calculate volatility.")
+        return None
+
+    # Sample std, same as pandas .std()
+    value = annualized_volatility_index(np.std(log_return, ddof=1))
+    if np.isnan(value) or np.isinf(value):
+        print("Calculated volatility index is invalid.")
+        return None
+    return float(value)
+
+
+def average_volume(candles: np.ndarray):
+    """Mean of the volume column ignoring NaNs"""
+    volume = candles[:, 5]
+    volume = volume[~np.isnan(volume)]
+    return float(volume.mean()) if len(volume) else float('nan')
+
+
+def scrub_invalid(result: dict) -> dict:
+    """NaN / Inf floats -> None, JSON can't carry them"""
+    for key, value in result.items():
+        if isinstance(value, float) and (np.isnan(value) or np.isinf(value)):
+            print(f"Warning: {key} has invalid value ({value}). Replacing with None.")
+            result[key] = None
+    return result
+
+
+def align_event_returns(candles: np.ndarray, event_ts: np.ndarray, step_ms: int, steps: int) -> np.ndarray:
+    """
+    events x steps matrix of percent returns: column k is the close `k + 1` candles after the event
+    vs the open of the event candle. Missing candles (gaps, future) are NaN.
+    """
+    matrix = np.full((len(event_ts), steps), np.nan)
+    if not len(candles) or not len(event_ts):
+        return matrix
+
+    candles = candles[np.argsort(candles[:, 0], kind="stable")]
+    timestamps = candles[:, 0]
+    targets = (np.asarray(event_ts, dtype=np.int64) // step_ms * step_ms)[:, None] + np.arange(steps) * step_ms
+    index = np.minimum(np.searchsorted(timestamps, targets), len(timestamps) - 1)
+    found = timestamps[index] == targets
+
+    entry = np.where(found[:, 0], candles[index[:, 0], 1], np.nan)
+    close = np.where(found, candles[index, 4], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matrix[:] = (close / entry[:, None] - 1) * 100
+    matrix[~np.isfinite(matrix)] = np.nan
+    return matrix
+
+
+def _json_floats(values: np.ndarray) -> list:
+    return [None if np.isnan(value) else round(float(value), 6) for value in values]
+
+
+def event_study_stats(matrix: np.ndarray, quantiles=EVENT_STUDY_QUANTILES) -> dict:
+    """Mean / median / quantile paths of an events x offsets return matrix in one pass, NaN ignored"""
+    count = (~np.isnan(matrix)).sum(axis=0)
+    with warnings.catch_warnings():
+        # Offsets no event reached yet are all-NaN columns, their statistics are NaN -> None
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean = np.nanmean(matrix, axis=0)
+        median = np.nanmedian(matrix, axis=0)
+        paths = np.nanquantile(matrix, quantiles, axis=0) if len(matrix) else np.full((len(quantiles), matrix.shape[1]), np.nan)
+        positive = np.where(count > 0, (matrix > 0).sum(axis=0) / np.maximum(count, 1), np.nan)
+
+    return {
+        "count": count.tolist(),
+        "mean": _json_floats(mean),
+        "median": _json_floats(median),
+        "quantiles": {f"p{int(q * 100)}": _json_floats(path) for q, path in zip(quantiles, paths)},
+        "positive_share": _json_floats(positive)
+    }
+
+
+BACKTEST_SERIES_COLUMNS = ['timestamp', 'funding_binance', 'funding_bitget', 'close_binance', 'close_bitget']
+HOURS_PER_YEAR = 24 * 365
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Carry the last non-NaN value forward, NaN until the first one"""
+    index = np.where(~np.isnan(values), np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+def _hourly_rate(timestamps: np.ndarray, settlements: np.ndarray) -> np.ndarray:
+    """Last settled funding rate divided by its own interval (time since the previous settlement), carried forward"""
+    hourly = np.full(len(settlements), np.nan)
+    settled = np.flatnonzero(~np.isnan(settlements))
+    if not len(settled):
+        return hourly
+    gaps = np.diff(timestamps[settled]) / 3_600_000
+    intervals = np.concatenate([[gaps[0] if len(gaps) else 8.0], gaps])
+    hourly[settled] = settlements[settled] / np.clip(intervals, 1, None)
+    return forward_fill(hourly)
+
+
+def _carry_inputs(series: np.ndarray):
+    """Signal and per-hour P&L components of a long / short funding carry over an aligned (T, 5) series"""
+    timestamps = series[:, 0]
+    # Bitget - Binance, percent per 8h with each side normalized by its own interval
+    spread = (_hourly_rate(timestamps, series[:, 2]) - _hourly_rate(timestamps, series[:, 1])) * 8
+    funding = np.nan_to_num(series[:, 2]) - np.nan_to_num(series[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = (series[1:, 3:5] / series[:-1, 3:5] - 1) * 100
+    returns = np.nan_to_num(np.vstack([np.zeros((1, 2)), returns]), nan=0.0, posinf=0.0, neginf=0.0)
+    return spread, funding, returns[:, 0] - returns[:, 1]
+
+
+def _finite(value: float):
+    return float(value) if np.isfinite(value) else None
+
+
+def _carry_run(spread: np.ndarray, funding: np.ndarray, basis: np.ndarray, entry: float, exit_: float, fee_bps: float, slippage_bps: float) -> dict:
+    """
+    +1 = short Bitget / long Binance (collects Bitget - Binance funding), -1 the opposite.
+    Enter on |spread| >= entry with the spread's sign, flat on |spread| <= exit, hold in between.
+    The position decided at hour t is held from t + 1, so it only earns settlements it was open for.
+    """
+    magnitude = np.abs(spread)
+    signal = np.where(magnitude >= entry, np.sign(spread), np.where((magnitude <= exit_) | np.isnan(spread), 0.0, np.nan))
+    target = np.nan_to_num(forward_fill(signal))
+    position = np.concatenate([[0.0], target[:-1]])
+
+    turnover = np.abs(np.diff(position, prepend=0.0))
+    costs = turnover * 2 * (fee_bps + slippage_bps) / 100  # two legs, bps -> percent of notional
+    funding_pnl = position * funding
+    basis_pnl = position * basis
+    pnl = funding_pnl + basis_pnl - costs
+
+    equity = np.cumsum(pnl)
+    drawdown = float(np.max(np.maximum.accumulate(equity) - equity)) if len(equity) else 0.0
+    std = pnl.std(ddof=1) if len(pnl) > 1 else 0.0
+    return {
+        "entry": entry, "exit": exit_, "fee_bps": fee_bps, "slippage_bps": slippage_bps,
+        "total_return": float(equity[-1]) if len(equity) else 0.0,
+        "funding_pnl": float(funding_pnl.sum()),
+        "basis_pnl": float(basis_pnl.sum()),
+        "costs": float(costs.sum()),
+        "trades": int(((turnover > 0) & (position != 0)).sum()),
+        "time_in_market": float((position != 0).mean()) if len(position) else 0.0,
+        "max_drawdown": drawdown,
+        "sharpe": _finite(pnl.mean() / std * np.sqrt(HOURS_PER_YEAR)) if std > 0 else None
+    }
+
+
+def backtest_carry_grid(series: np.ndarray, grid: np.ndarray) -> list:
+    """Every [entry, exit, fee_bps, slippage_bps] row of `grid` over one symbol's aligned series"""
+    spread, funding, basis = _carry_inputs(series)
+    return [_carry_run(spread, funding, basis, *map(float, params)) for params in grid]
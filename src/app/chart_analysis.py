@@ -1,16 +1,33 @@
 from datetime import datetime, timezone
-from typing import Literal
-import pandas as pd
+from collections import deque
+from typing import Dict, Literal, Optional, Tuple
 import numpy as np
 import asyncio
 
 from src.app.crypto_data_service import CryptoDataService, Granularity
+from src.app.indicators import RollingSMA, RollingWelford, WilderRSI, ReturnTracker, dump_indicators, load_indicators
+from src.app import analysis_kernels as kernels
+from src.app.analysis_kernels import classify_daily_trend, classify_weekly_trend, annualized_volatility_index
+from src.app.compute import compute_executor
+
 
 class FundingRateChart:
-    
-    def __init__(self, symbol):
+    # (granularity, start offset, end offset) in ms around the period of every candle window
+    # set_analysis downloads, lets callers (e.g. the backfill) prefetch them in bulk
+    CANDLE_WINDOWS = (
+        ('1H', 0, 8 * 60 * 60 * 1000),                 # 8h variation
+        ('4H', 0, 8 * 60 * 60 * 1000),                 # 8h variation fallback
+        ('1m', 0, 10 * 60 * 1000),                     # 10m variation / volatility index
+        ('15m', -24 * 60 * 60 * 1000, 0),              # daily trend
+        ('1H', 0, 7 * 24 * 60 * 60 * 1000),            # weekly trend (covers the 24h volume window)
+        ('4H', -7 * 24 * 60 * 60 * 1000, 0),           # weekly average volume
+    )
+
+    def __init__(self, symbol, candle_source=None):
         self.symbol = symbol
         self.bitget_service = CryptoDataService()
+        # Anything with CryptoDataService.get_candlestick_chart's signature (e.g. RingCandleSource)
+        self.candle_source = candle_source or self.bitget_service
         self.df8h = None
         self.df10m = None
         self.dfdialy = None
@@ -71,69 +88,36 @@ class FundingRateChart:
         }
 
         # Check for NaN or Inf values in result
-        for key, value in result.items():
-            if isinstance(value, float) and (pd.isna(value) or np.isinf(value)):
-                print(f"Warning: {key} has invalid value ({value}). Replacing with None.")
-                result[key] = None
-
-        return result
+        return kernels.scrub_invalid(result)
 
     async def get_8h_variation(self, period: int):
         """Get variation since funding rate was up until 8 hours later"""
         # Get Candlestick data
         granularity = '1H'
         end_time = period + 8 * 60 * 60 * 1000
-        candle_stick_data = await self.bitget_service.get_candlestick_chart(self.symbol, granularity, start_time=period, end_time=end_time)
+        candle_stick_data = await self.candle_source.get_candlestick_chart(self.symbol, granularity, start_time=period, end_time=end_time)
 
         if not candle_stick_data.any():
-            candle_stick_data = await self.bitget_service.get_candlestick_chart(self.symbol, '4H', start_time=period, end_time=end_time)
+            candle_stick_data = await self.candle_source.get_candlestick_chart(self.symbol, '4H', start_time=period, end_time=end_time)
             if not candle_stick_data.any():
                 raise Exception("The chart is not avariable, so i think i shouldn't be possible to access")
         
-        self.df8h = pd.DataFrame(candle_stick_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional'])
-
-        # Calculate variation
-        start_price = self.df8h['open'].iloc[0]
-        regression = self.df8h['low'].min()
-        end_price = self.df8h['close'].iloc[-1]
-        
-        volatility = ((start_price - end_price) / end_price) * 100    
-        regg = ((start_price - regression) / regression) * 100
-
-        return volatility
+        # Raw candles are kept, the kernel runs in the compute pool
+        self.df8h = candle_stick_data
+        return await compute_executor.run(kernels.variation_8h, self.df8h)
 
     async def get_10m_variation(self, period: int):
         granularity = '1m'
         end_time = period + 10 * 60 * 1000
-        candle_stick_data = await self.bitget_service.get_candlestick_chart(
+        candle_stick_data = await self.candle_source.get_candlestick_chart(
             self.symbol, granularity, start_time=period, end_time=end_time
         )
 
         if not candle_stick_data.any():
             raise Exception("The chart is not available.")
 
-        self.df10m = pd.DataFrame(candle_stick_data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional'
-        ])
-
-        # Ensure numeric data types
-        self.df10m['close'] = pd.to_numeric(self.df10m['close'], errors='coerce')
-
-        # Drop rows with NaN values
-        self.df10m.dropna(subset=['close'], inplace=True)
-
-        # Check if there are enough data points
-        if len(self.df10m) < 2:
-            print("Not enough data points in df10m.")
-            return 0.0
-            
-        # Calculate variation
-        start_price = self.df10m['open'].iloc[0]
-        # end_price = df['close'].iloc[-1]
-        lowest_price = self.df10m['low'].min()
-
-        volatility = ((start_price - lowest_price) / lowest_price) 
-        return volatility
+        self.df10m = candle_stick_data
+        return await compute_executor.run(kernels.variation_10m, self.df10m)
 
 
     async def get_daily_trend(self, period: int) -> Literal[
@@ -149,7 +133,7 @@ class FundingRateChart:
 
         # Fetch candlestick data for the day at 15-minute intervals
         granularity = '15m'
-        candle_stick_data = await self.bitget_service.get_candlestick_chart(
+        candle_stick_data = await self.candle_source.get_candlestick_chart(
             self.symbol, granularity, start_time=start_time, end_time=end_time
         )
 
@@ -157,87 +141,8 @@ class FundingRateChart:
             print("No data fetched. Please check the time range and data availability.")
             return "neutral"
 
-        # Create DataFrame
-        self.dfdaily = pd.DataFrame(candle_stick_data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional'
-        ])
-
-        # Ensure numeric data types
-        for col in ['open', 'high', 'low', 'close', 'volume', 'notional']:
-            self.dfdaily[col] = pd.to_numeric(self.dfdaily[col], errors='coerce')
-
-        # Drop rows with NaN values
-        self.dfdaily.dropna(subset=['close'], inplace=True)
-
-        # Convert timestamp to datetime
-        self.dfdaily['datetime'] = pd.to_datetime(self.dfdaily['timestamp'], unit='ms')
-
-        # Sort the DataFrame by datetime in ascending order
-        self.dfdaily.sort_values('datetime', inplace=True)
-        self.dfdaily.reset_index(drop=True, inplace=True)
-
-        # Verify data integrity
-        if len(self.dfdaily) == 0:
-            print("No data available after cleaning. Cannot proceed with analysis.")
-            return "neutral"
-
-        # Calculate price changes
-        self.dfdaily['price_change'] = self.dfdaily['close'].diff()
-        self.dfdaily['price_change_pct'] = self.dfdaily['close'].pct_change() * 100
-
-        # Calculate moving averages with shorter periods
-        self.dfdaily['ma5'] = self.dfdaily['close'].rolling(window=5).mean()
-        self.dfdaily['ma15'] = self.dfdaily['close'].rolling(window=15).mean()
-
-        # Calculate volatility (standard deviation of price changes)
-        volatility = self.dfdaily['price_change_pct'].std()
-
-        # Determine trend based on moving averages
-        latest_close = self.dfdaily['close'].iloc[-1]
-        latest_ma5 = self.dfdaily['ma5'].iloc[-1]
-        latest_ma15 = self.dfdaily['ma15'].iloc[-1]
-
-        # Ensure moving averages are valid
-        if pd.isna(latest_ma5) or pd.isna(latest_ma15):
-            print("Moving averages are NaN. Not enough data points.")
-            return "neutral"
-
-        # Initialize trend
-        trend = "neutral"
-
-        # Define thresholds
-        volatility_threshold = 2.0  # Adjusted volatility threshold
-
-        # Analyze trend
-        if latest_close < latest_ma5 and latest_ma5 < latest_ma15:
-            trend = "strongly bearish"
-        elif latest_close > latest_ma5 and latest_ma5 > latest_ma15:
-            trend = "strongly bullish"
-        elif latest_close < latest_ma5:
-            trend = "bearish"
-        elif latest_close > latest_ma5:
-            trend = "bullish"
-        else:
-            trend = "neutral"
-
-        # Adjust sideways movement detection
-        if abs(latest_ma5 - latest_ma15) / latest_ma15 < 0.003:
-            trend = "sideways"
-
-        # Adjust for volatility without overriding the trend completely
-        if volatility > volatility_threshold:
-            if "bearish" in trend:
-                trend = "volatile bearish"
-            elif "bullish" in trend:
-                trend = "volatile bullish"
-            else:
-                trend = "volatile"
-
-        # Return the determined trend
-        return trend
-
-
-
+        self.dfdaily = candle_stick_data
+        return await compute_executor.run(kernels.daily_trend, self.dfdaily)
 
     async def get_weekly_trends(self, period: int) -> Literal[
             "bullish", "bearish", "neutral", "highly bullish", "highly bearish",
@@ -252,79 +157,15 @@ class FundingRateChart:
 
             # Fetch candlestick data for the week at hourly intervals
             granularity = '1H'  # 1-hour intervals
-            candle_stick_data = await self.bitget_service.get_candlestick_chart(
+            candle_stick_data = await self.candle_source.get_candlestick_chart(
                 self.symbol, granularity, start_time=start_time, end_time=end_time
             )
 
             if not candle_stick_data.any():
                 raise Exception("The chart data is not available for the specified period.")
 
-            # Create DataFrame
-            self.dfweekly = pd.DataFrame(candle_stick_data, columns=[
-                'timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional'
-            ])
-
-            # Ensure numeric data types
-            for col in ['open', 'high', 'low', 'close', 'volume', 'notional']:
-                self.dfweekly[col] = pd.to_numeric(self.dfweekly[col])
-
-            # Convert timestamp to datetime
-            self.dfweekly['datetime'] = pd.to_datetime(self.dfweekly['timestamp'], unit='ms')
-
-            # Calculate price changes
-            self.dfweekly['price_change'] = self.dfweekly['close'].diff()
-            self.dfweekly['price_change_pct'] = self.dfweekly['close'].pct_change() * 100
-
-            # Calculate moving averages
-            self.dfweekly['ma20'] = self.dfweekly['close'].rolling(window=20).mean()
-            self.dfweekly['ma50'] = self.dfweekly['close'].rolling(window=50).mean()
-
-            # Calculate volatility (standard deviation of price changes)
-            volatility = self.dfweekly['price_change_pct'].std()
-
-            # Determine trend based on moving averages
-            latest_close = self.dfweekly['close'].iloc[-1]
-            latest_ma20 = self.dfweekly['ma20'].iloc[-1]
-            latest_ma50 = self.dfweekly['ma50'].iloc[-1]
-
-            # Initialize trend
-            trend = "neutral"
-
-            # Define thresholds
-            volatility_threshold = 2.0  # Adjust based on asset volatility
-            price_change_threshold = 5.0  # Percentage change threshold for strong trends
-
-            # Calculate total percentage change over the week
-            weekly_change_pct = ((latest_close - self.dfweekly['open'].iloc[0]) / self.dfweekly['open'].iloc[0]) * 100
-
-            # Analyze trend based on moving averages and price changes
-            if latest_close > latest_ma20 > latest_ma50:
-                if weekly_change_pct > price_change_threshold:
-                    trend = "strongly bullish"
-                else:
-                    trend = "bullish"
-            elif latest_close < latest_ma20 < latest_ma50:
-                if weekly_change_pct < -price_change_threshold:
-                    trend = "strongly bearish"
-                else:
-                    trend = "bearish"
-            elif abs(weekly_change_pct) < 1.0:
-                trend = "neutral"
-            else:
-                # Check for corrective or sideways movement
-                if abs(latest_ma20 - latest_ma50) / latest_ma50 < 0.01:
-                    trend = "sideways"
-                elif weekly_change_pct > 0:
-                    trend = "corrective"
-                else:
-                    trend = "volatile"
-
-            # Adjust for high volatility
-            if volatility > volatility_threshold:
-                trend = "volatile"
-
-            # Return the determined trend
-            return trend
+            self.dfweekly = candle_stick_data
+            return await compute_executor.run(kernels.weekly_trend, self.dfweekly)
 
     async def get_volatility_index(self) -> float:
         """
@@ -336,44 +177,7 @@ class FundingRateChart:
         if self.df10m is None:
             raise ValueError("DataFrame is empty. Please fetch data before calculating volatility.")
 
-        # Ensure numeric data types
-        self.df10m['close'] = pd.to_numeric(self.df10m['close'], errors='coerce')
-
-        # Drop any rows with NaN values in 'close'
-        self.df10m = self.df10m.dropna(subset=['close'])
-
-        # Remove non-positive prices
-        self.df10m = self.df10m[self.df10m['close'] > 0]
-
-        # Calculate log returns
-        self.df10m['log_return'] = np.log(self.df10m['close'] / self.df10m['close'].shift(1))
-
-        # Drop the first row which will have NaN log_return
-        self.df10m = self.df10m.dropna(subset=['log_return'])
-
-        # Ensure there are enough data points
-        if len(self.df10m['log_return']) < 2:
-            print("Not enough data points to calculate volatility.")
-            return None  # or return 0.0
-
-        # Calculate the standard deviation of log returns
-        volatility = self.df10m['log_return'].std()
-
-        # Annualize the volatility
-        # For 1-minute data, adjust the periods per year accordingly
-        periods_per_year = 252 * (1440)  # 1,440 minutes per day
-
-        annualized_volatility = volatility * np.sqrt(periods_per_year)
-
-        # Convert volatility to percentage
-        volatility_index = annualized_volatility * 100
-
-        # Handle NaN or infinite values
-        if pd.isna(volatility_index) or np.isinf(volatility_index):
-            print("Calculated volatility index is invalid.")
-            return None  # or set to 0.0
-
-        return volatility_index
+        return await compute_executor.run(kernels.volatility_index, self.df10m)
 
     async def get_average_trading_volume(self, period: int) -> float:
         """
@@ -391,31 +195,18 @@ class FundingRateChart:
 
         # Fetch candlestick data for the day at 1-hour intervals
         granularity = '1H'
-        candle_stick_data = await self.bitget_service.get_candlestick_chart(
+        candle_stick_data = await self.candle_source.get_candlestick_chart(
             self.symbol, granularity, start_time=start_time, end_time=end_time
         )
 
         if not candle_stick_data.any():
             raise Exception("The chart data is not available for the specified period.")
 
-        # Create DataFrame
-        df_volume = pd.DataFrame(candle_stick_data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional'
-        ])
-
-        # Ensure numeric data types
-        df_volume['volume'] = pd.to_numeric(df_volume['volume'], errors='coerce')
-
-        # Drop any rows with NaN values in 'volume'
-        df_volume = df_volume.dropna(subset=['volume'])
+        # Store the candles for potential future use
+        self.dfdaily = candle_stick_data
 
         # Calculate average trading volume
-        average_volume = df_volume['volume'].mean()
-
-        # Store the DataFrame for potential future use
-        self.dfdaily = df_volume
-
-        return average_volume
+        return await compute_executor.run(kernels.average_volume, candle_stick_data)
 
     async def market_sentiment(self, period: int) -> Literal[
         "positive", "negative", "neutral", "highly positive", "highly negative",
@@ -560,31 +351,18 @@ class FundingRateChart:
 
         # Fetch candlestick data for the week at 4-hour intervals
         granularity = '4H'
-        candle_stick_data = await self.bitget_service.get_candlestick_chart(
+        candle_stick_data = await self.candle_source.get_candlestick_chart(
             self.symbol, granularity, start_time=start_time, end_time=end_time
         )
 
         if not candle_stick_data.any():
             raise Exception("The chart data is not available for the specified period.")
 
-        # Create DataFrame
-        df_volume_weekly = pd.DataFrame(candle_stick_data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional'
-        ])
-
-        # Ensure numeric data types
-        df_volume_weekly['volume'] = pd.to_numeric(df_volume_weekly['volume'], errors='coerce')
-
-        # Drop any rows with NaN values in 'volume'
-        df_volume_weekly = df_volume_weekly.dropna(subset=['volume'])
+        # Store the candles for potential future use
+        self.dfweekly = candle_stick_data
 
         # Calculate average trading volume
-        average_volume_weekly = df_volume_weekly['volume'].mean()
-
-        # Store the DataFrame for potential future use
-        self.dfweekly = df_volume_weekly
-
-        return average_volume_weekly
+        return await compute_executor.run(kernels.average_volume, candle_stick_data)
 
     async def set_description(self, regression_8h, volatility_10m, dialy_trend, weekly_tend):
         pass
@@ -600,6 +378,141 @@ class FundingRateChart:
         return rsi
 
     
+def _nan(value):
+    """Streaming indicators give None where pandas gives NaN, the classifiers expect NaN semantics"""
+    return float('nan') if value is None else value
+
+
+class LiveSymbolIndicators:
+    """
+    The trend / volatility inputs of FundingRateChart kept up to date one closed candle at a time:
+    15m -> daily trend and RSI, 1H -> weekly trend, 1m -> volatility index.
+    Windows match the batch analysis (1 day of 15m, 1 week of 1H, 10 minutes of 1m).
+    """
+
+    def __init__(self, indicators: Optional[Dict[str, object]] = None) -> None:
+        self.indicators = indicators or {
+            "returns_15m": ReturnTracker(), "ma5": RollingSMA(5), "ma15": RollingSMA(15),
+            "pct_std_15m": RollingWelford(95), "rsi_15m": WilderRSI(14),
+            "returns_1h": ReturnTracker(), "ma20": RollingSMA(20), "ma50": RollingSMA(50),
+            "pct_std_1h": RollingWelford(167),
+            "returns_1m": ReturnTracker(), "log_std_1m": RollingWelford(10)
+        }
+        self.week_opens: deque = deque(maxlen=168)
+        self.last_close: Dict[str, Tuple[int, float]] = {}
+
+    def on_candle(self, interval: str, candle) -> None:
+        timestamp, open_price, close = int(candle[0]), float(candle[1]), float(candle[4])
+        previous = self.last_close.get(interval)
+        if previous is not None and timestamp <= previous[0]:
+            return  # already consumed
+        self.last_close[interval] = (timestamp, close)
+        i = self.indicators
+
+        if interval == "15m":
+            pct, _ = i["returns_15m"].update(close)
+            i["ma5"].update(close)
+            i["ma15"].update(close)
+            i["rsi_15m"].update(close)
+            if pct is not None:
+                i["pct_std_15m"].update(pct)
+        elif interval == "1H":
+            pct, _ = i["returns_1h"].update(close)
+            i["ma20"].update(close)
+            i["ma50"].update(close)
+            self.week_opens.append(open_price)
+            if pct is not None:
+                i["pct_std_1h"].update(pct)
+        elif interval == "1m":
+            _, log_return = i["returns_1m"].update(close)
+            if log_return is not None:
+                i["log_std_1m"].update(log_return)
+
+    def daily_trend(self) -> Optional[str]:
+        i = self.indicators
+        if i["ma5"].value is None or i["ma15"].value is None:
+            return "neutral"
+        return classify_daily_trend(self.last_close["15m"][1], i["ma5"].value, i["ma15"].value, _nan(i["pct_std_15m"].std))
+
+    def weekly_trend(self) -> Optional[str]:
+        i = self.indicators
+        if "1H" not in self.last_close:
+            return None
+        close = self.last_close["1H"][1]
+        week_open = self.week_opens[0]
+        weekly_change_pct = (close - week_open) / week_open * 100
+        return classify_weekly_trend(close, _nan(i["ma20"].value), _nan(i["ma50"].value), weekly_change_pct, _nan(i["pct_std_1h"].std))
+
+    def volatility_index(self) -> Optional[float]:
+        std = self.indicators["log_std_1m"].std
+        return float(annualized_volatility_index(std)) if std is not None else None
+
+    def summary(self) -> dict:
+        return {
+            "daily_trend": self.daily_trend() if "15m" in self.last_close else None,
+            "weekly_trend": self.weekly_trend(),
+            "volatility_index": self.volatility_index(),
+            "rsi_15m": self.indicators["rsi_15m"].value,
+            "last_candle": {interval: ts for interval, (ts, _) in self.last_close.items()}
+        }
+
+    def get_state(self) -> dict:
+        return {
+            "indicators": dump_indicators(self.indicators),
+            "week_opens": list(self.week_opens),
+            "last_close": {interval: list(value) for interval, value in self.last_close.items()}
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "LiveSymbolIndicators":
+        live = cls(load_indicators(state["indicators"]))
+        live.week_opens.extend(state["week_opens"])
+        live.last_close = {interval: (int(ts), float(close)) for interval, (ts, close) in state["last_close"].items()}
+        return live
+
+
+class LiveIndicatorBook:
+    """
+    LiveSymbolIndicators of every symbol tracked by the candle rings, fed by their close events.
+    A symbol evicted from the rings is dropped: it would miss candles until tracked again.
+    """
+
+    def __init__(self) -> None:
+        self._symbols: Dict[str, LiveSymbolIndicators] = {}
+        self.updates = 0
+
+    def on_candle_close(self, symbol: str, interval: str, rows: np.ndarray) -> None:
+        live = self._symbols.setdefault(symbol, LiveSymbolIndicators())
+        for row in rows:
+            live.on_candle(interval, row)
+        self.updates += len(rows)
+
+    def on_track(self, symbol: str, tracked: bool) -> None:
+        """Candle ring registry listener"""
+        if not tracked:
+            self._symbols.pop(symbol, None)
+
+    def get(self, symbol: str) -> Optional[LiveSymbolIndicators]:
+        return self._symbols.get(symbol)
+
+    def summary(self, symbol: str) -> Optional[dict]:
+        live = self._symbols.get(symbol)
+        return live.summary() if live is not None else None
+
+    def symbols(self) -> list:
+        return list(self._symbols)
+
+    def get_state(self) -> dict:
+        return {symbol: live.get_state() for symbol, live in self._symbols.items()}
+
+    def load_state(self, state: dict) -> None:
+        # Symbols the rings already feed keep their live state
+        restored = {symbol: LiveSymbolIndicators.from_state(entry) for symbol, entry in state.items()}
+        self._symbols = {**restored, **self._symbols}
+
+
+live_indicators = LiveIndicatorBook()
+
 
 async def main_testing():
     chart_analysis = FundingRateChart("DOGUSDT")
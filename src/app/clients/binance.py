@@ -2,7 +2,20 @@ import asyncio
 import numpy as np
 import aiohttp, pytz
 from src.app.proxy import APIProxy
+from src.app.singleflight import coalesce
+from src.app.rate_control import outbound_limiters
+from src.app.market_data.candles import parse_candles, collect_chunks, empty_candles, prefetch, BINANCE_CANDLE_WIDTH, FUNDING_DTYPE
+from src.app.market_data.candle_store import candle_store
 from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
+
+# USDT-M futures went live in September 2019, nothing can be listed before that
+FUTURES_LAUNCH_MS = 1567296000000
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Listing times never change, so they are cached for the life of the process
+_listing_times: Dict[str, int] = {}
+
 
 class BinanceClient(APIProxy):
     def __init__(self):
@@ -29,20 +42,77 @@ class BinanceClient(APIProxy):
         }
         return mapping.get(interval, 60 * 60 * 1000)  # Default to 1h
 
-    async def get_candlestick_chart(
+    async def iter_candlestick_chart(
         self,
         symbol: str,
         interval: str,
         start_time: int = None,
         end_time: int = None,
-        limit: int = 1000
-    ) -> np.ndarray:
-        final_result = np.empty((0, 6))
+        limit: int = 1000,
+        prefetch_pages: int = 0
+    ) -> AsyncIterator[np.ndarray]:
+        """Yield klines page by page as float64 arrays [timestamp, open, high, low, close, volume], raises ValueError on an API error"""
+        async for chunk in prefetch(self._iter_klines(symbol, interval, start_time, end_time, limit), prefetch_pages):
+            yield chunk
+
+    async def _first_kline(self, session: aiohttp.ClientSession, params: dict) -> Optional[list]:
+        """One `limit=1` klines probe, returns the candle or None"""
+        url = f"{self.binance_url}/fapi/v1/klines"
+        async with outbound_limiters.slot(url) as ticket, session.get(url, params={**params, "limit": 1}) as response:
+            ticket.observe(response.status, response.headers)
+            if response.status != 200:
+                raise ValueError(f"Error probing klines for {params.get('symbol')}: {response.status}")
+            data = await response.json()
+        return data[0] if data else None
+
+    @coalesce
+    async def get_listing_time(self, symbol: str) -> Optional[int]:
+        """
+        Open time (ms) of the first daily candle of a symbol, None if it has no candles.
+        Exponential probing backwards from now brackets the listing day, then a binary search
+        on daily klines narrows it down: ~2*log2(days listed) tiny calls instead of paging from 1970.
+        """
+        if symbol in _listing_times:
+            return _listing_times[symbol]
+
+        now = int(datetime.utcnow().timestamp() * 1000)
+        async with aiohttp.ClientSession() as session:
+            async def listed_before(ts: int) -> bool:
+                return await self._first_kline(session, {"symbol": symbol, "interval": "1d", "endTime": ts}) is not None
+
+            if not await listed_before(now):
+                return None
+
+            # Exponential probing: find `lo` where the symbol wasn't listed yet
+            hi, step = now, DAY_MS
+            lo = max(FUTURES_LAUNCH_MS, now - step)
+            while lo > FUTURES_LAUNCH_MS and await listed_before(lo):
+                hi = lo
+                step *= 2
+                lo = max(FUTURES_LAUNCH_MS, now - step)
+
+            # Binary search down to one day between "not listed" and "listed"
+            while hi - lo > DAY_MS:
+                mid = (lo + hi) // 2
+                if await listed_before(mid):
+                    hi = mid
+                else:
+                    lo = mid
+
+            first = await self._first_kline(session, {"symbol": symbol, "interval": "1d", "startTime": lo})
+
+        listing_time = int(first[0]) if first else None
+        if listing_time is not None:
+            _listing_times[symbol] = listing_time
+        return listing_time
+
+    async def _iter_klines(self, symbol: str, interval: str, start_time: int, end_time: int, limit: int) -> AsyncIterator[np.ndarray]:
         url = f"{self.binance_url}/fapi/v1/klines"
         granularity_ms = self.convert_interval_to_ms(interval)
         
         if start_time is None:
-            start_time = 0
+            # Full history: start at the first real candle instead of 1970
+            start_time = await self.get_listing_time(symbol) or 0
         if end_time is None:
             end_time = int(datetime.utcnow().timestamp() * 1000)
         
@@ -55,37 +125,84 @@ class BinanceClient(APIProxy):
                     "endTime": end_time,
                     "limit": limit
                 }
-                async with session.get(url, params=params) as response:
+                async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                    ticket.observe(response.status, response.headers)
                     if response.status != 200:
-                        print(f"Error fetching candlestick data: {response.status}")
-                        break
+                        raise ValueError(f"Error fetching candlestick data: {response.status}")
                     data = await response.json()
-                    if not data:
-                        break
-                    np_data = np.array([
-                        [
-                            int(item[0]),
-                            float(item[1]),
-                            float(item[2]),
-                            float(item[3]),
-                            float(item[4]),
-                            float(item[5])
-                        ]
-                        for item in data
-                    ], dtype=object)
-                    final_result = np.vstack([final_result, np_data])
-                    last_timestamp = int(data[-1][0])
-                    if last_timestamp >= end_time:
-                        break
-                    start_time = last_timestamp + granularity_ms
-        return final_result
+                if not data:
+                    break
+                yield parse_candles(data, BINANCE_CANDLE_WIDTH)
+                last_timestamp = int(data[-1][0])
+                if last_timestamp >= end_time:
+                    break
+                start_time = last_timestamp + granularity_ms
+
+    @coalesce
+    async def get_candlestick_chart(
+        self,
+        symbol: str,
+        interval: str,
+        start_time: int = None,
+        end_time: int = None,
+        limit: int = 1000
+    ) -> np.ndarray:
+        if not candle_store.enabled or start_time is None or end_time is None:
+            chunks = self.iter_candlestick_chart(symbol, interval, start_time, end_time, limit)
+            try:
+                return await collect_chunks(chunks, BINANCE_CANDLE_WIDTH)
+            except ValueError as e:
+                print(e)
+                return empty_candles(BINANCE_CANDLE_WIDTH)
+
+        # Windows already downloaded are served from the local store, only the gaps hit the API
+        async def fetch_range(gap_start: int, gap_end: int) -> np.ndarray:
+            chunks = self.iter_candlestick_chart(symbol, interval, gap_start, gap_end, limit)
+            return await collect_chunks(chunks, BINANCE_CANDLE_WIDTH)
 
+        try:
+            return await candle_store.fetch(
+                "binance", symbol, interval, self.convert_interval_to_ms(interval), BINANCE_CANDLE_WIDTH,
+                start_time, end_time, fetch_range, listing_time=lambda: self.get_listing_time(symbol)
+            )
+        except ValueError as e:
+            print(e)
+            return empty_candles(BINANCE_CANDLE_WIDTH)
+
+    @coalesce
     async def get_historical_funding_rate(self, symbol, limit=20, fromId=None):
         url = f"{self.binance_url}/fapi/v1/fundingRate"
         params = {"symbol": symbol, "limit": limit}
         if fromId is not None:
             params["fromId"] = fromId
-        return await self.curl_api(url, method='GET', body=params)
+        return await self.curl_api(url, method='GET', body=params, hedge=True)
+
+    async def iter_historical_funding_rate(self, symbol: str, start_time: int, end_time: int, limit: int = 1000) -> AsyncIterator[np.ndarray]:
+        """
+        Yield the funding settlements in [start_time, end_time] page by page (oldest first) as
+        FUNDING_DTYPE arrays: funding_rate (percent) and funding_time (ms). Raises ValueError on an API error.
+        """
+        url = f"{self.binance_url}/fapi/v1/fundingRate"
+
+        async with aiohttp.ClientSession() as session:
+            while start_time <= end_time:
+                params = {"symbol": symbol, "startTime": start_time, "endTime": end_time, "limit": limit}
+                async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                    ticket.observe(response.status, response.headers)
+                    if response.status != 200:
+                        raise ValueError(f"Error fetching Binance funding history: {response.status}")
+                    data = await response.json()
+                if not data:
+                    break
+
+                chunk = np.empty(len(data), dtype=FUNDING_DTYPE)
+                chunk['funding_rate'] = [float(entry["fundingRate"]) * 100 for entry in data]
+                chunk['funding_time'] = [int(entry["fundingTime"]) for entry in data]
+                yield chunk
+
+                if len(data) < limit:
+                    break
+                start_time = int(chunk['funding_time'][-1]) + 1
 
     async def get_last_contract_funding_rate(self, symbol):
         """Get the last funding rate in a readable format."""
@@ -100,6 +217,7 @@ class BinanceClient(APIProxy):
         return None
 
 
+    @coalesce
     async def get_all_future_tickers(self) -> np.ndarray:
         url = self.binance_url + "/fapi/v1/ticker/price"
         data = await self.curl_api(url, method='GET')
@@ -107,6 +225,7 @@ class BinanceClient(APIProxy):
             return np.array([ticker.get('symbol') for ticker in data])
         return np.array([])
 
+    @coalesce
     async def get_ticker(self, symbol):
         url = self.binance_url + "/fapi/v1/ticker/24hr"
         params = {"symbol": symbol}
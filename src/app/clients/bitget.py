@@ -3,15 +3,19 @@ import time, pytz
 import numpy as np
 import aiohttp
 from datetime import datetime, timedelta
-from typing import Literal
+from typing import AsyncIterator, Literal
 
 from src.app.proxy import APIProxy
+from src.app.singleflight import coalesce
+from src.app.rate_control import outbound_limiters
+from src.app.market_data.candles import parse_candles, collect_chunks, prefetch, BITGET_CANDLE_WIDTH
 
 class BitgetClient(APIProxy):
     def __init__(self):
         super().__init__()
         self.bitget_url = "https://api.bitget.com"
 
+    @coalesce
     async def get_historical_funding_rate(self, symbol, limit=20, offset=0):
         """Get historical funding rate from a given symbol"""
         url = self.bitget_url +  "/api/v2/mix/market/history-fund-rate"
@@ -21,24 +25,30 @@ class BitgetClient(APIProxy):
             "pageSize": limit,
             "pageNo": offset + 1
         }
-        data = await self.curl_api(url, method='GET', body=params)
+        data = await self.curl_api(url, method='GET', body=params, hedge=True)
         return data
 
     async def get_last_contract_funding_rate(self, symbol):
         """Get the last contract funding rate"""
         data = await self.get_historical_funding_rate(symbol)
-        return data.get('data', None)[0]['fundingRate']
+        if self.is_error(data) or not isinstance(data, dict) or not data.get('data'):
+            return None
+        return data['data'][0]['fundingRate']
         
+    @coalesce
     async def get_tiker(self, symbol):
         url = self.bitget_url + "/api/v2/mix/market/ticker"
         params = {
             "symbol": symbol,
             "productType": "USDT-FUTURES"
         }
-        data = await self.curl_api(url, method='GET', body=params)
-        return data.get('data', None)[0] if data else None
+        data = await self.curl_api(url, method='GET', body=params, hedge=True)
+        if self.is_error(data) or not isinstance(data, dict) or not data.get('data'):
+            return None
+        return data['data'][0]
 
     
+    @coalesce
     async def get_all_future_tikers(self) -> np.ndarray:
         """Get all the available symbols in the futures market"""
         url = self.bitget_url  + "/api/v2/mix/market/tickers"
@@ -47,7 +57,9 @@ class BitgetClient(APIProxy):
         }
         data = await self.curl_api(url, method='GET', body=params)
         # print(data)  # Optional: Remove or comment out in production
-        future_tikers = data.get("data", [])
+        if self.is_error(data) or not isinstance(data, dict):
+            return np.array([])
+        future_tikers = data.get("data") or []
 
         return np.array([tiker.get('symbol') for tiker in future_tikers])
 
@@ -63,16 +75,22 @@ class BitgetClient(APIProxy):
             api_calls.append({'start_time': call_start, 'end_time': call_end})
         return api_calls
 
-    async def get_candlestick_data(
+    async def iter_candlestick_data(
         self,
-        symbol: str = "BTCUSDT_UMCBL",  # Example symbol
+        symbol: str = "BTCUSDT_UMCBL",
         granularity: Literal['1m', '3m', '5m', '15m', '30m', '1H', '4H', '6H', '12H', '1D', '3D', '1W', '1M'] = '1H',
         product_type: str = "umcbl",
         start_time: int = None,
         end_time: int = None,
-        page_size: int = 1000
-    ) -> np.ndarray:
-        final_result = np.empty((0, 7))
+        page_size: int = 1000,
+        prefetch_pages: int = 0
+    ) -> AsyncIterator[np.ndarray]:
+        """Yield candles page by page as float64 arrays [timestamp, open, high, low, close, volume, notional]"""
+        pages = self._iter_candles(symbol, granularity, product_type, start_time, end_time, page_size)
+        async for chunk in prefetch(pages, prefetch_pages):
+            yield chunk
+
+    async def _iter_candles(self, symbol, granularity, product_type, start_time, end_time, page_size) -> AsyncIterator[np.ndarray]:
         base_url = self.bitget_url + "/api/mix/v1/market/candles"
         granularity_ms = self.convert_granularity_to_ms(granularity)
 
@@ -95,7 +113,8 @@ class BitgetClient(APIProxy):
                     "pageSize": str(page_size)
                 }
 
-                async with session.get(base_url, params=params) as response:
+                async with outbound_limiters.slot(base_url) as ticket, session.get(base_url, params=params) as response:
+                    ticket.observe(response.status, response.headers)
                     if response.status != 200:
                         print(f"Error fetching candlestick data: {response.status}")
                         error_text = await response.text()
@@ -104,30 +123,29 @@ class BitgetClient(APIProxy):
 
                     data = await response.json()
 
-                    if not data:
-                        print(f"No data returned in attempt {i}")
-                        break
+                if not data:
+                    print(f"No data returned in attempt {i}")
+                    break
 
-                    # Data format: [timestamp, open, high, low, close, volume, quoteVolume]
-                    np_data = np.array([
-                        [
-                                    int(item[0]),    # The timestamp in milliseconds
-                                    float(item[1]),  # Open price
-                                    float(item[2]),  # High price
-                                    float(item[3]),  # Low price
-                                    float(item[4]),  # Close price
-                                    float(item[5]),  # Volume (traded amount in the base currency)
-                                    float(item[6])   # Notional value (the total traded value in quote currency)
-                        ]
-                        for item in data
-                    ], dtype=object)
-
-                    final_result = np.vstack([final_result, np_data])
-                    last_timestamp = int(data[-1][0])
-                    if last_timestamp >= end_time:
-                        break
+                # Data format: [timestamp, open, high, low, close, volume, quoteVolume]
+                yield parse_candles(data, BITGET_CANDLE_WIDTH)
+
+                last_timestamp = int(data[-1][0])
+                if last_timestamp >= end_time:
+                    break
 
-        return final_result
+    @coalesce
+    async def get_candlestick_data(
+        self,
+        symbol: str = "BTCUSDT_UMCBL",  # Example symbol
+        granularity: Literal['1m', '3m', '5m', '15m', '30m', '1H', '4H', '6H', '12H', '1D', '3D', '1W', '1M'] = '1H',
+        product_type: str = "umcbl",
+        start_time: int = None,
+        end_time: int = None,
+        page_size: int = 1000
+    ) -> np.ndarray:
+        chunks = self.iter_candlestick_data(symbol, granularity, product_type, start_time, end_time, page_size)
+        return await collect_chunks(chunks, BITGET_CANDLE_WIDTH)
     
     async def close_client(self):
         await super().close_client()
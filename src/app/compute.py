@@ -0,0 +1,229 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+from src.app.resilience import LatencyTracker
+
+"""
+Executor layer for CPU-bound analysis.
+
+Kernels (pure functions of NumPy arrays, see src.app.analysis_kernels) run in a process pool so
+pandas / NumPy work never blocks the event loop. Array arguments cross the process boundary as
+shared memory (large arrays) or as a raw bytes buffer with dtype and shape (small arrays), never
+as pickled DataFrames. When processes are unavailable the layer falls back to a thread pool.
+"""
+
+COMPUTE_EXECUTOR = os.getenv("COMPUTE_EXECUTOR", "process")  # process | thread | inline
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", str(min(4, os.cpu_count() or 1))))
+SHM_THRESHOLD_BYTES = int(os.getenv("COMPUTE_SHM_THRESHOLD_BYTES", str(256 * 1024)))
+
+
+class ArrayBuffer:
+    """Small array sent as its raw bytes"""
+
+    __slots__ = ("data", "dtype", "shape")
+
+    def __init__(self, array: np.ndarray) -> None:
+        array = np.ascontiguousarray(array)
+        self.data = array.tobytes()
+        self.dtype = array.dtype.str
+        self.shape = array.shape
+
+    def __getstate__(self):
+        return self.data, self.dtype, self.shape
+
+    def __setstate__(self, state):
+        self.data, self.dtype, self.shape = state
+
+    def open(self) -> np.ndarray:
+        return np.frombuffer(self.data, dtype=self.dtype).reshape(self.shape)
+
+    def close(self) -> None:
+        pass
+
+
+class SharedArray:
+    """Large array copied once into a shared memory block, workers map it without copying"""
+
+    __slots__ = ("name", "dtype", "shape", "_shm")
+
+    def __init__(self, array: np.ndarray) -> None:
+        array = np.ascontiguousarray(array)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)[...] = array
+        self.name = self._shm.name
+        self.dtype = array.dtype.str
+        self.shape = array.shape
+
+    def __getstate__(self):
+        return self.name, self.dtype, self.shape
+
+    def __setstate__(self, state):
+        self.name, self.dtype, self.shape = state
+        self._shm = None
+
+    def open(self) -> np.ndarray:
+        try:
+            # The creating process owns the block, workers must not track (and unlink) it
+            self._shm = shared_memory.SharedMemory(name=self.name, track=False)
+        except TypeError:  # Python < 3.13
+            self._shm = shared_memory.SharedMemory(name=self.name)
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def close(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+
+    def release(self) -> None:
+        """Creator side, once the task is done"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    """Worker entry point: map the array references, run the kernel, drop the mappings"""
+    refs = [arg for arg in list(args) + list(kwargs.values()) if isinstance(arg, (ArrayBuffer, SharedArray))]
+    try:
+        args = tuple(arg.open() if isinstance(arg, (ArrayBuffer, SharedArray)) else arg for arg in args)
+        kwargs = {key: value.open() if isinstance(value, (ArrayBuffer, SharedArray)) else value for key, value in kwargs.items()}
+        result = fn(*args, **kwargs)
+        # Results must not keep views on shared memory that is about to be unmapped
+        return result.copy() if isinstance(result, np.ndarray) else result
+    finally:
+        del args, kwargs
+        for ref in refs:
+            ref.close()
+
+
+class ComputeExecutor:
+    def __init__(self, mode: str = COMPUTE_EXECUTOR, workers: int = COMPUTE_WORKERS, shm_threshold: int = SHM_THRESHOLD_BYTES) -> None:
+        self.requested_mode = mode
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.shm_threshold = shm_threshold
+        self._executor: Optional[Executor] = None
+
+        self.latency = LatencyTracker(window=500, min_samples=1)
+        self._pending = 0
+        self._max_queued = 0
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "shared_memory_bytes": 0, "buffer_bytes": 0, "fallbacks": 0}
+
+    def _create(self) -> Optional[Executor]:
+        if self.mode == "process":
+            try:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+            except (OSError, ValueError, NotImplementedError) as e:
+                print(f"Process pool unavailable ({e}), falling back to threads")
+                self._fallback()
+        if self.mode == "thread":
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compute")
+        return None
+
+    def _fallback(self) -> None:
+        self._counters["fallbacks"] += 1
+        self.mode = "thread"
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self._executor is None and self.mode != "inline":
+            self._executor = self._create()
+        return self._executor
+
+    def _wrap(self, value: Any, refs: List[SharedArray]) -> Any:
+        if not isinstance(value, np.ndarray) or self.mode != "process":
+            return value
+        if value.nbytes >= self.shm_threshold:
+            ref = SharedArray(value)
+            refs.append(ref)
+            self._counters["shared_memory_bytes"] += value.nbytes
+            return ref
+        self._counters["buffer_bytes"] += value.nbytes
+        return ArrayBuffer(value)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a module-level kernel off the event loop, ndarray arguments are passed efficiently"""
+        executor = self.executor
+        if executor is None:
+            return fn(*args, **kwargs)
+
+        self._counters["submitted"] += 1
+        self._pending += 1
+        self._max_queued = max(self._max_queued, self.queued)
+        started = time.perf_counter()
+        refs: List[SharedArray] = []
+        try:
+            wrapped_args = tuple(self._wrap(arg, refs) for arg in args)
+            wrapped_kwargs = {key: self._wrap(value, refs) for key, value in kwargs.items()}
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(executor, _invoke, fn, wrapped_args, wrapped_kwargs)
+            except BrokenProcessPool:
+                # A crashed worker poisons the pool: switch to threads and retry once
+                if self._executor is executor:  # concurrent failures fall back once
+                    print("Compute process pool broken, falling back to threads")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = None
+                    self._fallback()
+                result = await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+            self._counters["completed"] += 1
+            return result
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+            self.latency.record(time.perf_counter() - started)
+            for ref in refs:
+                ref.release()
+
+    @property
+    def queued(self) -> int:
+        """Tasks waiting for a free worker"""
+        return max(0, self._pending - self.workers)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def snapshot(self) -> dict:
+        p50, p95 = self.latency.percentile(50), self.latency.percentile(95)
+        return {
+            "mode": self.mode,
+            "requested_mode": self.requested_mode,
+            "workers": self.workers,
+            "in_flight": self._pending,
+            "queued": self.queued,
+            "max_queued": self._max_queued,
+            "latency_p50": round(p50, 4) if p50 is not None else None,
+            "latency_p95": round(p95, 4) if p95 is not None else None,
+            **self._counters
+        }
+
+
+compute_executor = ComputeExecutor()
+
+
+async def main_testing():
+    from src.app.analysis_kernels import volatility_index, daily_trend
+
+    executor = ComputeExecutor(mode="process", workers=2, shm_threshold=1024)
+    candles = np.column_stack([np.arange(500) * 60000.0] + [100 + np.random.rand(500) for _ in range(6)])
+    results = await asyncio.gather(*[executor.run(volatility_index, candles) for _ in range(8)], executor.run(daily_trend, candles[:96]))
+    print("results ->", results)
+    print("metrics ->", executor.snapshot())
+    executor.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
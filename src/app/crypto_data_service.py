@@ -5,8 +5,7 @@ import aiohttp
 import pytz
 from datetime import datetime, timezone, timedelta
 from zoneinfo import ZoneInfo
-from typing import Literal
-import re
+from typing import AsyncIterator, Literal
 
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
@@ -14,6 +13,12 @@ from fastapi.encoders import jsonable_encoder
 # from web3 import AsyncHTTPProvider
 
 from src.config import AVARIABLE_EXCHANGES, COINMARKETCAP_APIKEY, WEB3_APIKEY
+from src.app.funding_rate.interval_cache import funding_interval_cache
+from src.app.singleflight import coalesce
+from src.app.rate_control import outbound_limiters
+from src.app.market_data.candles import parse_candles, collect_chunks, empty_candles, prefetch, BITGET_CANDLE_WIDTH, FUNDING_DTYPE
+from src.app.market_data.candle_store import candle_store
+from src.app.market_data.funding_stream import funding_table
 from fastapi import HTTPException
 
 class Granularity:
@@ -43,49 +48,71 @@ class CryptoDataService:
         # else:
             # raise Exception("Failed to connect to Ethereum")
         
+    async def iter_historical_funding_rate(self, symbol: str, pages: int = 5, page_size: int = 100, prefetch_pages: int = 0) -> AsyncIterator[np.ndarray]:
+        """
+        Yield the Bitget funding history page by page (newest first) as FUNDING_DTYPE arrays:
+        funding_rate (percent) and funding_time (ms). Raises ValueError on an API error.
+        """
+        async for chunk in prefetch(self._iter_funding_pages(symbol, pages, page_size), prefetch_pages):
+            yield chunk
+
+    async def _iter_funding_pages(self, symbol: str, pages: int, page_size: int) -> AsyncIterator[np.ndarray]:
+        url = "https://api.bitget.com/api/v2/mix/market/history-fund-rate"
+
+        async with aiohttp.ClientSession() as session:
+            for page_number in range(1, pages + 1):
+                params = {"symbol": symbol, "productType": "USDT-FUTURES", "pageSize": page_size, "pageNo": page_number}
+
+                async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                    ticket.observe(response.status, response.headers)
+                    if response.status != 200:
+                        raise ValueError(f"Error fetching funding rate data: {response.status}")
+                    result = await response.json()
+
+                data = result.get("data", [])
+                if not data:
+                    break
+
+                chunk = np.empty(len(data), dtype=FUNDING_DTYPE)
+                chunk['funding_rate'] = [float(fr["fundingRate"]) * 100 for fr in data]
+                chunk['funding_time'] = [int(fr["fundingTime"]) for fr in data]
+                yield chunk
+
+    @coalesce
     async def get_historical_funding_rate(self, symbol: str,):
         """
         Return: [[funding_rate, datetime_period, period]] 
         Limit: 500
         """
-        final_result = np.empty((0, 3))  
-
-        for page_number in range(1, 5 + 1): 
-            url = f"https://api.bitget.com/api/v2/mix/market/history-fund-rate?pageSize=100&pageNo={page_number}"
-            params = {"symbol": symbol, "productType": "USDT-FUTURES"}
-
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        data = result.get("data", [])
-
-                        if data:
-                            page_data = [
-                                (
-                                    float(fr["fundingRate"]) * 100,  
-                                    datetime.fromtimestamp(int(fr["fundingTime"]) / 1000, timezone.utc)  
-                                    .astimezone(ZoneInfo('Europe/Amsterdam'))
-                                    .isoformat(),
-                                    float(fr["fundingTime"]),  
-                                )
-                                for fr in data
-                            ]
-
-                            np_page_data = np.array(page_data, dtype=object)  
-                            final_result = np.vstack([final_result, np_page_data])
-                    else:
-                        print(f"Error fetching funding rate data: {response.status}")
-                        return np.array([])  
+        try:
+            history = await collect_chunks(self.iter_historical_funding_rate(symbol), dtype=FUNDING_DTYPE)
+        except ValueError as e:
+            print(e)
+            return np.array([])
+
+        final_result = np.empty((len(history), 3), dtype=object)
+        final_result[:, 0] = history['funding_rate']
+        final_result[:, 1] = [
+            datetime.fromtimestamp(int(ts) / 1000, timezone.utc).astimezone(ZoneInfo('Europe/Amsterdam')).isoformat()
+            for ts in history['funding_time']
+        ]
+        final_result[:, 2] = history['funding_time'].astype(float)
 
         return final_result
 
+    @coalesce
     async def get_current_funding_rate(self, symbol):
+        # Streamed value first, REST only when the Bitget feed has nothing recent
+        streamed = funding_table.get("bitget", symbol, max_age=60)
+        if streamed and streamed["funding_rate"] is not None:
+            return round(streamed["funding_rate"] * 100, 4)
+
         url = "https://api.bitget.com/api/v2/mix/market/current-fund-rate"
         params = {"symbol": symbol, "productType": "USDT-FUTURES"}
 
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
+            async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                ticket.observe(response.status, response.headers)
                 if response.status == 200:
                     result = await response.json()
                     funding_rate = float(result['data'][0]['fundingRate']) * 100
@@ -94,12 +121,14 @@ class CryptoDataService:
                     text_response = await response.text()
                     raise TypeError(f"An error ocurref with the the API response: {text_response}")
 
+    @coalesce
     async def get_last_contract_funding_rate(self, symbol, ans = False):
         url = "https://api.bitget.com/api/v2/mix/market/history-fund-rate"
         params = {"symbol": symbol, "productType": "USDT-FUTURES"}
 
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
+            async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                ticket.observe(response.status, response.headers)
                 if response.status == 200:
                     result = await response.json()
                     funding_rate = float(result['data'][0 if not ans else 1]['fundingRate']) * 100
@@ -111,6 +140,7 @@ class CryptoDataService:
                 
     async def get_candlestick_chart_v2(self, symbol):   pass
 
+    @coalesce
     async def get_funding_rate_period(self, symbol):
         """Get funding rate period, either 8h or 4h"""
         # STEP 1, get sample data
@@ -118,7 +148,8 @@ class CryptoDataService:
         params = {"symbol": symbol, "productType": "USDT-FUTURES"}
 
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
+            async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                ticket.observe(response.status, response.headers)
                 if response.status == 200:
                     result = await response.json()
                     data = result.get("data", [])
@@ -152,7 +183,8 @@ class CryptoDataService:
             "productType": "USDT-FUTURES"
         }
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params) as response:
+            async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                ticket.observe(response.status, response.headers)
                 if response.status == 200:
                     result = await response.json()
                     cryptos = result.get('data')
@@ -217,67 +249,83 @@ class CryptoDataService:
         else:
             raise ValueError(f"Unsupported granularity: {granularity}")          
 
+    async def iter_candlestick_chart(
+        self, symbol: str, granularity: str, start_time: int = None, end_time: int = None, prefetch_pages: int = 0
+    ) -> AsyncIterator[np.ndarray]:
+        """
+        Yield Bitget candles page by page as float64 arrays [timestamp, open, high, low, close, volume, notional].
+        Raises ValueError on an API error.
+        """
+        pages = self._iter_candle_pages(symbol, granularity, start_time, end_time)
+        async for chunk in prefetch(pages, prefetch_pages):
+            yield chunk
+
+    async def _iter_candle_pages(self, symbol: str, granularity: str, start_time: int = None, end_time: int = None) -> AsyncIterator[np.ndarray]:
+        base_url = 'https://api.bitget.com/api/v2/mix/market/candles'
+        params = {
+            'symbol': symbol,
+            'granularity': granularity,
+            'productType': 'USDT-FUTURES',
+            'limit': 1000
+        }
+
+        # Get how many times do I need to call the API
+        granularity_ms = self.convert_granularity_to_ms(granularity)
+        api_calls = self.calculate_api_calls(start_time, end_time, granularity_ms)
+
+        async with aiohttp.ClientSession() as session:
+            for call in api_calls:
+                if start_time:
+                    params['startTime'] = str(call['start_time'])
+                if end_time:
+                    params['endTime'] = str(call['end_time'])
+
+                async with outbound_limiters.slot(base_url) as ticket, session.get(base_url, params=params) as response:
+                    ticket.observe(response.status, response.headers)
+                    if response.status != 200:
+                        raise ValueError(f"Error fetching candlestick data: {response.status}")
+                    result = await response.json()
+
+                # A window without candles (not listed yet, trading halt) doesn't end the range
+                data = result.get("data", [])
+                if not data:
+                    continue
+
+                yield parse_candles(data, BITGET_CANDLE_WIDTH)
+
+                last_timestamp = int(data[-1][0])
+
+                # If the last fetched timestamp reaches or exceeds the requested end_time, stop fetching data
+                if end_time and last_timestamp >= end_time:
+                    break
+
+                # Update startTime to last_timestamp + 1 to continue fetching the next 1000 candles
+                params['startTime'] = str(last_timestamp + 1)
+
+    @coalesce
     async def get_candlestick_chart(self, symbol: str, granularity: str, start_time: int = None, end_time: int = None) -> np.ndarray:
-            final_result = np.empty((0, 7))
-            base_url = 'https://api.bitget.com/api/v2/mix/market/candles'
-            params = {
-                'symbol': symbol,
-                'granularity': granularity,
-                'productType': 'USDT-FUTURES',
-                'limit': 1000
-            }
+        if not candle_store.enabled or start_time is None or end_time is None:
+            chunks = self.iter_candlestick_chart(symbol, granularity, start_time, end_time)
+            try:
+                return await collect_chunks(chunks, BITGET_CANDLE_WIDTH)
+            except ValueError as e:
+                print(e)
+                return empty_candles(BITGET_CANDLE_WIDTH)
 
-            # Get how many times do I need to call the API
-            granularity_ms = self.convert_granularity_to_ms(granularity)
-            api_calls = self.calculate_api_calls(start_time, end_time, granularity_ms)
-            # total_candles = (end_time - start_time) // granularity_ms
-       
-            
-            async with aiohttp.ClientSession() as session:
-                for i, call in enumerate(api_calls):
-                    if start_time:
-                        params['startTime'] = str(call['start_time'])
-                    if end_time:
-                        params['endTime'] = str(call['end_time'])
-
-                    async with session.get(base_url, params=params) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            data = result.get("data", [])
-
-                            if not data:
-                                print(f"there wasn't data in attempt {i}")
-                                break
-
-                            np_data = np.array([
-                                [
-                                    int(item[0]),    # The timestamp in milliseconds
-                                    float(item[1]),  # Open price
-                                    float(item[2]),  # High price
-                                    float(item[3]),  # Low price
-                                    float(item[4]),  # Close price
-                                    float(item[5]),  # Volume (traded amount in the base currency)
-                                    float(item[6])   # Notional value (the total traded value in quote currency)
-                                ]
-                                for item in data
-                            ], dtype=object)
-
-                            final_result = np.vstack([final_result, np_data])
-
-                            last_timestamp = int(data[-1][0])
-
-                            # If the last fetched timestamp reaches or exceeds the requested end_time, stop fetching data
-                            if end_time and last_timestamp >= end_time:
-                                break
-
-                            # Update startTime to last_timestamp + 1 to continue fetching the next 1000 candles
-                            params['startTime'] = str(last_timestamp + 1)
-
-                        else:
-                            print(f"Error fetching candlestick data: {response.status}")
-                            break
-
-            return final_result
+        # Windows already downloaded are served from the local store, only the gaps hit the API
+        granularity_ms = self.convert_granularity_to_ms(granularity)
+
+        async def fetch_range(gap_start: int, gap_end: int) -> np.ndarray:
+            chunks = self.iter_candlestick_chart(symbol, granularity, gap_start, gap_end + granularity_ms)
+            return await collect_chunks(chunks, BITGET_CANDLE_WIDTH)
+
+        try:
+            return await candle_store.fetch(
+                "bitget", symbol, granularity, granularity_ms, BITGET_CANDLE_WIDTH, start_time, end_time, fetch_range
+            )
+        except ValueError as e:
+            print(e)
+            return empty_candles(BITGET_CANDLE_WIDTH)
             
     async def get_price_of_period(self, symbol: str, period: int):
         """Get what was the price from a given symbol (in Opening time)"""
@@ -291,6 +339,7 @@ class CryptoDataService:
             timestamp = datetime.fromtimestamp(int(period) / 1000, pytz.timezone('Europe/Amsterdam'))
             raise ValueError(f"Period {timestamp} doesn't exist")
 
+    @coalesce
     async def get_all_symbols(self, exchange: str) -> np.ndarray:
         """Get all cryptos in futures from a given exchange"""
         if exchange not in AVARIABLE_EXCHANGES:
@@ -300,7 +349,8 @@ class CryptoDataService:
             url = self.bitget_url + '/api/v2/mix/market/tickers'
 
             async with aiohttp.ClientSession() as session:
-                async with session.get(url, params={'productType': 'USDT-FUTURES'}) as response:
+                async with outbound_limiters.slot(url) as ticket, session.get(url, params={'productType': 'USDT-FUTURES'}) as response:
+                    ticket.observe(response.status, response.headers)
                     if response.status == 200:
                         result = await response.json()
                         cryptos = result.get('data')
@@ -316,7 +366,8 @@ class CryptoDataService:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
             async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.get(url) as response:
+                async with outbound_limiters.slot(url) as ticket, session.get(url) as response:
+                    ticket.observe(response.status, response.headers)
                     if response.status == 200:
                         data = await response.json()
                         # Extract all symbols
@@ -363,33 +414,13 @@ class CryptoDataService:
                     print("An error ocurred -> ,", text_response)
 
 
-    async def get_funding_rate_interval(self, symbol: str) -> int:
-        """Determine funding rate interval (4h or 8h) from Bitget."""
+    async def get_funding_rate_interval(self, symbol: str) -> str:
+        """Determine funding rate interval (hours) from Bitget, falling back to Binance fundingInfo."""
+        return await funding_interval_cache.get_interval(symbol)
 
-        # BITGET ATTEMPT
-        
-        url = f"{self.bitget_url}/api/v2/mix/market/history-fund-rate?symbol={symbol}&productType=usdt-futures"
-        async with aiohttp.ClientSession() as session:
-            async with  session.get(url) as response:
-                data = await response.json()
-                if data.get("code") == "00000" and "data" in data:
-                    times = [int(entry["fundingTime"]) for entry in data["data"]]
-                    if len(times) > 1:
-                        interval_ms = abs(times[0] - times[1])
-                        return f"{int(interval_ms / 3600000)}" 
-        
-        
-        # BINANCE ATTEMPT
-        binance_url = f"{self.binance_url}/fapi/v1/fundingInfo"
-        symbol = re.sub(r"(USDT|USD)$", "", symbol, flags=re.IGNORECASE)
-        symbol_pattern = re.compile(re.escape(symbol), re.IGNORECASE)
-        async with aiohttp.ClientSession() as session:
-            response = await session.get(binance_url)
-            data = await response.json()
-            for entry in data:
-                if symbol_pattern.search(entry.get("symbol", "")):
-                    return int(entry['fundingIntervalHours'])
-        return None
+    async def get_funding_rate_intervals(self, symbols: list) -> dict:
+        """Bulk version of get_funding_rate_interval, returns {symbol: interval}"""
+        return await funding_interval_cache.get_intervals(symbols)
     
     async def get_general_exchange_metadata(self, symbol):
         funding_rate = await self.get_funding_rate_interval(symbol=symbol)
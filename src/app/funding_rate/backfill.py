@@ -0,0 +1,276 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.app.chart_analysis import FundingRateChart
+from src.app.crypto_data_service import CryptoDataService
+from src.app.mongo.controller import MongoDB_Crypto
+
+"""
+Historical backfill of funding-event analysis for the whole universe.
+
+For each symbol: the funding history is downloaded once, the key moments (funding rate at or
+below KEY_MOMENT_THRESHOLD) are planned as analysis jobs, and the candle windows all their
+set_analysis calls need (FundingRateChart.CANDLE_WINDOWS) are merged per granularity into as few
+downloads as possible. The analyses then read slices of those downloads instead of ~8 requests
+each. Symbols run with bounded parallelism, results are upserted to Mongo in bulk, and a JSON
+checkpoint records finished symbols so an interrupted backfill resumes where it stopped.
+"""
+
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "4"))  # symbols in flight
+BACKFILL_ANALYSIS_CONCURRENCY = int(os.getenv("BACKFILL_ANALYSIS_CONCURRENCY", "8"))  # set_analysis calls in flight per symbol
+BACKFILL_WRITE_BATCH = int(os.getenv("BACKFILL_WRITE_BATCH", "500"))
+BACKFILL_CHECKPOINT = os.getenv("BACKFILL_CHECKPOINT", os.path.join(os.path.expanduser("~"), ".arbitrage_bot", "backfill_checkpoint.json"))
+
+KEY_MOMENT_THRESHOLD = -0.5  # funding rate in percent
+CANDLE_PAGE_SIZE = 1000  # Bitget candles per request
+
+
+def candle_pages(start: int, end: int, step_ms: int, page_size: int = CANDLE_PAGE_SIZE) -> int:
+    """Requests a [start, end] candle download takes"""
+    return -(-((end - start) // step_ms + 1) // page_size)
+
+
+def merge_windows(windows: Iterable[Tuple[int, int]], step_ms: int, page_size: int = CANDLE_PAGE_SIZE) -> List[Tuple[int, int]]:
+    """
+    Union of [start, end] windows of `step_ms` candles. Neighbours are joined only when the joined
+    download takes no more pages than both apart (overlapping windows always are).
+    """
+    merged: List[List[int]] = []
+    for start, end in sorted(windows):
+        if merged:
+            last_start, last_end = merged[-1]
+            joined_end = max(last_end, end)
+            apart = candle_pages(last_start, last_end, step_ms, page_size) + candle_pages(start, end, step_ms, page_size)
+            if candle_pages(last_start, joined_end, step_ms, page_size) <= apart:
+                merged[-1][1] = joined_end
+                continue
+        merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def plan_windows(periods: Iterable[int], granularity_ms: Callable[[str], int]) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Candle downloads covering the analysis of every period, per granularity. Close windows share
+    one download when that costs no extra request (see merge_windows).
+    """
+    windows: Dict[str, List[Tuple[int, int]]] = {}
+    for period in periods:
+        for granularity, start_offset, end_offset in FundingRateChart.CANDLE_WINDOWS:
+            windows.setdefault(granularity, []).append((period + start_offset, period + end_offset))
+    return {
+        granularity: merge_windows(ranges, granularity_ms(granularity))
+        for granularity, ranges in windows.items()
+    }
+
+
+class PrefetchedCandleSource:
+    """get_candlestick_chart served from windows downloaded ahead, anything else goes upstream"""
+
+    def __init__(self, upstream) -> None:
+        self.upstream = upstream
+        self._windows: Dict[Tuple[str, str], List[Tuple[int, int, np.ndarray]]] = {}
+        self.counters = {"downloads": 0, "download_errors": 0, "hits": 0, "misses": 0}
+
+    async def prefetch(self, symbol: str, plan: Dict[str, List[Tuple[int, int]]]) -> None:
+        async def download(granularity: str, start: int, end: int) -> None:
+            try:
+                data = await self.upstream.get_candlestick_chart(symbol, granularity, start_time=start, end_time=end)
+            except Exception as e:
+                # The analyses of this window fall back to their own requests
+                self.counters["download_errors"] += 1
+                print(f"Error prefetching {symbol} {granularity} candles: {e}")
+                return
+            self.counters["downloads"] += 1
+            self._windows.setdefault((symbol, granularity), []).append((start, end, data))
+
+        await asyncio.gather(*[download(granularity, start, end) for granularity, ranges in plan.items() for start, end in ranges])
+
+    def release(self, symbol: str) -> None:
+        for key in [key for key in self._windows if key[0] == symbol]:
+            del self._windows[key]
+
+    async def get_candlestick_chart(self, symbol: str, granularity: str, start_time: int = None, end_time: int = None) -> np.ndarray:
+        if start_time is not None and end_time is not None:
+            for start, end, data in self._windows.get((symbol, granularity), ()):
+                if start <= start_time and end_time <= end:
+                    self.counters["hits"] += 1
+                    timestamps = data[:, 0]
+                    return data[(timestamps >= start_time) & (timestamps <= end_time)]
+
+        self.counters["misses"] += 1
+        return await self.upstream.get_candlestick_chart(symbol, granularity, start_time=start_time, end_time=end_time)
+
+
+class FundingBackfill:
+
+    def __init__(self, data_service: Optional[CryptoDataService] = None, storage: Optional[MongoDB_Crypto] = None,
+                 concurrency: int = BACKFILL_CONCURRENCY, analysis_concurrency: int = BACKFILL_ANALYSIS_CONCURRENCY,
+                 write_batch: int = BACKFILL_WRITE_BATCH, checkpoint_path: Optional[str] = BACKFILL_CHECKPOINT,
+                 threshold: float = KEY_MOMENT_THRESHOLD) -> None:
+        self.data_service = data_service or CryptoDataService()
+        self.storage = storage if storage is not None else MongoDB_Crypto()
+        self.concurrency = concurrency
+        self.analysis_concurrency = analysis_concurrency
+        self.write_batch = write_batch
+        self.checkpoint_path = checkpoint_path
+        self.threshold = threshold
+
+        self.checkpoint = self._load_checkpoint()
+        self._buffer: List[dict] = []
+        self._staged: Dict[str, dict] = {}  # symbol -> checkpoint entry, committed once its documents are written
+        self._write_lock = asyncio.Lock()
+        self._counters = {
+            "symbols_done": 0, "symbols_failed": 0, "symbols_skipped": 0, "jobs": 0, "analyses": 0,
+            "analysis_errors": 0, "written": 0, "candle_downloads": 0, "candle_hits": 0, "candle_misses": 0
+        }
+
+    # ------------------- CHECKPOINT -------------------
+
+    def _load_checkpoint(self) -> dict:
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path) as file:
+                    return json.load(file)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable backfill checkpoint {self.checkpoint_path}: {e}")
+        return {"symbols": {}}
+
+    def _save_checkpoint(self) -> None:
+        if not self.checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.checkpoint, file)
+        os.replace(temporary, self.checkpoint_path)
+
+    def is_done(self, symbol: str) -> bool:
+        return self.checkpoint["symbols"].get(symbol, {}).get("status") == "done"
+
+    # ------------------- JOBS -------------------
+
+    async def backfill_symbol(self, symbol: str) -> Tuple[List[dict], List[int]]:
+        """All funding periods of a symbol as analysis documents, plus the key periods whose analysis failed"""
+        history = await self.data_service.get_historical_funding_rate(symbol)
+        if not len(history):
+            return [], []
+
+        key_periods = [int(row[2]) for row in history if row[0] <= self.threshold]
+        self._counters["jobs"] += len(key_periods)
+
+        source = PrefetchedCandleSource(self.data_service)
+        await source.prefetch(symbol, plan_windows(key_periods, self.data_service.convert_granularity_to_ms))
+
+        semaphore = asyncio.Semaphore(self.analysis_concurrency)
+        failed: List[int] = []
+
+        async def analyse(period: int) -> dict:
+            async with semaphore:
+                try:
+                    # One chart per period, FundingRateChart keeps per-call state
+                    analysis = await FundingRateChart(symbol, candle_source=source).set_analysis(period)
+                    self._counters["analyses"] += 1
+                    return analysis
+                except Exception as e:
+                    self._counters["analysis_errors"] += 1
+                    failed.append(period)
+                    print(f"Error analysing {symbol} at {period}: {e}")
+                    return {}
+
+        analyses = dict(zip(key_periods, await asyncio.gather(*[analyse(period) for period in key_periods])))
+        source.release(symbol)
+        self._counters["candle_downloads"] += source.counters["downloads"]
+        self._counters["candle_hits"] += source.counters["hits"]
+        self._counters["candle_misses"] += source.counters["misses"]
+
+        documents = [
+            {
+                "id": str(uuid.uuid4()),
+                "symbol": symbol,
+                "period": row[1],
+                "period_ts": int(row[2]),
+                "funding_rate_value": float(row[0]),
+                "key_moment": bool(row[0] <= self.threshold),
+                "analysis": analyses.get(int(row[2]), {})
+            }
+            for row in history
+        ]
+        return documents, failed
+
+    # ------------------- STORAGE -------------------
+
+    async def _stage(self, symbol: str, documents: List[dict], failed: List[int]) -> None:
+        async with self._write_lock:
+            self._buffer.extend(documents)
+            self._staged[symbol] = {
+                "status": "partial" if failed else "done",
+                "periods": len(documents),
+                "failed_periods": failed,
+                "finished_at": int(time.time() * 1000)
+            }
+            if len(self._buffer) >= self.write_batch:
+                await self._flush()
+
+    async def _flush(self) -> None:
+        """Bulk write the buffered documents, then commit the checkpoint of the symbols they belong to"""
+        if self._buffer:
+            documents, self._buffer = self._buffer, []
+            for start in range(0, len(documents), self.write_batch):
+                await self.storage.bulk_upsert_funding_rate_analysis(documents[start:start + self.write_batch])
+            self._counters["written"] += len(documents)
+
+        if self._staged:
+            self.checkpoint["symbols"].update(self._staged)
+            self._staged = {}
+            self._save_checkpoint()
+
+    # ------------------- RUN -------------------
+
+    async def run(self, symbols: Optional[Iterable[str]] = None) -> dict:
+        """Backfill `symbols` (every Bitget future by default), skipping the ones already checkpointed as done"""
+        if symbols is None:
+            symbols = await self.data_service.get_all_symbols("bitget")
+        symbols = list(symbols)
+        pending = [symbol for symbol in symbols if not self.is_done(symbol)]
+        self._counters["symbols_skipped"] += len(symbols) - len(pending)
+
+        await self.storage.ensure_analysis_indexes()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(symbol: str) -> None:
+            async with semaphore:
+                try:
+                    documents, failed = await self.backfill_symbol(symbol)
+                except Exception as e:
+                    self._counters["symbols_failed"] += 1
+                    print(f"Error backfilling {symbol}: {e}")
+                    async with self._write_lock:
+                        self._staged[symbol] = {"status": "failed", "error": str(e), "finished_at": int(time.time() * 1000)}
+                    return
+                await self._stage(symbol, documents, failed)
+                self._counters["symbols_done"] += 1
+
+        await asyncio.gather(*[worker(symbol) for symbol in pending])
+        async with self._write_lock:
+            await self._flush()
+        return self.snapshot()
+
+    def snapshot(self) -> dict:
+        return {"buffered": len(self._buffer), **self._counters}
+
+
+async def main_testing():
+    engine = FundingBackfill(checkpoint_path="/tmp/backfill_checkpoint.json")
+
+    documents, failed = await engine.backfill_symbol("BIGTIMEUSDT")
+    print(f"periods -> {len(documents)}, key moments -> {sum(d['key_moment'] for d in documents)}, failed -> {failed}")
+    print("metrics ->", engine.snapshot())
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
@@ -0,0 +1,169 @@
+import asyncio
+import itertools
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from src.app import analysis_kernels as kernels
+from src.app.clients.binance import BinanceClient
+from src.app.compute import compute_executor
+from src.app.crypto_data_service import CryptoDataService
+from src.app.market_data.funding_history import FUNDING_HISTORY_STEP_MS, FundingHistoryStore, funding_history
+
+"""
+Cross-exchange funding carry backtester.
+
+For every symbol the Binance / Bitget settlement history (funding_history.py) and 1H closes of
+both venues are aligned on one hourly grid, a (T, 5) array, see BACKTEST_SERIES_COLUMNS. The
+symbol x parameter grid is then split into chunks evaluated by the compute pool, every chunk
+reuses the signal and P&L legs computed once per symbol. Results are aggregated per parameter
+set across the universe.
+"""
+
+BACKTEST_CONCURRENCY = int(os.getenv("BACKTEST_CONCURRENCY", "4"))
+BACKTEST_GRID_CHUNK = int(os.getenv("BACKTEST_GRID_CHUNK", "64"))
+BACKTEST_MIN_HOURS = 24 * 7
+
+
+def parameter_grid(entries: Iterable[float], exits: Iterable[float], fees_bps: Iterable[float], slippages_bps: Iterable[float]) -> np.ndarray:
+    """(m, 4) [entry, exit, fee_bps, slippage_bps], exits wider than their entry are skipped"""
+    rows = [row for row in itertools.product(entries, exits, fees_bps, slippages_bps) if row[1] <= row[0]]
+    return np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def _place(series: np.ndarray, column: int, rows: np.ndarray) -> None:
+    """Write rows [timestamp, value] onto the hourly grid, rows off the grid are dropped"""
+    if not len(rows):
+        return
+    timestamps = series[:, 0]
+    index = np.clip(np.searchsorted(timestamps, rows[:, 0]), 0, len(timestamps) - 1)
+    on_grid = timestamps[index] == rows[:, 0]
+    series[index[on_grid], column] = rows[on_grid, 1]
+
+
+class FundingBacktester:
+
+    def __init__(self, history: FundingHistoryStore = funding_history, data_service: Optional[CryptoDataService] = None,
+                 binance_client: Optional[BinanceClient] = None, concurrency: int = BACKTEST_CONCURRENCY,
+                 grid_chunk: int = BACKTEST_GRID_CHUNK) -> None:
+        self.history = history
+        self.data_service = data_service or CryptoDataService()
+        self.binance_client = binance_client or BinanceClient()
+        self.concurrency = concurrency
+        self.grid_chunk = grid_chunk
+        self._counters = {"runs": 0, "symbols": 0, "skipped": 0, "chunks": 0, "last_run_seconds": 0.0}
+
+    async def universe(self) -> List[str]:
+        """Perpetuals listed on both venues"""
+        bitget, binance = await asyncio.gather(self.data_service.get_all_symbols("bitget"), self.data_service.get_all_symbols("binance"))
+        return sorted(set(bitget.tolist()) & set(binance.tolist()))
+
+    async def load_series(self, symbol: str, start_time: int, end_time: int) -> np.ndarray:
+        """Aligned (T, 5) hourly series, closes are stamped when the candle closes and carried forward"""
+        start_time = start_time // FUNDING_HISTORY_STEP_MS * FUNDING_HISTORY_STEP_MS
+        funding_binance, funding_bitget, candles_binance, candles_bitget = await asyncio.gather(
+            self.history.get("binance", symbol, start_time, end_time),
+            self.history.get("bitget", symbol, start_time, end_time),
+            self.binance_client.get_candlestick_chart(symbol, "1h", start_time=start_time, end_time=end_time),
+            self.data_service.get_candlestick_chart(symbol, "1H", start_time=start_time, end_time=end_time)
+        )
+
+        timestamps = np.arange(start_time, end_time + 1, FUNDING_HISTORY_STEP_MS, dtype=np.float64)
+        series = np.full((len(timestamps), len(kernels.BACKTEST_SERIES_COLUMNS)), np.nan)
+        series[:, 0] = timestamps
+        _place(series, 1, funding_binance)
+        _place(series, 2, funding_bitget)
+        for column, candles in ((3, candles_binance), (4, candles_bitget)):
+            if len(candles):
+                _place(series, column, np.column_stack([candles[:, 0] + FUNDING_HISTORY_STEP_MS, candles[:, 4]]))
+                series[:, column] = kernels.forward_fill(series[:, column])
+        return series
+
+    async def _symbol(self, symbol: str, start_time: int, end_time: int, grid: np.ndarray, semaphore: asyncio.Semaphore) -> Optional[List[dict]]:
+        async with semaphore:
+            try:
+                series = await self.load_series(symbol, start_time, end_time)
+            except Exception as e:
+                print(f"Error loading the backtest series of {symbol}: {e}")
+                return None
+
+        quoted = ~np.isnan(series[:, 3:5]).any(axis=1)
+        if quoted.sum() < BACKTEST_MIN_HOURS or np.isnan(series[:, 1]).all() or np.isnan(series[:, 2]).all():
+            print(f"Not enough history on both exchanges to backtest {symbol}")
+            return None
+
+        chunks = [grid[i:i + self.grid_chunk] for i in range(0, len(grid), self.grid_chunk)]
+        self._counters["chunks"] += len(chunks)
+        results = await asyncio.gather(*[compute_executor.run(kernels.backtest_carry_grid, series, chunk) for chunk in chunks])
+        return list(itertools.chain.from_iterable(results))
+
+    @staticmethod
+    def _aggregate(grid: np.ndarray, by_symbol: Dict[str, List[dict]]) -> List[dict]:
+        """Per parameter set across every backtested symbol, best mean return first"""
+        totals = np.array([[result["total_return"] for result in results] for results in by_symbol.values()])
+        drawdowns = np.array([[result["max_drawdown"] for result in results] for results in by_symbol.values()])
+        trades = np.array([[result["trades"] for result in results] for results in by_symbol.values()])
+
+        rows = []
+        for i, (entry, exit_, fee_bps, slippage_bps) in enumerate(grid.tolist()):
+            rows.append({
+                "entry": entry, "exit": exit_, "fee_bps": fee_bps, "slippage_bps": slippage_bps,
+                "mean_return": float(totals[:, i].mean()),
+                "median_return": float(np.median(totals[:, i])),
+                "positive_share": float((totals[:, i] > 0).mean()),
+                "mean_max_drawdown": float(drawdowns[:, i].mean()),
+                "trades": int(trades[:, i].sum())
+            })
+        rows.sort(key=lambda row: row["mean_return"], reverse=True)
+        return rows
+
+    async def run(self, symbols: Optional[Iterable[str]], start_time: int, end_time: int,
+                  entries: Iterable[float] = (0.01, 0.02, 0.05, 0.1), exits: Iterable[float] = (0.0, 0.005, 0.01),
+                  fees_bps: Iterable[float] = (5.0,), slippages_bps: Iterable[float] = (2.0,)) -> dict:
+        """
+        Backtest every symbol (the common universe if None) over every parameter set.
+        Thresholds are spreads in percent per 8h, returns are percent of the notional of one leg.
+        """
+        started = time.perf_counter()
+        symbols = list(symbols) if symbols else await self.universe()
+        grid = parameter_grid(entries, exits, fees_bps, slippages_bps)
+        if not len(grid):
+            raise ValueError("Empty parameter grid, every exit threshold is wider than its entry")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*[self._symbol(symbol, start_time, end_time, grid, semaphore) for symbol in symbols])
+        by_symbol = {symbol: result for symbol, result in zip(symbols, results) if result is not None}
+
+        self._counters["runs"] += 1
+        self._counters["symbols"] += len(by_symbol)
+        self._counters["skipped"] += len(symbols) - len(by_symbol)
+        self._counters["last_run_seconds"] = round(time.perf_counter() - started, 3)
+
+        by_params = self._aggregate(grid, by_symbol) if by_symbol else []
+        return {
+            "start": start_time,
+            "end": end_time,
+            "symbols": len(by_symbol),
+            "skipped": len(symbols) - len(by_symbol),
+            "parameter_sets": len(grid),
+            "best": by_params[0] if by_params else None,
+            "by_params": by_params,
+            "by_symbol": {symbol: max(result, key=lambda row: row["total_return"]) for symbol, result in by_symbol.items()},
+            "elapsed_seconds": self._counters["last_run_seconds"]
+        }
+
+    def snapshot(self) -> dict:
+        return dict(self._counters)
+
+
+async def main_testing():
+    end = int(time.time() * 1000)
+    start = end - 90 * 24 * 60 * 60 * 1000
+    result = await FundingBacktester().run(["BTCUSDT", "ETHUSDT", "SOLUSDT"], start, end)
+    print(f"{result['symbols']} symbols x {result['parameter_sets']} parameter sets in {result['elapsed_seconds']} s")
+    print("best ->", result["best"])
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
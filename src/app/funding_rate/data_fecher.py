@@ -1,9 +1,11 @@
 from typing import Literal, Optional
 import asyncio
+import numpy as np
 
 from src.app.clients.binance import BinanceClient
 from src.app.clients.bitget import BitgetClient
 from src.app.proxy import APIProxy
+from src.app.market_data.funding_stream import funding_table
 
 class DataFecher:
     def __init__(self):
@@ -22,16 +24,29 @@ class DataFecher:
         }
 
         # Determine which exchanges support the symbol based on its suffix
-        exchange_tasks = []
         if symbol.endswith("USDT"):
-            # Add both Binance and Bitget if symbol is in USDT
-            exchange_tasks.append(("binance", supported_exchanges["binance"](symbol)))
-            exchange_tasks.append(("bitget", supported_exchanges["bitget"](symbol)))
+            # Both Binance and Bitget if symbol is in USDT
+            exchanges = ["binance", "bitget"]
         elif symbol.endswith("UMCBL"):
-            exchange_tasks.append(("bitget", supported_exchanges["bitget"](symbol)))
+            exchanges = ["bitget"]
         else:
             return {"funding_rate": []}
 
+        # Exchanges already covered by the streamed table skip the REST call
+        streamed = funding_table.get_symbol(symbol, max_age=60)
+        streamed_data = [
+            {"exchange": exchange, "funding_rate": self._format_streamed_rate(exchange, streamed[exchange]["funding_rate"])}
+            for exchange in exchanges
+            if exchange in streamed and streamed[exchange]["funding_rate"] is not None
+        ]
+        streamed_exchanges = {entry["exchange"] for entry in streamed_data}
+        exchange_tasks = [
+            (exchange, supported_exchanges[exchange](symbol))
+            for exchange in exchanges if exchange not in streamed_exchanges
+        ]
+        if not exchange_tasks:
+            return {"funding_rate": streamed_data}
+
         # Fetch funding rates concurrently for supported exchanges
         results = await asyncio.gather(
             *[self._fetch_funding_rate_for_exchange(exchange, task) for exchange, task in exchange_tasks],
@@ -42,21 +57,17 @@ class DataFecher:
         print(f"Raw results: {results}")
 
         # Filter out None results and structure the data
-        funding_rate_data = [
+        funding_rate_data = streamed_data + [
             {"exchange": exchange, "funding_rate": rate}
             for exchange, rate in results if rate is not None
         ]
 
         return {"funding_rate": funding_rate_data}
 
-    async def _fetch_funding_rate_for_exchange(self, exchange: str, fetch_task):
-        """Helper method to fetch funding rate for a specific exchange."""
-        try:
-            return exchange, await fetch_task
-        except Exception as e:
-            print(f"Error fetching funding rate for {exchange}: {e}")
-            return exchange, None
-
+    @staticmethod
+    def _format_streamed_rate(exchange: str, rate: float) -> str:
+        """Same string format the REST clients return, always fixed point (str(1e-05) is '1e-05')"""
+        return f"{rate:.8f}" if exchange == "binance" else np.format_float_positional(rate, trim="-")
 
     async def _fetch_funding_rate_for_exchange(self, exchange: str, fetch_task):
         """Helper method to fetch funding rate for a specific exchange."""
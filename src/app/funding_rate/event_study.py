@@ -0,0 +1,137 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.app import analysis_kernels as kernels
+from src.app.compute import compute_executor
+from src.app.crypto_data_service import CryptoDataService
+from src.app.funding_rate.backfill import merge_windows
+from src.app.market_data.candles import BITGET_CANDLE_WIDTH, empty_candles
+from src.app.mongo.controller import MongoDB_Crypto
+from src.app.singleflight import SingleFlight
+
+"""
+Funding event study.
+
+Every funding event matching a filter (backfilled into Mongo, see backfill.py) is aligned on its
+funding time and turned into one row of an events x offsets matrix of returns per horizon, read
+from the stored candles. Mean / median / quantile paths are then computed over the whole matrix
+in a single vectorized pass in the compute pool. Results are cached per filter.
+"""
+
+# horizon -> (candle granularity, number of candles after the event)
+EVENT_STUDY_HORIZONS = {"10m": ("1m", 10), "8h": ("15m", 32), "7d": ("1H", 168)}
+
+
+class FundingEventStudy:
+
+    def __init__(self, data_service: Optional[CryptoDataService] = None, storage: Optional[MongoDB_Crypto] = None,
+                 cache_ttl: float = 15 * 60, cache_size: int = 64, concurrency: int = 4) -> None:
+        self.data_service = data_service or CryptoDataService()
+        self.storage = storage if storage is not None else MongoDB_Crypto()
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.concurrency = concurrency
+
+        self._cache: "OrderedDict[tuple, Tuple[float, dict]]" = OrderedDict()
+        self._flights = SingleFlight("event-study")
+        self._counters = {"hits": 0, "misses": 0, "events": 0, "candle_downloads": 0}
+
+    @staticmethod
+    def cache_key(max_rate, min_rate, symbols, start, end, horizons, limit) -> tuple:
+        return ("study", max_rate, min_rate, tuple(sorted(symbols or ())), start, end, tuple(horizons), limit)
+
+    async def _symbol_candles(self, symbol: str, granularity: str, periods: List[int], steps: int) -> np.ndarray:
+        """Candles covering the horizon after every event of a symbol, close events share downloads"""
+        step_ms = self.data_service.convert_granularity_to_ms(granularity)
+        windows = merge_windows(((period, period + steps * step_ms) for period in periods), step_ms)
+
+        pages = []
+        for start, end in windows:
+            pages.append(await self.data_service.get_candlestick_chart(symbol, granularity, start_time=start, end_time=end))
+            self._counters["candle_downloads"] += 1
+        pages = [page for page in pages if len(page)]
+        return np.concatenate(pages) if pages else empty_candles(BITGET_CANDLE_WIDTH)
+
+    async def _horizon_matrix(self, events_by_symbol: Dict[str, List[int]], horizon: str) -> np.ndarray:
+        granularity, steps = EVENT_STUDY_HORIZONS[horizon]
+        step_ms = self.data_service.convert_granularity_to_ms(granularity)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def symbol_rows(symbol: str, periods: List[int]) -> np.ndarray:
+            async with semaphore:
+                try:
+                    candles = await self._symbol_candles(symbol, granularity, periods, steps)
+                except Exception as e:
+                    print(f"Error loading {symbol} {granularity} candles for the event study: {e}")
+                    candles = empty_candles(BITGET_CANDLE_WIDTH)
+            return kernels.align_event_returns(candles, np.array(periods, dtype=np.int64), step_ms, steps)
+
+        blocks = await asyncio.gather(*[symbol_rows(symbol, periods) for symbol, periods in events_by_symbol.items()])
+        return np.vstack(blocks) if blocks else np.empty((0, steps))
+
+    async def _compute(self, max_rate, min_rate, symbols, start, end, horizons, limit) -> dict:
+        events = await self.storage.find_funding_events(max_rate=max_rate, min_rate=min_rate, symbols=symbols, start=start, end=end, limit=limit)
+        events_by_symbol: Dict[str, List[int]] = {}
+        for event in events:
+            events_by_symbol.setdefault(event["symbol"], []).append(int(event["period_ts"]))
+        self._counters["events"] += len(events)
+
+        result = {
+            "filter": {"max_funding_rate": max_rate, "min_funding_rate": min_rate, "symbols": symbols, "start": start, "end": end, "limit": limit},
+            "events": len(events),
+            "symbols": len(events_by_symbol),
+            "as_of": int(time.time() * 1000),
+            "horizons": {}
+        }
+        for horizon in horizons:
+            granularity, steps = EVENT_STUDY_HORIZONS[horizon]
+            matrix = await self._horizon_matrix(events_by_symbol, horizon)
+            stats = await compute_executor.run(kernels.event_study_stats, matrix)
+            step_minutes = self.data_service.convert_granularity_to_ms(granularity) // 60000
+            result["horizons"][horizon] = {
+                "granularity": granularity,
+                "offsets_minutes": [(k + 1) * step_minutes for k in range(steps)],
+                "events_with_data": int((~np.isnan(matrix)).any(axis=1).sum()),
+                **stats
+            }
+        return result
+
+    async def study(self, max_rate: Optional[float] = -0.5, min_rate: Optional[float] = None, symbols: Optional[List[str]] = None,
+                    start: Optional[int] = None, end: Optional[int] = None, horizons: Iterable[str] = tuple(EVENT_STUDY_HORIZONS),
+                    limit: int = 5000) -> dict:
+        """Event study of the matching funding events, cached for `cache_ttl` seconds per filter"""
+        horizons = [horizon for horizon in EVENT_STUDY_HORIZONS if horizon in set(horizons)]
+        key = self.cache_key(max_rate, min_rate, symbols, start, end, horizons, limit)
+
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            self._counters["hits"] += 1
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        self._counters["misses"] += 1
+        result = await self._flights.do(key, self._compute, max_rate, min_rate, symbols, start, end, horizons, limit)
+        self._cache[key] = (time.monotonic(), result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def snapshot(self) -> dict:
+        return {"cached": len(self._cache), **self._counters}
+
+
+async def main_testing():
+    study = FundingEventStudy()
+    result = await study.study(max_rate=-0.5, horizons=("10m", "8h"))
+    print(f"events -> {result['events']} across {result['symbols']} symbols")
+    for horizon, stats in result["horizons"].items():
+        print(horizon, "mean ->", stats["mean"][-1], "median ->", stats["median"][-1], "n ->", stats["count"][-1])
+    print("metrics ->", study.snapshot())
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from src.app.funding_rate.interval_cache import FundingIntervalCache
+from src.app.market_data.funding_stream import FundingTable
+from src.app.sheduler_layer import ScheduleLayer
+
+"""
+Funding calendar: when does every symbol settle next.
+
+The next funding time each exchange reports per symbol (streamed into the funding table) is kept
+in a min-heap. A single one-off scheduler job is armed for the earliest settlement and fires
+shortly after it with only the symbols settling in that cluster, then re-arms for the next one.
+The handler runs in its own task, a slow cohort never holds back the next cluster.
+A next funding time moved before it happened supersedes the old entry (skipped when it surfaces);
+one rolled at or after the settlement keeps it, so the cluster still fires for that symbol.
+Symbols whose exchange doesn't report again are projected one funding interval ahead.
+"""
+
+FUNDING_CALENDAR_CLUSTER_MS = int(os.getenv("FUNDING_CALENDAR_CLUSTER_MS", str(60 * 1000)))
+FUNDING_CALENDAR_SETTLE_DELAY_SECONDS = float(os.getenv("FUNDING_CALENDAR_SETTLE_DELAY_SECONDS", "60"))
+DEFAULT_INTERVAL_HOURS = 8
+
+
+class FundingCalendar:
+
+    def __init__(self, table: FundingTable, scheduler: ScheduleLayer, handler: Callable[[List[str], int], Awaitable],
+                 exchange: str = "bitget", interval_lookup: Optional[Callable[[str], Optional[int]]] = None,
+                 cluster_ms: int = FUNDING_CALENDAR_CLUSTER_MS, settle_delay: float = FUNDING_CALENDAR_SETTLE_DELAY_SECONDS) -> None:
+        self.table = table
+        self.scheduler = scheduler
+        self.handler = handler
+        self.exchange = exchange
+        self.interval_lookup = interval_lookup
+        self.cluster_ms = cluster_ms
+        self.settle_delay = settle_delay
+        self.job_id = f"funding-calendar-{exchange}"
+
+        self._heap: List[Tuple[int, str]] = []  # (next_funding_time, symbol)
+        self._live: Set[Tuple[int, str]] = set()
+        self._next: Dict[str, int] = {}
+        self._armed_at: Optional[int] = None
+        self._running: Set[asyncio.Task] = set()
+        self._counters = {"updates": 0, "clusters_fired": 0, "symbols_fired": 0, "projected": 0, "stale_dropped": 0, "errors": 0}
+
+    # ------------------- CALENDAR -------------------
+
+    def update(self, symbol: str, next_funding_time: int) -> None:
+        symbol = FundingIntervalCache.normalize_symbol(symbol)
+        next_funding_time = int(next_funding_time)
+        if not next_funding_time or self._next.get(symbol) == next_funding_time:
+            return
+        previous = self._next.get(symbol)
+        if previous and previous > time.time() * 1000 + self.cluster_ms:
+            self._live.discard((previous, symbol))
+        self._next[symbol] = next_funding_time
+        self._live.add((next_funding_time, symbol))
+        heapq.heappush(self._heap, (next_funding_time, symbol))
+        self._counters["updates"] += 1
+        self._arm()
+
+    def on_funding_change(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        """Funding ingest listener"""
+        if exchange == self.exchange and changed.get("next_funding_time"):
+            self.update(symbol, changed["next_funding_time"])
+
+    def load_from_table(self) -> None:
+        """Seed with every next funding time the table already holds"""
+        symbols, next_funding = self.table.column(self.exchange, "next_funding_time")
+        for symbol, next_funding_time in zip(symbols, next_funding.tolist()):
+            if next_funding_time > 0:
+                self.update(symbol, next_funding_time)
+
+    def _peek(self) -> Optional[int]:
+        """Earliest live settlement, superseded entries are dropped on the way"""
+        while self._heap:
+            if self._heap[0] in self._live:
+                return self._heap[0][0]
+            heapq.heappop(self._heap)
+            self._counters["stale_dropped"] += 1
+        return None
+
+    def upcoming(self, limit: int = 10) -> List[dict]:
+        """The next `limit` settlement clusters with their symbols"""
+        clusters: List[dict] = []
+        for next_funding_time, symbol in sorted(self._live):
+            if clusters and next_funding_time - clusters[-1]["settlement_time"] <= self.cluster_ms:
+                clusters[-1]["symbols"].append(symbol)
+            elif len(clusters) < limit:
+                clusters.append({"settlement_time": next_funding_time, "symbols": [symbol]})
+            else:
+                break
+        return clusters
+
+    # ------------------- SCHEDULING -------------------
+
+    def _arm(self) -> None:
+        earliest = self._peek()
+        if earliest is None:
+            return
+        if earliest == self._armed_at and self.scheduler.scheduler.get_job(self.job_id):
+            return
+        # An overdue cluster (late update, restart, lease won) runs now, a past run time would only misfire
+        run_time = datetime.fromtimestamp(max(time.time(), earliest / 1000 + self.settle_delay), tz=timezone.utc)
+        self.scheduler.schedule_process_time(run_time, self._fire, earliest, job_id=self.job_id)
+        self._armed_at = earliest
+
+    def _due(self, cluster_time: int) -> List[str]:
+        """Pop every live entry of the cluster (and anything overdue)"""
+        horizon = max(cluster_time + self.cluster_ms, int(time.time() * 1000) - int(self.settle_delay * 1000))
+        symbols = {}
+        while (earliest := self._peek()) is not None and earliest <= horizon:
+            entry = heapq.heappop(self._heap)
+            self._live.discard(entry)
+            symbol = entry[1]
+            symbols[symbol] = True
+            if self._next.get(symbol) != earliest:
+                continue  # the exchange already reported the next one
+
+            # Projected one interval ahead until the exchange reports the real next funding time
+            hours = (self.interval_lookup(symbol) if self.interval_lookup else None) or DEFAULT_INTERVAL_HOURS
+            projected = earliest + int(hours) * 3_600_000
+            self._next[symbol] = projected
+            self._live.add((projected, symbol))
+            heapq.heappush(self._heap, (projected, symbol))
+            self._counters["projected"] += 1
+        return list(symbols)
+
+    async def _fire(self, cluster_time: int) -> None:
+        self._armed_at = None
+        symbols = self._due(cluster_time)
+        self._arm()
+        if not symbols:
+            return
+
+        self._counters["clusters_fired"] += 1
+        self._counters["symbols_fired"] += len(symbols)
+        # Returns right away, the job is done and the next cluster can't be skipped as a running instance
+        task = asyncio.create_task(self.handler(symbols, cluster_time), name=f"funding-settlement-{cluster_time}")
+        self._running.add(task)
+        task.add_done_callback(lambda done: self._on_handled(done, len(symbols), cluster_time))
+
+    def _on_handled(self, task: asyncio.Task, count: int, cluster_time: int) -> None:
+        self._running.discard(task)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self._counters["errors"] += 1
+            print(f"Error processing the funding settlement of {count} symbols at {cluster_time}: {error}")
+
+    def start(self) -> None:
+        self.load_from_table()
+        self._arm()
+
+    def stop(self) -> None:
+        self._armed_at = None
+        if self.scheduler.scheduler.get_job(self.job_id):
+            self.scheduler.scheduler.remove_job(self.job_id)
+
+    def snapshot(self) -> dict:
+        return {
+            "exchange": self.exchange,
+            "symbols": len(self._next),
+            "pending": len(self._live),
+            "heap_entries": len(self._heap),
+            "armed_for": self._armed_at,
+            "in_flight": len(self._running),
+            **self._counters
+        }
@@ -6,11 +6,12 @@ import pytz
 import numpy as np
 import logging
 import time as lowtime
-from typing import Tuple, Literal
+from typing import List, Tuple, Literal
 from src.config import COINMARKETCAP_APIKEY
 
 from src.app.crypto_data_service import CryptoDataService
 from src.app.mongo.controller import MongoDB_Crypto
+from src.app.redis_layer import RedisService, FUNDING_INTERVALS
 
 from src.app.mongo.schema import *
 from src.app.chart_analysis import FundingRateChart
@@ -25,6 +26,7 @@ class FundingRateArbitrageBot:
     def __init__(self) -> None:
         self.data_service = CryptoDataService()
         self.mongo_service = MongoDB_Crypto()
+        self.redis_service = RedisService()
         self.timezone = "Europe/Amsterdam"
 
     # FUNCTION EVERY DAY
@@ -43,11 +45,9 @@ class FundingRateArbitrageBot:
         period_value = int(period[:-1])
         exec_time = int(self.get_last_period_funding_rate(period_value).timestamp() * 1000)
 
-        # Fetch cryptos based on the period
-        if period_value == 4:
-            cryptos = await self.mongo_service.get_all_current_analysis(4)
-        else:
-            cryptos = await self.mongo_service.get_all_current_analysis(-1)
+        # Cohort from the fr_expiration index: every symbol settling at this boundary (1h / 2h / 4h divide 8h)
+        expirations = [interval for interval in FUNDING_INTERVALS if int(interval[:-1]) <= period_value]
+        cryptos = self.redis_service.get_symbols_by_fr_expiration(expirations)
 
         logger.info(f"Cryptos to analyze for period {period}: {cryptos}")
 
@@ -71,44 +71,69 @@ class FundingRateArbitrageBot:
             logger.info("Finished initializing analysis for all cryptos.")
 
         else:
-            # Process existing cryptos
-            symbols_to_create = []
-            symbols_to_analyze = []
-
-            # Iterate over the list of cryptos
-            for crypto_dict in cryptos:
-                for symbol, data in crypto_dict.items():
-                    if data is None:
-                        symbols_to_create.append(symbol)
-                    else:
-                        symbols_to_analyze.append(symbol)
-
-            logger.info(f"Symbols to create: {symbols_to_create}")
-            logger.info(f"Symbols to analyze: {symbols_to_analyze}")
-
-            # Process symbols that need new funding rate entries
-            for i in range(0, len(symbols_to_create), 40):
-                batch = symbols_to_create[i:i+40]
-                logger.info(f"Processing creation batch {i // 40 + 1} with {len(batch)} cryptos.")
-
-                tasks = [self.set_first_analysis(symbol, semaphore, exec_time) for symbol in batch]
-                await asyncio.gather(*tasks)
+            await self.process_cohort(cryptos, exec_time, semaphore)
 
-                # Wait 1 minute before processing the next batch
+    async def process_settlement(self, symbols: List[str], settlement_time: int):
+        """
+        Funding calendar handler: only the symbols that settled at `settlement_time` (ms).
+        """
+        logger.info(f"Funding settlement at {settlement_time}: {len(symbols)} symbols")
+        await self.process_cohort(symbols, settlement_time, asyncio.Semaphore(5))
+
+    async def process_cohort(self, cryptos: List[str], exec_time: int, semaphore):
+        """
+        Create the first entry of the cryptos without a stored history (in Mongo) and analyze the rest.
+        """
+        symbols_to_analyze = await self.mongo_service.get_symbols_with_analysis(cryptos)
+        analyzed = set(symbols_to_analyze)
+        symbols_to_create = [symbol for symbol in cryptos if symbol not in analyzed]
+
+        logger.info(f"Symbols to create: {symbols_to_create}")
+        logger.info(f"Symbols to analyze: {symbols_to_analyze}")
+
+        # Process symbols that need new funding rate entries
+        for i in range(0, len(symbols_to_create), 40):
+            batch = symbols_to_create[i:i+40]
+            logger.info(f"Processing creation batch {i // 40 + 1} with {len(batch)} cryptos.")
+
+            tasks = [self.set_first_analysis(symbol, semaphore, exec_time) for symbol in batch]
+            await asyncio.gather(*tasks)
+
+            # Wait 1 minute before processing the next batch
+            if i + 40 < len(symbols_to_create) or symbols_to_analyze:
                 await asyncio.sleep(60)
 
-            # Process symbols that need to be analyzed
-            for i in range(0, len(symbols_to_analyze), 40):
-                batch = symbols_to_analyze[i:i+40]
-                logger.info(f"Processing analysis batch {i // 40 + 1} with {len(batch)} cryptos.")
+        # Process symbols that need to be analyzed
+        for i in range(0, len(symbols_to_analyze), 40):
+            batch = symbols_to_analyze[i:i+40]
+            logger.info(f"Processing analysis batch {i // 40 + 1} with {len(batch)} cryptos.")
 
-                tasks = [self.decide_analysis_crypto(symbol, exec_time, semaphore) for symbol in batch]
-                await asyncio.gather(*tasks)
+            tasks = [self.decide_analysis_crypto(symbol, exec_time, semaphore) for symbol in batch]
+            await asyncio.gather(*tasks)
 
-                # Wait 1 minute before processing the next batch
+            # Wait 1 minute before processing the next batch
+            if i + 40 < len(symbols_to_analyze):
                 await asyncio.sleep(60)
 
-            logger.info("Finished analyzing all cryptos.")
+        logger.info("Finished analyzing all cryptos.")
+
+    def funding_rate_entry(self, symbol: str, funding_rate_value: float, period_ts: int, index_period_price: float) -> FundingRateAnalysis:
+        """Analysis document of a settled period, same layout as the backfill"""
+        return FundingRateAnalysis(
+            id=str(uuid.uuid4()),
+            symbol=symbol,
+            period=datetime.fromtimestamp(period_ts / 1000, pytz.timezone(self.timezone)).isoformat(),
+            period_ts=period_ts,
+            funding_rate_value=float(funding_rate_value),
+            index_period_price=index_period_price,
+            key_moment=float(funding_rate_value) <= -0.5,
+            analysis={}
+        )
+
+    async def save_funding_rate_entry(self, symbol: str, entry: FundingRateAnalysis):
+        """Persist the period in Mongo, then feed the quantile sketch of the symbol"""
+        await self.mongo_service.add_funding_rate_analysis(symbol, entry)
+        await asyncio.to_thread(self.redis_service.record_funding_value, symbol, entry["funding_rate_value"], entry["period_ts"])
 
     async def decide_analysis_crypto(self, crypto: str, exec_time, semaphore):
         """
@@ -116,9 +141,11 @@ class FundingRateArbitrageBot:
         """
         async with semaphore:
             try:
-                # Retrieve the last funding rate analysis
-                current_contract_funding_rate, last_contract_funding_rate, current_period_ts, last_period_ts, current_period, last_period = await self.data_service.get_last_contract_funding_rate(crypto)
-                
+                # The period that just settled and the one before, (rate %, funding time) each
+                (current_contract_funding_rate, current_period_ts), (last_contract_funding_rate, last_period_ts) = await asyncio.gather(
+                    self.data_service.get_last_contract_funding_rate(crypto),
+                    self.data_service.get_last_contract_funding_rate(crypto, ans=True)
+                )
             except Exception as e:
                 logger.error(f"Failed to get last funding rate for {crypto}: {e}")
                 return None
@@ -132,18 +159,15 @@ class FundingRateArbitrageBot:
                 return None
 
         # Create a new funding rate analysis entry
-        current_analysis = FundingRateAnalysis(
-            period_ts=current_period_ts,
-            period=current_period,
-            funding_rate_value=float(current_contract_funding_rate),
-            index_period_price=index_period_price,
-            key_moment=float(current_contract_funding_rate) <= -0.5,
-            analysis={}
-        )
+        current_analysis = self.funding_rate_entry(crypto, current_contract_funding_rate, int(current_period_ts), index_period_price)
         logger.info(f"Current analysis for {crypto}: {current_analysis}")
 
         # Save current analysis no matter the funding value
-        await self.mongo_service.save_current_funding_rate(symbol=crypto, analysis=current_analysis)
+        try:
+            await self.save_funding_rate_entry(crypto, current_analysis)
+        except Exception as e:
+            logger.error(f"Failed to save the funding rate of {crypto}: {e}")
+            return None
 
         # If the last funding rate was <= -0.5, generate analysis for last period
         if float(last_contract_funding_rate) <= -0.5:
@@ -153,18 +177,11 @@ class FundingRateArbitrageBot:
                 analysis_chart = FundingRateChart(symbol=crypto)
                 last_analysis_data = await analysis_chart.set_analysis(period=int(last_period_ts))
 
-                # Prepare the updated analysis data
-                analysis_data = Analysis(
-                    description=last_analysis_data["description"],
-                    eight_hour_variation=last_analysis_data["eight_hour_variation"],
-                    ten_minute_variation=last_analysis_data["ten_minute_variation"],
-                    one_minute_variation=last_analysis_data["one_minute_variation"]
-                )
-
                 # Update the previous funding rate analysis entry with the new analysis
-                await self.data_service.save_last_funding_rate_analysis(symbol=crypto, analysis=analysis_data)
-
-                logger.info(f"Added analysis to previous funding rate for {crypto}")
+                if await self.mongo_service.set_last_analysis(crypto, last_analysis_data, period_ts=int(last_period_ts)):
+                    logger.info(f"Added analysis to previous funding rate for {crypto}")
+                else:
+                    logger.warning(f"No stored funding rate of {crypto} at {last_period_ts} to add the analysis to")
 
             except Exception as e:
                 logger.error(f"Failed to generate analysis for {crypto}: {e}")
@@ -177,7 +194,7 @@ class FundingRateArbitrageBot:
         # Get current funding rate
         async with semaphore:
             try:
-                current_contract_funding_rate, _, current_period_ts, _, current_period, _ = await self.data_service.get_last_contract_funding_rate(symbol)
+                current_contract_funding_rate, current_period_ts = await self.data_service.get_last_contract_funding_rate(symbol)
             except Exception as e:
                 logger.error(f"Failed while getting the crypto last analysis for {symbol}: {e}")
                 return None
@@ -190,17 +207,13 @@ class FundingRateArbitrageBot:
             except Exception as e:
                 logger.error(f"Failed while getting the index price for {symbol}: {e}")
                 return None
-        
-        current_analysis = FundingRateAnalysis(
-            period_ts=current_period_ts,
-            period=current_period,
-            funding_rate_value=float(current_contract_funding_rate),
-            index_period_price=index_period_price,
-            key_moment=float(current_contract_funding_rate) <= -0.5,
-            analysis={}
-        )
 
-        await self.data_service.save_current_funding_rate(symbol=symbol, analysis=current_analysis)
+        current_analysis = self.funding_rate_entry(symbol, current_contract_funding_rate, int(current_period_ts), index_period_price)
+        try:
+            await self.save_funding_rate_entry(symbol, current_analysis)
+        except Exception as e:
+            logger.error(f"Failed while saving the first funding rate of {symbol}: {e}")
+            return None
         logger.info(f"Initialized analysis for {symbol}")
 
     def get_next_funding_fee_hour(self, delay: Literal[8, 4], ans=False):
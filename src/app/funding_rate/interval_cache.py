@@ -0,0 +1,152 @@
+import asyncio
+import time
+import aiohttp
+from typing import Dict, Iterable, Optional, Tuple
+
+from src.app.rate_control import outbound_limiters
+
+
+BITGET_URL = "https://api.bitget.com"
+BINANCE_URL = "https://fapi.binance.com"
+QUOTE_SUFFIXES = ("USDT", "USDC", "USD")
+
+
+class FundingIntervalCache:
+    """
+    Symbol -> funding interval (hours, as str) map shared by every service instance.
+
+    Binance publishes the intervals of all its perpetuals in a single `/fapi/v1/fundingInfo`
+    call, so that list is downloaded once per `ttl` and indexed by exact symbol. Bitget only
+    exposes it through the per-symbol funding history, so those lookups are cached per symbol
+    with the same TTL.
+    """
+
+    def __init__(self, ttl: float = 6 * 60 * 60, bitget_concurrency: int = 10) -> None:
+        self.ttl = ttl
+        self.bitget_concurrency = bitget_concurrency
+
+        self._binance_intervals: Dict[str, str] = {}
+        self._binance_loaded_at: float = 0.0
+        self._binance_lock = asyncio.Lock()
+
+        self._bitget_intervals: Dict[str, Tuple[Optional[str], float]] = {}
+
+    @staticmethod
+    def normalize_symbol(symbol: str) -> str:
+        """Exchange symbols are upper case and quoted, 'btc' and 'BTCUSDT' resolve to the same key"""
+        symbol = symbol.strip().upper()
+        if not symbol.endswith(QUOTE_SUFFIXES):
+            symbol += "USDT"
+        return symbol
+
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return (time.monotonic() - loaded_at) < self.ttl
+
+    # ------------------- BINANCE -------------------
+
+    async def _refresh_binance(self, session: aiohttp.ClientSession, force: bool = False) -> None:
+        """Download the whole fundingInfo list once and rebuild the symbol index"""
+        if not force and self._binance_loaded_at and self._is_fresh(self._binance_loaded_at):
+            return
+
+        async with self._binance_lock:
+            # Another coroutine may have refreshed while we waited for the lock
+            if not force and self._binance_loaded_at and self._is_fresh(self._binance_loaded_at):
+                return
+
+            url = f"{BINANCE_URL}/fapi/v1/fundingInfo"
+            async with outbound_limiters.slot(url) as ticket, session.get(url) as response:
+                ticket.observe(response.status, response.headers)
+                if response.status != 200:
+                    print(f"Error fetching Binance funding info: {response.status}")
+                    return
+                data = await response.json()
+
+            self._binance_intervals = {
+                entry["symbol"].upper(): str(int(entry["fundingIntervalHours"]))
+                for entry in data
+                if entry.get("symbol") and entry.get("fundingIntervalHours") is not None
+            }
+            self._binance_loaded_at = time.monotonic()
+
+    # ------------------- BITGET -------------------
+
+    async def _fetch_bitget_interval(self, session: aiohttp.ClientSession, symbol: str) -> Optional[str]:
+        """Infer the interval from the distance between the two last Bitget settlements"""
+        cached = self._bitget_intervals.get(symbol)
+        if cached and self._is_fresh(cached[1]):
+            return cached[0]
+
+        url = f"{BITGET_URL}/api/v2/mix/market/history-fund-rate"
+        params = {"symbol": symbol, "productType": "usdt-futures", "pageSize": 2}
+        interval = None
+        try:
+            async with outbound_limiters.slot(url) as ticket, session.get(url, params=params) as response:
+                ticket.observe(response.status, response.headers)
+                data = await response.json()
+                if data.get("code") == "00000" and data.get("data"):
+                    times = [int(entry["fundingTime"]) for entry in data["data"]]
+                    if len(times) > 1:
+                        interval = str(int(abs(times[0] - times[1]) / 3600000))
+        except (aiohttp.ClientError, ValueError) as e:
+            print(f"Error fetching Bitget funding history for {symbol}: {e}")
+            return None
+
+        self._bitget_intervals[symbol] = (interval, time.monotonic())
+        return interval
+
+    # ------------------- LOOKUPS -------------------
+
+    async def get_interval(self, symbol: str) -> Optional[str]:
+        """Funding interval of one symbol, Bitget history first and Binance fundingInfo as fallback"""
+        intervals = await self.get_intervals([symbol])
+        return intervals.get(symbol)
+
+    async def get_intervals(self, symbols: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Resolve a list of symbols with one fundingInfo download and bounded Bitget lookups"""
+        symbols = list(dict.fromkeys(symbols))
+        keys = {symbol: self.normalize_symbol(symbol) for symbol in symbols}
+        semaphore = asyncio.Semaphore(self.bitget_concurrency)
+
+        async def bitget_lookup(session, key):
+            async with semaphore:
+                return await self._fetch_bitget_interval(session, key)
+
+        async with aiohttp.ClientSession() as session:
+            await self._refresh_binance(session)
+            bitget_results = await asyncio.gather(
+                *[bitget_lookup(session, key) for key in keys.values()]
+            )
+
+        result = {}
+        for symbol, bitget_interval in zip(symbols, bitget_results):
+            result[symbol] = bitget_interval or self._binance_intervals.get(keys[symbol])
+        return result
+
+    async def get_exchange_intervals(self, exchange: str, symbols: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Intervals as one exchange publishes them (get_intervals merges both exchanges)"""
+        keys = list(dict.fromkeys(self.normalize_symbol(symbol) for symbol in symbols))
+        semaphore = asyncio.Semaphore(self.bitget_concurrency)
+
+        async def bitget_lookup(session, key):
+            async with semaphore:
+                return await self._fetch_bitget_interval(session, key)
+
+        async with aiohttp.ClientSession() as session:
+            if exchange == "binance":
+                await self._refresh_binance(session)
+                # fundingInfo only lists the symbols with an adjusted interval, the rest settle every 8h
+                return {key: self._binance_intervals.get(key, "8") for key in keys}
+            results = await asyncio.gather(*[bitget_lookup(session, key) for key in keys])
+        return dict(zip(keys, results))
+
+    def invalidate(self, symbol: Optional[str] = None) -> None:
+        """Drop one cached symbol, or everything if no symbol is given"""
+        if symbol is None:
+            self._bitget_intervals.clear()
+            self._binance_loaded_at = 0.0
+        else:
+            self._bitget_intervals.pop(self.normalize_symbol(symbol), None)
+
+
+funding_interval_cache = FundingIntervalCache()
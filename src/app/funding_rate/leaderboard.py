@@ -0,0 +1,145 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from src.app.redis_layer import (
+    redis_address, leaderboard_call, leaderboard_key, leaderboard_interval_key,
+    LEADERBOARD_SCRIPT, FUNDING_LEADERBOARD_EXCHANGES, FUNDING_LEADERBOARD_INTERVALS
+)
+from src.app.funding_rate.spread_scanner import FundingSpreadScanner, spread_scanner
+
+"""
+Keeps the Redis funding leaderboards (fr_leaderboard:{exchange}:{interval} sorted sets, see
+redis_layer) in step with the funding stream.
+
+Streamed changes are coalesced per symbol and written once per flush in a single pipeline, so a
+burst of updates costs one round trip and only the latest rate of each symbol is scored. Only
+the pod running the ingest receives changes, there is a single writer across replicas.
+Symbols an exchange stopped streaming for FUNDING_LEADERBOARD_STALE_SECONDS (delisted) are
+pruned from its boards.
+"""
+
+FUNDING_LEADERBOARD_FLUSH_SECONDS = float(os.getenv("FUNDING_LEADERBOARD_FLUSH_SECONDS", "1"))
+FUNDING_LEADERBOARD_STALE_SECONDS = float(os.getenv("FUNDING_LEADERBOARD_STALE_SECONDS", str(60 * 60)))
+FUNDING_LEADERBOARD_PRUNE_SECONDS = float(os.getenv("FUNDING_LEADERBOARD_PRUNE_SECONDS", str(10 * 60)))
+
+
+class FundingLeaderboardWriter:
+
+    def __init__(self, scanner: FundingSpreadScanner, client: Optional[aioredis.Redis] = None,
+                 flush_interval: float = FUNDING_LEADERBOARD_FLUSH_SECONDS, stale_after: float = FUNDING_LEADERBOARD_STALE_SECONDS,
+                 prune_interval: float = FUNDING_LEADERBOARD_PRUNE_SECONDS) -> None:
+        self.scanner = scanner
+        self.table = scanner.table
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after
+        self.prune_interval = prune_interval
+        if client is None:
+            host, port = redis_address()
+            client = aioredis.Redis(host=host, port=port, decode_responses=True)
+        self._redis = client
+        self._script = client.register_script(LEADERBOARD_SCRIPT)
+
+        self._pending: Dict[Tuple[str, str], float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._writing_since: Optional[float] = None
+        self._last_change = 0.0
+        self._last_prune = time.time()
+        self._counters = {"changes": 0, "written": 0, "flushes": 0, "pruned": 0, "redis_errors": 0}
+
+    def on_funding_change(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        """Funding ingest listener, rates are streamed as fractions and scored in percent"""
+        if exchange in FUNDING_LEADERBOARD_EXCHANGES and changed.get("funding_rate") is not None:
+            self._pending[(exchange, symbol)] = changed["funding_rate"]
+            self._counters["changes"] += 1
+            self._last_change = time.time()
+            if self._writing_since is None:
+                self._writing_since = self._last_change
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for (exchange, symbol), rate in pending.items():
+                    hours = self.scanner.interval_hours(exchange, symbol)
+                    keys, args = leaderboard_call(exchange, symbol, round(rate * 100, 6), f"{hours}h" if hours else None)
+                    await self._script(keys=keys, args=args, client=pipe)
+                await pipe.execute()
+        except Exception:
+            # Retried on the next flush, rates streamed meanwhile are newer and win
+            self._pending = {**pending, **self._pending}
+            raise
+        self._counters["written"] += len(pending)
+        self._counters["flushes"] += 1
+
+    async def prune(self) -> int:
+        """
+        Removes from the boards the symbols the exchange stopped streaming (delisted). Only once this
+        pod has been receiving the stream for a whole stale window, a follower or a fresh table would
+        see every symbol as stale.
+        """
+        now = time.time()
+        if self._writing_since is None or now - self._last_change > self.stale_after:
+            self._writing_since = None
+            return 0
+        if now - self._writing_since < self.stale_after:
+            return 0
+
+        removed = 0
+        for exchange in FUNDING_LEADERBOARD_EXCHANGES:
+            symbols, updated_at = self.table.column(exchange, "updated_at")
+            if not symbols:
+                continue
+            live = {symbol for symbol, at in zip(symbols, updated_at.tolist()) if at >= (now - self.stale_after) * 1000}
+            delisted = [symbol for symbol in await self._redis.zrange(leaderboard_key(exchange), 0, -1) if symbol not in live]
+            if not delisted:
+                continue
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for interval in ("all", *FUNDING_LEADERBOARD_INTERVALS):
+                    pipe.zrem(leaderboard_key(exchange, interval), *delisted)
+                pipe.hdel(leaderboard_interval_key(exchange), *delisted)
+                await pipe.execute()
+            print(f"Pruned {len(delisted)} delisted symbols from the {exchange} funding leaderboards")
+            removed += len(delisted)
+        self._counters["pruned"] += removed
+        return removed
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_prune >= self.prune_interval:
+                    self._last_prune = time.time()
+                    await self.prune()
+            except RedisError as e:
+                self._counters["redis_errors"] += 1
+                print(f"Funding leaderboard flush error: {e}")
+            except Exception as e:
+                print(f"Funding leaderboard writer error: {e}")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name="funding-leaderboard-flush")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except RedisError:
+            pass
+
+    def snapshot(self) -> dict:
+        return {"pending": len(self._pending), **self._counters}
+
+
+funding_leaderboard = FundingLeaderboardWriter(spread_scanner)
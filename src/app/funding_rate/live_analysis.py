@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from src.app.chart_analysis import FundingRateChart, LiveIndicatorBook
+from src.app.funding_rate.interval_cache import FundingIntervalCache
+from src.app.singleflight import SingleFlight
+
+# Followed symbols nobody read for this long are dropped, as are the least recently read beyond the cap
+LIVE_ANALYSIS_IDLE_SECONDS = float(os.getenv("LIVE_ANALYSIS_IDLE_SECONDS", str(6 * 60 * 60)))
+LIVE_ANALYSIS_MAX_SYMBOLS = int(os.getenv("LIVE_ANALYSIS_MAX_SYMBOLS", "200"))
+
+
+class LiveAnalysisMaterializer:
+    """
+    Keeps the "today" analysis of every followed symbol precomputed.
+
+    A symbol is followed once it has been materialized (first request computes it on demand).
+    After that it is recomputed in the background when one of its `trigger_intervals` candles
+    closes or when its funding settles (Bitget next funding time rolls over), at most once per
+    `min_interval` seconds, until it hasn't been read for `idle_ttl` seconds or more than
+    `max_symbols` symbols are followed (least recently read go first). Every result is stored
+    with a version and the `as_of` time it was computed for, so readers never wait for pandas
+    work. With an indicator book the result also
+    carries the streaming trend / volatility indicators of the symbol at that time.
+    """
+
+    def __init__(self, candle_source=None, concurrency: int = 4, min_interval: float = 30.0, trigger_intervals: Iterable[str] = ("15m", "1H"),
+                 indicators: Optional[LiveIndicatorBook] = None, idle_ttl: float = LIVE_ANALYSIS_IDLE_SECONDS,
+                 max_symbols: int = LIVE_ANALYSIS_MAX_SYMBOLS) -> None:
+        self.candle_source = candle_source
+        self.indicators = indicators
+        self.idle_ttl = idle_ttl
+        self.max_symbols = max_symbols
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.trigger_intervals = set(trigger_intervals)
+
+        self._results: Dict[str, dict] = {}
+        self._dirty: Dict[str, str] = {}  # symbol -> trigger
+        self._last_run: Dict[str, float] = {}
+        self._last_read: "OrderedDict[str, float]" = OrderedDict()  # least recently read first
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flights = SingleFlight("live-analysis")
+        self._counters = {"computed": 0, "on_demand": 0, "errors": 0, "triggers": 0, "evicted": 0}
+
+    # ------------------- FOLLOWED SYMBOLS -------------------
+
+    def _touch(self, symbol: str) -> None:
+        self._last_read[symbol] = time.monotonic()
+        self._last_read.move_to_end(symbol)
+        self._expire()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._last_read:
+            symbol, last_read = next(iter(self._last_read.items()))
+            if len(self._last_read) <= self.max_symbols and now - last_read < self.idle_ttl:
+                break
+            self._forget(symbol)
+
+    def _forget(self, symbol: str) -> None:
+        self._last_read.pop(symbol, None)
+        self._results.pop(symbol, None)
+        self._dirty.pop(symbol, None)
+        self._last_run.pop(symbol, None)
+        self._counters["evicted"] += 1
+
+    # ------------------- TRIGGERS -------------------
+
+    def mark_dirty(self, symbol: str, trigger: str) -> None:
+        if symbol not in self._results:
+            return  # never requested, nobody to serve
+        self._counters["triggers"] += 1
+        self._dirty[symbol] = trigger
+        self._wake.set()
+
+    def on_candle_close(self, symbol: str, interval: str, rows: np.ndarray) -> None:
+        """Candle ring close listener"""
+        if interval in self.trigger_intervals:
+            self.mark_dirty(symbol, f"candle:{interval}")
+
+    def on_funding_change(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        """Funding ingest listener, a new next_funding_time means the previous period settled"""
+        if exchange == "bitget" and "next_funding_time" in changed:
+            self.mark_dirty(symbol, "funding")
+
+    # ------------------- COMPUTE -------------------
+
+    async def _compute(self, symbol: str, trigger: str) -> Optional[dict]:
+        as_of = int(time.time() * 1000)
+        self._last_run[symbol] = time.monotonic()
+        try:
+            analysis = await FundingRateChart(symbol, candle_source=self.candle_source).set_analysis(as_of)
+        except Exception as e:
+            self._counters["errors"] += 1
+            print(f"Error materializing analysis for {symbol}: {e}")
+            return self._results.get(symbol)
+
+        previous = self._results.get(symbol)
+        result = {
+            "symbol": symbol,
+            "version": (previous["version"] + 1) if previous else 1,
+            "as_of": as_of,
+            "trigger": trigger,
+            "analysis": analysis,
+            "live_indicators": self.indicators.summary(symbol) if self.indicators is not None else None
+        }
+        self._counters["computed"] += 1
+        if symbol in self._last_read:  # not evicted while computing
+            self._results[symbol] = result
+        return result
+
+    async def get(self, symbol: str) -> Optional[dict]:
+        """Cached result, computed on demand only for symbols never materialized before"""
+        symbol = FundingIntervalCache.normalize_symbol(symbol)
+        self._touch(symbol)
+        result = self._results.get(symbol)
+        if result is not None:
+            return result
+        self._counters["on_demand"] += 1
+        return await self._flights.do(symbol, self._compute, symbol, "on-demand")
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def recompute(symbol: str, trigger: str) -> None:
+            async with semaphore:
+                await self._flights.do(symbol, self._compute, symbol, trigger)
+
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            self._expire()
+
+            now = time.monotonic()
+            ready = {
+                symbol: trigger for symbol, trigger in self._dirty.items()
+                if now - self._last_run.get(symbol, 0.0) >= self.min_interval
+            }
+            for symbol in ready:
+                del self._dirty[symbol]
+            if ready:
+                await asyncio.gather(*[recompute(symbol, trigger) for symbol, trigger in ready.items()])
+
+            # Symbols throttled by min_interval are picked up on a later pass
+            if self._dirty:
+                await asyncio.sleep(1)
+                self._wake.set()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="live-analysis-materializer")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "materialized": len(self._results),
+            "dirty": len(self._dirty),
+            **self._counters,
+            "versions": {symbol: {"version": r["version"], "as_of": r["as_of"], "trigger": r["trigger"]} for symbol, r in self._results.items()}
+        }
+
+
+async def main_testing():
+    materializer = LiveAnalysisMaterializer(min_interval=0)
+    await materializer.start()
+
+    first = await materializer.get("BTCUSDT"); print("on demand ->", first and {k: first[k] for k in ("version", "as_of", "trigger")})
+    materializer.on_candle_close("BTCUSDT", "15m", np.empty((0, 7)))
+    await asyncio.sleep(5)
+    second = await materializer.get("BTCUSDT"); print("after close ->", second and {k: second[k] for k in ("version", "as_of", "trigger")})
+    await materializer.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
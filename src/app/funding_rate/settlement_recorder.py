@@ -0,0 +1,62 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Set, Tuple
+
+from src.app.redis_layer import RedisService, FUNDING_SKETCH_EXCHANGES
+
+"""
+Feeds the per-symbol funding quantile sketches (redis_layer) from the funding stream.
+
+The stream only carries the predicted rate of the running period: when the next funding time
+of a symbol rolls forward, the last predicted rate is the one that just settled, and it is
+recorded for that exchange. Redis writes run in a small executor of their own: a write seeding
+a missing sketch blocks its thread on the history download, a settlement wave of hundreds of
+symbols never blocks the event loop nor the default pool `asyncio.to_thread` shares.
+"""
+
+SETTLEMENT_RECORDER_WORKERS = int(os.getenv("SETTLEMENT_RECORDER_WORKERS", "4"))
+
+
+class FundingSettlementRecorder:
+
+    def __init__(self, redis_service: RedisService, workers: int = SETTLEMENT_RECORDER_WORKERS) -> None:
+        self.redis_service = redis_service
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="settlement-recorder")
+        self._last: Dict[Tuple[str, str], Tuple[float, int]] = {}  # (exchange, symbol) -> (funding_rate, next_funding_time)
+        self._writes: Set[asyncio.Future] = set()
+        self._counters = {"settlements": 0, "recorded": 0, "skipped": 0, "errors": 0}
+
+    def on_funding_change(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        """Funding ingest listener"""
+        if exchange not in FUNDING_SKETCH_EXCHANGES:
+            return
+        rate, next_funding = self._last.get((exchange, symbol), (None, 0))
+        new_next_funding = int(changed.get("next_funding_time") or next_funding)
+
+        if rate is not None and next_funding and new_next_funding > next_funding:
+            self._counters["settlements"] += 1
+            write = asyncio.get_running_loop().run_in_executor(
+                self.executor, self.redis_service.record_funding_value, symbol, round(rate * 100, 6), next_funding, exchange
+            )
+            self._writes.add(write)
+            write.add_done_callback(lambda done: self._on_recorded(done, exchange, symbol, next_funding))
+        self._last[(exchange, symbol)] = (changed.get("funding_rate", rate), new_next_funding)
+
+    def _on_recorded(self, write: asyncio.Future, exchange: str, symbol: str, period_ts: int) -> None:
+        self._writes.discard(write)
+        if write.cancelled():
+            return
+        if write.exception() is not None:
+            self._counters["errors"] += 1
+            print(f"Error recording the {exchange} settlement of {symbol} at {period_ts}: {write.exception()}")
+        elif write.result():
+            self._counters["recorded"] += 1
+        else:
+            self._counters["skipped"] += 1  # already recorded, or the seed history was unavailable
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> dict:
+        return {"tracked": len(self._last), "in_flight": len(self._writes), **self._counters}
@@ -0,0 +1,267 @@
+import asyncio
+import heapq
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.app.funding_rate.interval_cache import FundingIntervalCache, funding_interval_cache
+from src.app.market_data.funding_stream import FundingTable, funding_table
+
+"""
+Cross-exchange funding spread scanner.
+
+The latest Binance and Bitget funding of every symbol live in aligned (n, 2) arrays, so the
+spread and annualized carry of the whole universe is one vectorized pass. Rates are normalized
+per hour with each side's own settlement interval (1h / 2h / 4h / 8h) before comparing. Top-k is
+served from a max-heap: every streamed update pushes a new versioned entry for its symbol and
+stale entries are dropped lazily when read; the periodic full rebuild compacts the heap.
+"""
+
+SPREAD_EXCHANGES = ("binance", "bitget")
+VALID_INTERVAL_HOURS = (1, 2, 4, 8)
+DEFAULT_INTERVAL_HOURS = 8.0
+HOURS_PER_YEAR = 24 * 365
+FUNDING_SPREAD_REBUILD_SECONDS = float(os.getenv("FUNDING_SPREAD_REBUILD_SECONDS", "5"))
+FUNDING_SPREAD_INTERVAL_REFRESH_SECONDS = float(os.getenv("FUNDING_SPREAD_INTERVAL_REFRESH_SECONDS", str(6 * 60 * 60)))
+
+
+def spread_metrics(rates: np.ndarray, interval_hours: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    rates, interval_hours: (n, 2) [binance, bitget], raw funding fraction per settlement.
+    Returns the hourly spread (bitget - binance) and the annualized carry in percent, NaN where a side is missing.
+    """
+    hourly = rates / interval_hours
+    spread = hourly[:, 1] - hourly[:, 0]
+    return spread, np.abs(spread) * HOURS_PER_YEAR * 100
+
+
+class FundingSpreadScanner:
+
+    def __init__(self, table: FundingTable, interval_cache: FundingIntervalCache, capacity: int = 1024) -> None:
+        self.table = table
+        self.interval_cache = interval_cache
+
+        self._index: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._allocate(capacity)
+
+        self._heap: List[Tuple[float, int, int]] = []  # (-carry, version, slot)
+        self._tasks: List[asyncio.Task] = []
+        self._counters = {"updates": 0, "rebuilds": 0, "stale_dropped": 0, "intervals_inferred": 0, "interval_refreshes": 0}
+
+    def _allocate(self, capacity: int) -> None:
+        self._rates = np.full((capacity, 2), np.nan)
+        self._intervals = np.full((capacity, 2), DEFAULT_INTERVAL_HOURS)
+        self._known = np.zeros((capacity, 2), dtype=bool)  # interval published or inferred, not the default
+        self._next_funding = np.zeros((capacity, 2), dtype=np.int64)
+        self._updated_at = np.zeros((capacity, 2), dtype=np.int64)
+        self._spread = np.full(capacity, np.nan)
+        self._carry = np.full(capacity, np.nan)
+        self._version = np.zeros(capacity, dtype=np.int64)
+
+    def _slot(self, symbol: str) -> int:
+        slot = self._index.get(symbol)
+        if slot is None:
+            slot = len(self._symbols)
+            if slot >= len(self._rates):
+                previous = (self._rates, self._intervals, self._known, self._next_funding, self._updated_at, self._spread, self._carry, self._version)
+                self._allocate(len(self._rates) * 2)
+                for current, old in zip((self._rates, self._intervals, self._known, self._next_funding, self._updated_at, self._spread, self._carry, self._version), previous):
+                    current[:slot] = old
+            self._index[symbol] = slot
+            self._symbols.append(symbol)
+        return slot
+
+    def _infer_intervals(self, slots: np.ndarray, column: int, next_funding: np.ndarray) -> None:
+        """A rolled next funding time gives the exact interval: new - previous settlement"""
+        previous = self._next_funding[slots, column]
+        hours = np.round((next_funding - previous) / 3_600_000)
+        rolled = (previous > 0) & (next_funding > previous) & np.isin(hours, VALID_INTERVAL_HOURS)
+        self._intervals[slots[rolled], column] = hours[rolled]
+        self._known[slots[rolled], column] = True
+        self._counters["intervals_inferred"] += int(rolled.sum())
+
+    # ------------------- INCREMENTAL -------------------
+
+    def update(self, exchange: str, symbol: str, funding_rate: Optional[float] = None,
+               next_funding_time: Optional[int] = None, updated_at: Optional[int] = None) -> None:
+        column = SPREAD_EXCHANGES.index(exchange)
+        slot = self._slot(FundingIntervalCache.normalize_symbol(symbol))
+        if next_funding_time:
+            self._infer_intervals(np.array([slot]), column, np.array([next_funding_time]))
+            self._next_funding[slot, column] = next_funding_time
+        if funding_rate is not None:
+            self._rates[slot, column] = funding_rate
+        self._updated_at[slot, column] = updated_at or int(time.time() * 1000)
+
+        spread, carry = spread_metrics(self._rates[slot:slot + 1], self._intervals[slot:slot + 1])
+        self._spread[slot], self._carry[slot] = spread[0], carry[0]
+        self._version[slot] += 1
+        if not np.isnan(carry[0]):
+            heapq.heappush(self._heap, (-float(carry[0]), int(self._version[slot]), slot))
+        self._counters["updates"] += 1
+
+    def on_funding_change(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        """Funding ingest listener"""
+        if exchange in SPREAD_EXCHANGES and ("funding_rate" in changed or "next_funding_time" in changed):
+            self.update(exchange, symbol, changed.get("funding_rate"), changed.get("next_funding_time"))
+
+    # ------------------- FULL PASS -------------------
+
+    def rebuild(self) -> None:
+        """Reload both exchanges from the funding table, recompute the whole universe and compact the heap"""
+        for column, exchange in enumerate(SPREAD_EXCHANGES):
+            symbols, rates = self.table.column(exchange, "funding_rate")
+            if not symbols:
+                continue
+            _, next_funding = self.table.column(exchange, "next_funding_time")
+            _, updated_at = self.table.column(exchange, "updated_at")
+            slots = np.array([self._slot(symbol) for symbol in symbols])
+
+            has_next = next_funding > 0
+            self._infer_intervals(slots[has_next], column, next_funding[has_next])
+            self._next_funding[slots[has_next], column] = next_funding[has_next]
+            self._rates[slots, column] = rates
+            self._updated_at[slots, column] = updated_at
+
+        n = len(self._symbols)
+        self._spread[:n], self._carry[:n] = spread_metrics(self._rates[:n], self._intervals[:n])
+        self._version[:n] += 1
+        valid = np.flatnonzero(~np.isnan(self._carry[:n]))
+        self._heap = list(zip((-self._carry[valid]).tolist(), self._version[valid].tolist(), valid.tolist()))
+        heapq.heapify(self._heap)
+        self._counters["rebuilds"] += 1
+
+    async def refresh_intervals(self) -> None:
+        """Published intervals for every known symbol, rolled next funding times refine them later"""
+        for column, exchange in enumerate(SPREAD_EXCHANGES):
+            symbols = self.table.symbols(exchange)
+            if not symbols:
+                continue
+            intervals = await self.interval_cache.get_exchange_intervals(exchange, symbols)
+            for symbol, interval in intervals.items():
+                if interval and float(interval) in VALID_INTERVAL_HOURS:
+                    slot = self._slot(symbol)
+                    self._intervals[slot, column] = float(interval)
+                    self._known[slot, column] = True
+        self._counters["interval_refreshes"] += 1
+        self.rebuild()
+
+    # ------------------- READ -------------------
+
+    def row(self, slot: int) -> dict:
+        spread = self._spread[slot]
+        return {
+            "symbol": self._symbols[slot],
+            **{
+                exchange: {
+                    "funding_rate": round(float(self._rates[slot, column]) * 100, 6),
+                    "interval_hours": int(self._intervals[slot, column]) if self._known[slot, column] else None,
+                    "next_funding_time": int(self._next_funding[slot, column]) or None
+                }
+                for column, exchange in enumerate(SPREAD_EXCHANGES)
+            },
+            "spread_8h": round(float(spread) * 8 * 100, 6),
+            "annualized_carry": round(float(self._carry[slot]), 4),
+            "direction": "short bitget / long binance" if spread > 0 else "short binance / long bitget",
+            "updated_at": int(self._updated_at[slot].max())
+        }
+
+    def top(self, k: int = 20, min_carry: float = 0.0) -> List[dict]:
+        """The k widest spreads, stale heap entries are discarded as they surface"""
+        result, keep = [], []
+        while self._heap and len(result) < k:
+            entry = heapq.heappop(self._heap)
+            negative_carry, version, slot = entry
+            if version != self._version[slot]:
+                self._counters["stale_dropped"] += 1
+                continue
+            if -negative_carry < min_carry:
+                keep.append(entry)
+                break
+            keep.append(entry)
+            result.append(self.row(slot))
+        for entry in keep:
+            heapq.heappush(self._heap, entry)
+        return result
+
+    def interval_hours(self, exchange: str, symbol: str) -> Optional[int]:
+        """Funding interval of one side of a symbol, None until published or inferred (the 8h default isn't reported)"""
+        slot = self._index.get(FundingIntervalCache.normalize_symbol(symbol))
+        if slot is None or not self._known[slot, SPREAD_EXCHANGES.index(exchange)]:
+            return None
+        return int(self._intervals[slot, SPREAD_EXCHANGES.index(exchange)])
+
+    def get(self, symbol: str) -> Optional[dict]:
+        slot = self._index.get(FundingIntervalCache.normalize_symbol(symbol))
+        if slot is None or np.isnan(self._carry[slot]):
+            return None
+        return self.row(slot)
+
+    # ------------------- LIFECYCLE -------------------
+
+    async def _rebuild_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FUNDING_SPREAD_REBUILD_SECONDS)
+            try:
+                self.rebuild()
+            except Exception as e:
+                print(f"Error rebuilding the funding spreads: {e}")
+
+    async def _interval_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh_intervals()
+            except Exception as e:
+                print(f"Error refreshing funding intervals for the spread scanner: {e}")
+            await asyncio.sleep(FUNDING_SPREAD_INTERVAL_REFRESH_SECONDS)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self.rebuild()
+        self._tasks = [
+            asyncio.create_task(self._rebuild_loop(), name="funding-spread-rebuild"),
+            asyncio.create_task(self._interval_loop(), name="funding-spread-intervals")
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self) -> dict:
+        n = len(self._symbols)
+        return {
+            "symbols": n,
+            "quoted_on_both": int((~np.isnan(self._carry[:n])).sum()),
+            "heap_entries": len(self._heap),
+            **self._counters
+        }
+
+
+spread_scanner = FundingSpreadScanner(funding_table, funding_interval_cache)
+
+
+async def main_testing():
+    table = FundingTable()
+    scanner = FundingSpreadScanner(table, funding_interval_cache)
+    rng = np.random.default_rng(1)
+    for i in range(500):
+        for exchange in SPREAD_EXCHANGES:
+            table.update(exchange, f"C{i}USDT", funding_rate=float(rng.normal(0, 0.0005)), next_funding_time=1_700_000_000_000)
+    scanner.rebuild()
+    for _ in range(2000):
+        symbol, exchange = f"C{rng.integers(500)}USDT", SPREAD_EXCHANGES[rng.integers(2)]
+        scanner.on_funding_change(exchange, symbol, table.update(exchange, symbol, funding_rate=float(rng.normal(0, 0.0005))))
+
+    started = time.perf_counter()
+    best = scanner.top(5)
+    print(f"top 5 in {1000 * (time.perf_counter() - started):.3f} ms ->", [(row["symbol"], row["annualized_carry"]) for row in best])
+    print("metrics ->", scanner.snapshot())
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
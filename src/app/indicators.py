@@ -0,0 +1,222 @@
+import math
+from collections import deque
+from typing import Deque, Dict, Optional
+
+"""
+Streaming indicators.
+
+Every indicator consumes one value per closed candle in O(1) and can be serialized with
+`get_state()` / rebuilt with `from_state()`, so live analysis survives restarts without
+re-downloading history. Values are None until the indicator has enough samples, which mirrors
+the NaN a pandas rolling window gives for the same prefix.
+"""
+
+
+class RollingSMA:
+    """Simple moving average over the last `window` values"""
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._values: Deque[float] = deque(maxlen=window)
+        self._sum = 0.0
+
+    def update(self, value: float) -> Optional[float]:
+        if len(self._values) == self.window:
+            self._sum -= self._values[0]
+        self._values.append(value)
+        self._sum += value
+        return self.value
+
+    @property
+    def value(self) -> Optional[float]:
+        if len(self._values) < self.window:
+            return None
+        return self._sum / self.window
+
+    def get_state(self) -> dict:
+        return {"window": self.window, "values": list(self._values)}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "RollingSMA":
+        indicator = cls(state["window"])
+        for value in state["values"]:
+            indicator.update(value)
+        return indicator
+
+
+class EMA:
+    """Exponential moving average, alpha = 2 / (span + 1), seeded with the first value"""
+
+    def __init__(self, span: int) -> None:
+        self.span = span
+        self.alpha = 2.0 / (span + 1)
+        self._value: Optional[float] = None
+        self.count = 0
+
+    def update(self, value: float) -> float:
+        self._value = value if self._value is None else self._value + self.alpha * (value - self._value)
+        self.count += 1
+        return self._value
+
+    @property
+    def value(self) -> Optional[float]:
+        return self._value
+
+    def get_state(self) -> dict:
+        return {"span": self.span, "value": self._value, "count": self.count}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "EMA":
+        indicator = cls(state["span"])
+        indicator._value = state["value"]
+        indicator.count = state["count"]
+        return indicator
+
+
+class RollingWelford:
+    """
+    Windowed mean / sample variance (Welford with removal). Matches pandas `.std()` (ddof=1)
+    over the same values.
+    """
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._values: Deque[float] = deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value: float) -> Optional[float]:
+        if len(self._values) == self.window:
+            self._remove(self._values.popleft())
+        self._values.append(value)
+        n = len(self._values)
+        delta = value - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (value - self._mean)
+        return self.std
+
+    def _remove(self, value: float) -> None:
+        n = len(self._values)
+        if n == 0:
+            self._mean, self._m2 = 0.0, 0.0
+            return
+        old_mean = self._mean
+        self._mean = (old_mean * (n + 1) - value) / n
+        self._m2 -= (value - old_mean) * (value - self._mean)
+        self._m2 = max(self._m2, 0.0)
+
+    @property
+    def count(self) -> int:
+        return len(self._values)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self._mean if self._values else None
+
+    @property
+    def variance(self) -> Optional[float]:
+        if len(self._values) < 2:
+            return None
+        return self._m2 / (len(self._values) - 1)
+
+    @property
+    def std(self) -> Optional[float]:
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+    def get_state(self) -> dict:
+        return {"window": self.window, "values": list(self._values)}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "RollingWelford":
+        # Replaying the window rebuilds mean / m2 exactly (no drift carried across restarts)
+        indicator = cls(state["window"])
+        for value in state["values"]:
+            indicator.update(value)
+        return indicator
+
+
+class WilderRSI:
+    """RSI with Wilder smoothing: SMA of the first `period` gains/losses, then avg = (avg*(p-1) + x) / p"""
+
+    def __init__(self, period: int = 14) -> None:
+        self.period = period
+        self._last: Optional[float] = None
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self._samples = 0
+
+    def update(self, price: float) -> Optional[float]:
+        if self._last is not None:
+            change = price - self._last
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self._samples += 1
+            if self._samples <= self.period:
+                self._avg_gain += gain / self.period
+                self._avg_loss += loss / self.period
+            else:
+                self._avg_gain = (self._avg_gain * (self.period - 1) + gain) / self.period
+                self._avg_loss = (self._avg_loss * (self.period - 1) + loss) / self.period
+        self._last = price
+        return self.value
+
+    @property
+    def value(self) -> Optional[float]:
+        if self._samples < self.period:
+            return None
+        if self._avg_loss == 0:
+            return 100.0
+        return 100.0 - 100.0 / (1.0 + self._avg_gain / self._avg_loss)
+
+    def get_state(self) -> dict:
+        return {
+            "period": self.period, "last": self._last, "avg_gain": self._avg_gain,
+            "avg_loss": self._avg_loss, "samples": self._samples
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "WilderRSI":
+        indicator = cls(state["period"])
+        indicator._last = state["last"]
+        indicator._avg_gain = state["avg_gain"]
+        indicator._avg_loss = state["avg_loss"]
+        indicator._samples = state["samples"]
+        return indicator
+
+
+class ReturnTracker:
+    """Previous close -> percent change and log return of the next one"""
+
+    def __init__(self) -> None:
+        self.last: Optional[float] = None
+
+    def update(self, price: float):
+        """(pct_change * 100, log_return), both None for the first price"""
+        previous, self.last = self.last, price
+        if previous is None or previous <= 0 or price <= 0:
+            return None, None
+        return (price / previous - 1.0) * 100, math.log(price / previous)
+
+    def get_state(self) -> dict:
+        return {"last": self.last}
+
+    @classmethod
+    def from_state(cls, state: dict) -> "ReturnTracker":
+        tracker = cls()
+        tracker.last = state["last"]
+        return tracker
+
+
+INDICATOR_TYPES = {
+    "sma": RollingSMA, "ema": EMA, "welford": RollingWelford, "rsi": WilderRSI, "returns": ReturnTracker
+}
+
+
+def dump_indicators(indicators: Dict[str, object]) -> dict:
+    """{name: indicator} -> JSON-serializable state"""
+    kinds = {cls: kind for kind, cls in INDICATOR_TYPES.items()}
+    return {name: {"type": kinds[type(indicator)], "state": indicator.get_state()} for name, indicator in indicators.items()}
+
+
+def load_indicators(state: dict) -> Dict[str, object]:
+    return {name: INDICATOR_TYPES[entry["type"]].from_state(entry["state"]) for name, entry in state.items()}
@@ -0,0 +1,142 @@
+import struct
+import zlib
+import numpy as np
+from typing import Dict, Tuple
+
+from src.app.market_data.candles import CANDLE_COLUMNS
+
+"""
+Compact encoding for blocks of fixed-interval candles.
+
+Timestamps are stored as (start, step, count) plus, only when the series has holes, the
+delta-encoded slot indexes. Price/volume columns are stored either as scaled integers (exact
+decimal prices) delta + zigzag encoded, or as the XOR of consecutive float64 bit patterns
+when no exact decimal scale exists. Both are byte-shuffled (same-significance bytes together)
+and deflated. Decoding is a handful of vectorized NumPy passes per column.
+"""
+
+MAGIC = b"CBK1"
+HEADER = struct.Struct("<4sBBIqq")  # magic, width, flags, count, start, step
+COLUMN_HEADER = struct.Struct("<BbI")  # encoding, decimals, payload length
+
+FLAG_REGULAR = 1
+ENCODING_SCALED_DELTA = 0
+ENCODING_XOR = 1
+MAX_DECIMALS = 10
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    """(n,) 8-byte values -> byte planes, compresses far better than the raw layout"""
+    return values.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(payload: bytes, count: int, dtype) -> np.ndarray:
+    planes = np.frombuffer(payload, dtype=np.uint8).reshape(8, count)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(count)
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    values = values.view(np.uint64)
+    return ((values >> np.uint64(1)).view(np.int64)) ^ -((values & np.uint64(1)).view(np.int64))
+
+
+def _find_decimals(column: np.ndarray) -> int:
+    """Smallest number of decimals that round-trips the column exactly, -1 if there is none"""
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        scaled = np.round(column * scale)
+        if np.abs(scaled).max(initial=0) >= 2 ** 53:
+            return -1
+        if np.array_equal(scaled / scale, column):
+            return decimals
+    return -1
+
+
+def _delta_encode(values: np.ndarray) -> bytes:
+    deltas = np.diff(values, prepend=np.int64(0))
+    return zlib.compress(_shuffle(_zigzag(deltas)), 6)
+
+
+def _delta_decode(payload: bytes, count: int) -> np.ndarray:
+    deltas = _unzigzag(_unshuffle(zlib.decompress(payload), count, np.uint64))
+    return np.cumsum(deltas, dtype=np.int64)
+
+
+def _encode_column(column: np.ndarray) -> Tuple[int, int, bytes]:
+    decimals = _find_decimals(column)
+    if decimals >= 0:
+        scaled = np.round(column * 10.0 ** decimals).astype(np.int64)
+        return ENCODING_SCALED_DELTA, decimals, _delta_encode(scaled)
+
+    bits = np.ascontiguousarray(column, dtype=np.float64).view(np.uint64)
+    xored = bits ^ np.concatenate([[np.uint64(0)], bits[:-1]])
+    return ENCODING_XOR, -1, zlib.compress(_shuffle(xored), 6)
+
+
+def _decode_column(encoding: int, decimals: int, payload: bytes, count: int) -> np.ndarray:
+    if encoding == ENCODING_SCALED_DELTA:
+        return _delta_decode(payload, count) / 10.0 ** decimals
+    xored = _unshuffle(zlib.decompress(payload), count, np.uint64)
+    return np.bitwise_xor.accumulate(xored).view(np.float64)
+
+
+def encode_block(rows: np.ndarray, step_ms: int) -> bytes:
+    """(n, width) candles sorted by timestamp -> compressed block"""
+    count, width = rows.shape
+    timestamps = rows[:, 0].astype(np.int64)
+    start = int(timestamps[0]) if count else 0
+
+    slots = (timestamps - start) // step_ms if count else np.empty(0, dtype=np.int64)
+    regular = bool(count == 0 or (slots[-1] == count - 1 and np.all((timestamps - start) % step_ms == 0)))
+
+    parts = [HEADER.pack(MAGIC, width, FLAG_REGULAR if regular else 0, count, start, step_ms)]
+    if not regular:
+        # Holes or off-grid candles: keep the exact offsets from start
+        payload = _delta_encode(timestamps - start)
+        parts.append(struct.pack("<I", len(payload)) + payload)
+
+    for index in range(1, width):
+        encoding, decimals, payload = _encode_column(np.ascontiguousarray(rows[:, index], dtype=np.float64))
+        parts.append(COLUMN_HEADER.pack(encoding, decimals, len(payload)) + payload)
+
+    return b"".join(parts)
+
+
+def decode_columns(block: bytes) -> Dict[str, np.ndarray]:
+    """Compressed block -> {column: array}"""
+    magic, width, flags, count, start, step = HEADER.unpack_from(block, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a candle block")
+    offset = HEADER.size
+
+    if flags & FLAG_REGULAR:
+        timestamps = start + step * np.arange(count, dtype=np.int64)
+    else:
+        (length,) = struct.unpack_from("<I", block, offset)
+        offset += 4
+        timestamps = start + _delta_decode(block[offset:offset + length], count)
+        offset += length
+
+    columns = {CANDLE_COLUMNS[0]: timestamps}
+    for index in range(1, width):
+        encoding, decimals, length = COLUMN_HEADER.unpack_from(block, offset)
+        offset += COLUMN_HEADER.size
+        columns[CANDLE_COLUMNS[index]] = _decode_column(encoding, decimals, block[offset:offset + length], count)
+        offset += length
+    return columns
+
+
+def decode_block(block: bytes) -> np.ndarray:
+    """Compressed block -> (n, width) float64 candles"""
+    columns = decode_columns(block)
+    return np.column_stack(list(columns.values())).astype(np.float64)
+
+
+def block_info(block: bytes) -> Tuple[int, int, int, int]:
+    """(width, count, start, step) without decoding the block"""
+    _, width, _, count, start, step = HEADER.unpack_from(block, 0)
+    return width, count, start, step
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from src.app.market_data.candles import BITGET_CANDLE_WIDTH, empty_candles
+from src.app.market_data.funding_stream import ExchangeFeed, BITGET_STREAM_URL, BITGET_WS_SEND_INTERVAL_SECONDS
+
+"""
+Rolling in-memory candles.
+
+Each tracked (symbol, interval) owns a fixed-size ring indexed by time: candle `ts` lives in slot
+(ts // step) % capacity, so appends, live-candle overwrites and window reads are plain NumPy
+indexing and memory per symbol is fixed by RING_CAPACITY. Rings are kept current by the Bitget
+candle WebSocket channels and by periodic incremental REST top-ups, and `RingCandleSource` serves
+`get_candlestick_chart` from them, only going to the fallback (REST / candle store) for windows
+the ring does not hold.
+"""
+
+# Candles kept per interval: 1 day of 1m, 1 week of 15m, 2 weeks of 1H, 30 days of 4H
+RING_CAPACITY = {"1m": 1440, "15m": 672, "1H": 336, "4H": 180}
+RING_STEP_MS = {"1m": 60_000, "15m": 900_000, "1H": 3_600_000, "4H": 14_400_000}
+CANDLE_RING_MAX_SYMBOLS = int(os.getenv("CANDLE_RING_MAX_SYMBOLS", "200"))
+CANDLE_RING_TOP_UP_SECONDS = float(os.getenv("CANDLE_RING_TOP_UP_SECONDS", "60"))
+
+
+class CandleRing:
+    def __init__(self, capacity: int, step_ms: int, width: int = BITGET_CANDLE_WIDTH) -> None:
+        self.capacity = capacity
+        self.step_ms = step_ms
+        self.width = width
+        self._data = np.full((capacity, width), np.nan)
+        self.latest_ts: Optional[int] = None
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def oldest_ts(self) -> Optional[int]:
+        """Oldest open time the ring can still hold"""
+        if self.latest_ts is None:
+            return None
+        return self.latest_ts - (self.capacity - 1) * self.step_ms
+
+    def append(self, rows: np.ndarray) -> int:
+        """Write candles (new ones, or newer versions of the live candle), returns how many were kept"""
+        if not len(rows):
+            return 0
+        rows = rows[np.argsort(rows[:, 0], kind="stable")]
+        newest = int(rows[-1, 0])
+        if self.latest_ts is not None and newest < self.latest_ts - (self.capacity - 1) * self.step_ms:
+            return 0
+
+        latest = max(newest, self.latest_ts or newest)
+        rows = rows[rows[:, 0] > latest - self.capacity * self.step_ms]
+        slots = (rows[:, 0].astype(np.int64) // self.step_ms) % self.capacity
+        # Sorted input: for repeated slots the last (newest) row is the one that sticks
+        self._data[slots] = rows[:, :self.width]
+        self.latest_ts = latest
+        return len(rows)
+
+    def _expected(self, start: int, end: int) -> np.ndarray:
+        first = -(-start // self.step_ms) * self.step_ms
+        return np.arange(first, end + 1, self.step_ms, dtype=np.int64)
+
+    def window(self, start: int, end: int) -> np.ndarray:
+        """Candles with open time in [start, end], missing slots are skipped"""
+        if self.latest_ts is None:
+            return empty_candles(self.width)
+        expected = self._expected(max(start, self.oldest_ts()), min(end, self.latest_ts))
+        rows = self._data[(expected // self.step_ms) % self.capacity]
+        return rows[rows[:, 0] == expected].copy()
+
+    def covers(self, start: int, end: int, now: Optional[int] = None) -> bool:
+        """True if every candle of [start, min(end, now)] is in the ring"""
+        if self.latest_ts is None or start < self.oldest_ts():
+            return False
+        now = now if now is not None else int(time.time() * 1000)
+        last_open = (min(end, now) // self.step_ms) * self.step_ms
+        if last_open > self.latest_ts:
+            return False
+        expected = self._expected(start, last_open)
+        rows = self._data[(expected // self.step_ms) % self.capacity]
+        return bool(np.all(rows[:, 0] == expected))
+
+
+class CandleRingRegistry:
+    """
+    Rings per tracked symbol. Tracking is LRU bounded by `max_symbols`, so total memory is
+    max_symbols * sum(RING_CAPACITY) * width * 8 bytes (about 150 KB per symbol).
+    """
+
+    def __init__(self, max_symbols: int = CANDLE_RING_MAX_SYMBOLS) -> None:
+        self.max_symbols = max_symbols
+        self._rings: "OrderedDict[str, Dict[str, CandleRing]]" = OrderedDict()
+        self.listeners = []  # listener(symbol, tracked) when a symbol starts / stops being tracked
+        self.close_listeners = []  # listener(symbol, interval, closed_rows) on candle close
+
+    @staticmethod
+    def supports(interval: str) -> bool:
+        return interval in RING_CAPACITY
+
+    def track(self, symbol: str) -> Dict[str, CandleRing]:
+        if symbol in self._rings:
+            self._rings.move_to_end(symbol)
+            return self._rings[symbol]
+
+        self._rings[symbol] = {interval: CandleRing(capacity, RING_STEP_MS[interval]) for interval, capacity in RING_CAPACITY.items()}
+        for listener in self.listeners:
+            listener(symbol, True)
+
+        while len(self._rings) > self.max_symbols:
+            evicted, _ = self._rings.popitem(last=False)
+            for listener in self.listeners:
+                listener(evicted, False)
+        return self._rings[symbol]
+
+    def get(self, symbol: str, interval: str) -> Optional[CandleRing]:
+        rings = self._rings.get(symbol)
+        return rings.get(interval) if rings else None
+
+    def symbols(self) -> List[str]:
+        return list(self._rings)
+
+    def append(self, symbol: str, interval: str, rows: np.ndarray) -> int:
+        """Write into the ring and report the candles that closed because a newer one arrived"""
+        ring = self.get(symbol, interval)
+        if ring is None:
+            return 0
+        previous = ring.latest_ts
+        kept = ring.append(rows)
+        if self.close_listeners and ring.latest_ts is not None and ring.latest_ts != previous:
+            start = ring.oldest_ts() if previous is None else previous
+            closed = ring.window(start, ring.latest_ts - ring.step_ms)
+            if len(closed):
+                for listener in self.close_listeners:
+                    listener(symbol, interval, closed)
+        return kept
+
+    def snapshot(self) -> dict:
+        return {
+            "symbols": len(self._rings),
+            "max_symbols": self.max_symbols,
+            "bytes": sum(ring.nbytes for rings in self._rings.values() for ring in rings.values()),
+            "latest": {
+                symbol: {interval: ring.latest_ts for interval, ring in rings.items()}
+                for symbol, rings in self._rings.items()
+            }
+        }
+
+
+class BitgetCandleFeed(ExchangeFeed):
+    """`candle1m` / `candle15m` / `candle1H` / `candle4H` channels of every tracked symbol"""
+
+    exchange = "bitget-candles"
+    send_interval = BITGET_WS_SEND_INTERVAL_SECONDS
+
+    def __init__(self, registry: CandleRingRegistry, url: str = BITGET_STREAM_URL, batch_size: int = 50, ping_interval: float = 25.0, **kwargs) -> None:
+        super().__init__(url, None, **kwargs)
+        self.registry = registry
+        self.batch_size = batch_size
+        self.ping_interval = ping_interval
+        self._sends: Set[asyncio.Task] = set()
+        registry.listeners.append(self._on_track)
+
+    def _messages(self, op: str, symbols: Iterable[str]) -> List[str]:
+        args = [
+            {"instType": "USDT-FUTURES", "channel": f"candle{interval}", "instId": symbol}
+            for symbol in symbols for interval in RING_CAPACITY
+        ]
+        return [json.dumps({"op": op, "args": args[i:i + self.batch_size]}) for i in range(0, len(args), self.batch_size)]
+
+    async def subscriptions(self) -> List[str]:
+        return self._messages("subscribe", self.registry.symbols())
+
+    def _on_track(self, symbol: str, tracked: bool) -> None:
+        if self._ws is None:
+            return  # picked up by subscriptions() on the next connect
+        op = "subscribe" if tracked else "unsubscribe"
+        for message in self._messages(op, [symbol]):
+            task = asyncio.ensure_future(self.send(message))
+            self._sends.add(task)
+            task.add_done_callback(self._on_sent)
+
+    def _on_sent(self, task: asyncio.Task) -> None:
+        self._sends.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # The next connect resubscribes every tracked symbol through subscriptions()
+            self._stats["errors"] += 1
+            print(f"Error sending a candle subscription change: {task.exception()}")
+
+    async def keepalive(self, ws) -> None:
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await self._paced_send(ws, "ping")
+
+    def handle(self, message: str) -> None:
+        self._stats["messages"] += 1
+        self._stats["last_message_at"] = int(time.time() * 1000)
+        if message == "pong":
+            return
+        data = json.loads(message)
+        arg = data.get("arg") or {}
+        channel = arg.get("channel", "")
+        if not channel.startswith("candle") or not data.get("data"):
+            return
+        rows = np.array([row[:BITGET_CANDLE_WIDTH] for row in data["data"]], dtype=np.float64)
+        self._stats["updates"] += self.registry.append(arg.get("instId"), channel[len("candle"):], rows)
+
+
+class RingCandleSource:
+    """
+    Drop-in for `CryptoDataService.get_candlestick_chart`: windows held by the rings are served
+    from memory, anything else goes to `fallback` and what it returns is folded into the ring.
+    """
+
+    def __init__(self, fallback, registry: CandleRingRegistry, feed: Optional[BitgetCandleFeed] = None) -> None:
+        self.fallback = fallback
+        self.registry = registry
+        self.feed = feed
+        self._counters = {"hits": 0, "misses": 0, "top_ups": 0}
+        self._tasks: List[asyncio.Task] = []
+
+    async def get_candlestick_chart(self, symbol: str, granularity: str, start_time: int = None, end_time: int = None) -> np.ndarray:
+        if not self.registry.supports(granularity) or start_time is None or end_time is None:
+            return await self.fallback.get_candlestick_chart(symbol, granularity, start_time=start_time, end_time=end_time)
+
+        ring = self.registry.track(symbol)[granularity]
+        if ring.covers(start_time, end_time):
+            self._counters["hits"] += 1
+            return ring.window(start_time, end_time)
+
+        self._counters["misses"] += 1
+        # Seed the whole ring span on a cold ring so the next windows are hits
+        if ring.latest_ts is None:
+            now = int(time.time() * 1000)
+            seed_start = (now // ring.step_ms - ring.capacity + 1) * ring.step_ms
+            self.registry.append(symbol, granularity, await self.fallback.get_candlestick_chart(symbol, granularity, start_time=seed_start, end_time=now))
+            if ring.covers(start_time, end_time):
+                return ring.window(start_time, end_time)
+
+        data = await self.fallback.get_candlestick_chart(symbol, granularity, start_time=start_time, end_time=end_time)
+        self.registry.append(symbol, granularity, data)
+        return data
+
+    async def top_up(self) -> None:
+        """Incremental REST refresh: only the candles after each ring's latest one"""
+        now = int(time.time() * 1000)
+        for symbol in self.registry.symbols():
+            for interval in RING_CAPACITY:
+                ring = self.registry.get(symbol, interval)
+                if ring is None or ring.latest_ts is None:
+                    continue
+                try:
+                    rows = await self.fallback.get_candlestick_chart(symbol, interval, start_time=ring.latest_ts, end_time=now)
+                    self.registry.append(symbol, interval, rows)
+                    self._counters["top_ups"] += 1
+                except Exception as e:
+                    print(f"Error topping up {symbol} {interval} candles: {e}")
+
+    async def _top_up_loop(self, seconds: float) -> None:
+        while True:
+            await asyncio.sleep(seconds)
+            await self.top_up()
+
+    async def start(self, seconds: float = CANDLE_RING_TOP_UP_SECONDS) -> None:
+        """REST top-ups, plus the live kline stream when a feed is attached"""
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._top_up_loop(seconds), name="candle-ring-top-up"))
+        if self.feed is not None:
+            self._tasks.append(asyncio.create_task(self.feed.run(), name="candle-ring-stream"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self) -> dict:
+        return {
+            **self._counters,
+            "stream": self.feed.snapshot() if self.feed is not None else None,
+            **self.registry.snapshot()
+        }
+
+
+candle_rings = CandleRingRegistry()
+candle_feed = BitgetCandleFeed(candle_rings)
+
+
+async def main_testing():
+    class FakeFallback:
+        calls = 0
+
+        async def get_candlestick_chart(self, symbol, granularity, start_time=None, end_time=None):
+            FakeFallback.calls += 1
+            step = RING_STEP_MS[granularity]
+            ts = np.arange(-(-start_time // step) * step, end_time + 1, step)
+            return np.column_stack([ts] + [np.full(len(ts), float(i)) for i in range(1, BITGET_CANDLE_WIDTH)])
+
+    registry = CandleRingRegistry(max_symbols=2)
+    source = RingCandleSource(FakeFallback(), registry)
+    now = int(time.time() * 1000)
+
+    for _ in range(3):
+        started = time.perf_counter()
+        data = await source.get_candlestick_chart("BTCUSDT", "15m", start_time=now - 24 * 3600 * 1000, end_time=now)
+        print(f"15m rows -> {len(data)}, fallback calls -> {FakeFallback.calls}, {1000 * (time.perf_counter() - started):.2f} ms")
+
+    for symbol in ("ETHUSDT", "SOLUSDT"):
+        await source.get_candlestick_chart(symbol, "1H", start_time=now - 3600 * 1000, end_time=now)
+    print("tracked ->", registry.symbols(), "bytes ->", registry.snapshot()["bytes"])
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
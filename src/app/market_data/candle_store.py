@@ -0,0 +1,414 @@
+import asyncio
+import json
+import os
+import time
+import numpy as np
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.app.market_data.candles import CANDLE_COLUMNS, empty_candles
+from src.app.market_data.candle_codec import encode_block, decode_block, decode_columns
+
+try:
+    import fcntl  # advisory lock shared by every worker process writing the store
+except ImportError:
+    fcntl = None
+
+"""
+Local columnar candle store.
+
+One partition per (exchange, symbol, interval). Every write adds an immutable segment holding
+only the new rows (one .npy file per column, opened memory mapped), the manifest lists the
+segments and which [start, end] ranges (candle open times, ms) are known to be complete, so a
+fetch only downloads the sub-ranges that are missing. A segment is folded into the previous one
+once it gets close to its size, so each row is rewritten O(log n) times instead of on every write.
+Writers of every process serialize on a file lock and re-read the manifest under it, readers
+notice a newer manifest by its stat and reload it. Files of merged segments are removed, readers
+holding their memmaps are not disturbed.
+With compression on, new segments are stored as candle_codec blocks (one per time bucket) instead.
+"""
+
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", os.path.join(os.path.expanduser("~"), ".arbitrage_bot", "candles"))
+CANDLE_STORE_ENABLED = os.getenv("CANDLE_STORE_ENABLED", "true").lower() == "true"
+CANDLE_STORE_COMPRESSION = os.getenv("CANDLE_STORE_COMPRESSION", "false").lower() == "true"
+
+# Rows per compressed block (a time bucket of BLOCK_ROWS * interval)
+BLOCK_ROWS = 4096
+# Reads stay cheap even if the merge policy lets many small segments pile up
+MAX_SEGMENTS = 16
+MANIFEST_VERSION = 2
+
+
+def merge_ranges(ranges: List[Tuple[int, int]], step_ms: int) -> List[Tuple[int, int]]:
+    """Sort and merge overlapping or adjacent (one step apart) ranges"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + step_ms:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def subtract_ranges(start: int, end: int, covered: List[Tuple[int, int]], step_ms: int) -> List[Tuple[int, int]]:
+    """Parts of [start, end] not inside any covered range"""
+    missing = []
+    cursor = start
+    for cov_start, cov_end in covered:
+        if cov_end < cursor:
+            continue
+        if cov_start > end:
+            break
+        if cov_start > cursor:
+            missing.append((cursor, cov_start - step_ms))
+        cursor = max(cursor, cov_end + step_ms)
+        if cursor > end:
+            break
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+class CandlePartition:
+    def __init__(self, path: str, step_ms: int, width: int, compressed: bool = False) -> None:
+        self.path = path
+        self.step_ms = step_ms
+        self.width = width
+        self.compressed = compressed
+        self.columns = CANDLE_COLUMNS[:width]
+        self.lock = asyncio.Lock()
+
+        self._manifest: Optional[dict] = None
+        self._manifest_stat: Optional[Tuple[int, int]] = None
+        self._segments: Dict[int, object] = {}  # segment id -> {column: memmap} or blocks memmap
+
+    # ------------------- MANIFEST -------------------
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, "manifest.json")
+
+    @staticmethod
+    def _empty_manifest() -> dict:
+        return {"version": MANIFEST_VERSION, "next_id": 0, "rows": 0, "segments": [], "coverage": []}
+
+    def manifest(self) -> dict:
+        """Cached manifest, reloaded when another writer (maybe another process) replaced it"""
+        try:
+            stat = os.stat(self.manifest_path)
+            stamp = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            stamp = None
+        if self._manifest is None or stamp != self._manifest_stat:
+            self._manifest = self._empty_manifest()
+            if stamp is not None:
+                try:
+                    with open(self.manifest_path) as f:
+                        manifest = json.load(f)
+                    # Older layouts are dropped, the store is only a download cache
+                    if manifest.get("version") == MANIFEST_VERSION:
+                        self._manifest = manifest
+                except (FileNotFoundError, json.JSONDecodeError):
+                    pass
+            self._manifest_stat = stamp
+        return self._manifest
+
+    def coverage(self) -> List[Tuple[int, int]]:
+        return [tuple(r) for r in self.manifest()["coverage"]]
+
+    def missing_ranges(self, start: int, end: int) -> List[Tuple[int, int]]:
+        start, end = self.align(start), self.align(end)
+        return subtract_ranges(start, end, self.coverage(), self.step_ms)
+
+    def align(self, ts: int) -> int:
+        return int(ts) - int(ts) % self.step_ms
+
+    @contextmanager
+    def _write_lock(self):
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ------------------- READ -------------------
+
+    @property
+    def format(self) -> str:
+        """'blocks' once every segment is compressed, 'columns' otherwise"""
+        segments = self.manifest()["segments"]
+        return "blocks" if segments and all(segment["format"] == "blocks" for segment in segments) else "columns"
+
+    def _segment_file(self, segment_id: int, name: str) -> str:
+        return os.path.join(self.path, f"s{segment_id}.{name}")
+
+    def _open(self, segment: dict):
+        if segment["id"] not in self._segments:
+            if segment["format"] == "blocks":
+                opened = np.memmap(self._segment_file(segment["id"], "blocks.bin"), dtype=np.uint8, mode='r')
+            else:
+                opened = {
+                    column: np.load(self._segment_file(segment["id"], f"{column}.npy"), mmap_mode='r')
+                    for column in self.columns
+                }
+            self._segments[segment["id"]] = opened
+        return self._segments[segment["id"]]
+
+    def _overlapping(self, start: int, end: int) -> List[Tuple[dict, object]]:
+        """Segments overlapping [start, end] in write order, opened"""
+        for attempt in range(2):
+            segments = self.manifest()["segments"]
+            live = {segment["id"] for segment in segments}
+            for segment_id in [segment_id for segment_id in self._segments if segment_id not in live]:
+                del self._segments[segment_id]
+            try:
+                return [(segment, self._open(segment)) for segment in segments if segment["last"] >= start and segment["first"] <= end]
+            except FileNotFoundError:
+                # Merged away by another process between its manifest swap and our stat
+                if attempt:
+                    raise
+                self._manifest = None
+        return []
+
+    def _read_blocks(self, segment: dict, blocks: np.ndarray, start: int, end: int) -> Dict[str, np.ndarray]:
+        """Decode only the blocks overlapping [start, end]"""
+        entries = [e for e in segment["blocks"] if e[2] >= start and e[1] <= end]
+        if not entries:
+            return {column: np.empty(0) for column in self.columns}
+        decoded = [decode_columns(blocks[e[3]:e[3] + e[4]].tobytes()) for e in entries]
+        return {column: np.concatenate([block[column] for block in decoded]) for column in self.columns}
+
+    def _slice(self, columns: Dict[str, np.ndarray], start: int, end: int) -> Dict[str, np.ndarray]:
+        timestamps = columns["timestamp"]
+        lo = int(np.searchsorted(timestamps, start, side="left"))
+        hi = int(np.searchsorted(timestamps, end, side="right"))
+        return {column: values[lo:hi] for column, values in columns.items()}
+
+    def read_columns(self, start: int, end: int) -> Dict[str, np.ndarray]:
+        """
+        Every column for open times in [start, end]. Zero-copy views (slices of the memmaps) when a
+        single uncompressed segment holds the range, freshly merged arrays otherwise.
+        """
+        parts = []
+        for segment, opened in self._overlapping(start, end):
+            columns = self._read_blocks(segment, opened, start, end) if segment["format"] == "blocks" else opened
+            parts.append(self._slice(columns, start, end))
+        parts = [part for part in parts if len(part["timestamp"])]
+        if not parts:
+            return {column: np.empty(0) for column in self.columns}
+        if len(parts) == 1:
+            return parts[0]
+
+        rows = self._dedupe(np.concatenate([np.column_stack([part[column] for column in self.columns]) for part in parts]))
+        return {column: rows[:, index] for index, column in enumerate(self.columns)}
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Row-major (n, width) float64 copy, the format the exchange fetchers return"""
+        columns = self.read_columns(start, end)
+        if not len(columns["timestamp"]):
+            return empty_candles(self.width)
+        return np.column_stack([columns[column] for column in self.columns]).astype(np.float64)
+
+    def read_all(self) -> np.ndarray:
+        return self.read(np.iinfo(np.int64).min, np.iinfo(np.int64).max)
+
+    # ------------------- WRITE -------------------
+
+    @staticmethod
+    def _dedupe(rows: np.ndarray) -> np.ndarray:
+        """Sort by timestamp, newer (later) rows win on duplicated timestamps"""
+        if not len(rows):
+            return rows
+        order = np.argsort(rows[:, 0], kind="stable")[::-1]
+        _, first = np.unique(rows[order, 0], return_index=True)
+        return rows[order[first]]
+
+    def _write_segment(self, segment_id: int, rows: np.ndarray, compressed: bool) -> dict:
+        """Sorted, deduplicated rows -> new immutable segment files"""
+        segment = {"id": segment_id, "first": int(rows[0, 0]), "last": int(rows[-1, 0]), "rows": len(rows)}
+        if not compressed:
+            for index, column in enumerate(self.columns):
+                dtype = np.int64 if column == "timestamp" else np.float64
+                np.save(self._segment_file(segment_id, f"{column}.npy"), rows[:, index].astype(dtype))
+            return {**segment, "format": "columns"}
+
+        bucket_ms = BLOCK_ROWS * self.step_ms
+        buckets = (rows[:, 0] // bucket_ms).astype(np.int64)
+        entries, offset = [], 0
+        with open(self._segment_file(segment_id, "blocks.bin"), "wb") as f:
+            for bucket in np.unique(buckets).tolist():
+                block_rows = rows[buckets == bucket]
+                block = encode_block(block_rows, self.step_ms)
+                f.write(block)
+                entries.append([bucket, int(block_rows[0, 0]), int(block_rows[-1, 0]), offset, len(block), len(block_rows)])
+                offset += len(block)
+        return {**segment, "format": "blocks", "blocks": entries}
+
+    def _segment_rows(self, segment: dict) -> np.ndarray:
+        opened = self._open(segment)
+        if segment["format"] == "blocks":
+            return np.concatenate([decode_block(opened[e[3]:e[3] + e[4]].tobytes()) for e in segment["blocks"]])
+        return np.column_stack([opened[column] for column in self.columns]).astype(np.float64)
+
+    def _merge(self, segments: List[dict], next_id: int, created: List[dict], force: bool = False) -> Tuple[List[dict], int]:
+        """Fold the newest segment into the previous one while it's at least half its size"""
+        while len(segments) >= 2 and (force or len(segments) > MAX_SEGMENTS or segments[-2]["rows"] <= 2 * segments[-1]["rows"]):
+            older, newer = segments[-2], segments[-1]
+            rows = self._dedupe(np.concatenate([self._segment_rows(older), self._segment_rows(newer)]))
+            compressed = self.compressed or (older["format"] == "blocks" and newer["format"] == "blocks")
+            segments = segments[:-2] + [self._write_segment(next_id, rows, compressed)]
+            created.append(segments[-1])
+            next_id += 1
+        return segments, next_id
+
+    def _remove_segment(self, segment: dict) -> None:
+        self._segments.pop(segment["id"], None)
+        names = ["blocks.bin"] if segment["format"] == "blocks" else [f"{column}.npy" for column in self.columns]
+        for name in names:
+            try:
+                os.remove(self._segment_file(segment["id"], name))
+            except OSError:
+                pass
+
+    def write(self, rows: np.ndarray, covered: List[Tuple[int, int]], compact: bool = False) -> None:
+        """Add new rows to the partition and mark `covered` ranges as complete"""
+        rows = self._dedupe(rows)
+        with self._write_lock():
+            self._manifest = None  # whatever other processes committed so far
+            manifest = self.manifest()
+            segments, next_id, created = list(manifest["segments"]), manifest["next_id"], []
+            if len(rows):
+                segments.append(self._write_segment(next_id, rows, self.compressed))
+                created.append(segments[-1])
+                next_id += 1
+            if compact and len(segments) == 1 and segments[0]["format"] == "columns":
+                segments = [self._write_segment(next_id, self._segment_rows(segments[0]), True)]
+                created.append(segments[-1])
+                next_id += 1
+            segments, next_id = self._merge(segments, next_id, created, force=compact)
+
+            new_manifest = {
+                "version": MANIFEST_VERSION,
+                "next_id": next_id,
+                "rows": int(sum(segment["rows"] for segment in segments)),
+                "segments": segments,
+                "coverage": [list(r) for r in merge_ranges(self.coverage() + list(covered), self.step_ms)],
+                "updated_at": int(time.time() * 1000)
+            }
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(new_manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+
+            live = {segment["id"] for segment in segments}
+            for segment in manifest["segments"] + created:
+                if segment["id"] not in live:
+                    self._remove_segment(segment)
+            self._manifest = None
+
+    def compact(self) -> None:
+        """Merge the partition into a single compressed segment"""
+        self.compressed = True
+        if self.format != "blocks" or len(self.manifest()["segments"]) > 1:
+            self.write(empty_candles(self.width), [], compact=True)
+
+    def disk_usage(self) -> int:
+        total = 0
+        for segment in self.manifest()["segments"]:
+            names = ["blocks.bin"] if segment["format"] == "blocks" else [f"{column}.npy" for column in self.columns]
+            total += sum(os.path.getsize(self._segment_file(segment["id"], name)) for name in names)
+        return total
+
+
+class CandleStore:
+    def __init__(self, root: str = CANDLE_STORE_DIR, enabled: bool = CANDLE_STORE_ENABLED, compressed: bool = CANDLE_STORE_COMPRESSION) -> None:
+        self.root = root
+        self.enabled = enabled
+        self.compressed = compressed
+        self._partitions: Dict[Tuple[str, str, str], CandlePartition] = {}
+
+    def partition(self, exchange: str, symbol: str, interval: str, step_ms: int, width: int) -> CandlePartition:
+        key = (exchange, symbol, interval)
+        if key not in self._partitions:
+            path = os.path.join(self.root, exchange, symbol, interval)
+            os.makedirs(path, exist_ok=True)
+            self._partitions[key] = CandlePartition(path, step_ms, width, self.compressed)
+        return self._partitions[key]
+
+    @staticmethod
+    async def _before_listing(listing_time: Optional[Callable[[], Awaitable[Optional[int]]]], end: int) -> bool:
+        if listing_time is None:
+            return False
+        try:
+            listed_at = await listing_time()
+        except Exception as e:
+            print(f"Error getting the listing time: {e}")
+            return False
+        return listed_at is not None and end < listed_at
+
+    async def fetch(
+        self,
+        exchange: str,
+        symbol: str,
+        interval: str,
+        step_ms: int,
+        width: int,
+        start_time: int,
+        end_time: int,
+        fetch_range: Callable[[int, int], Awaitable[np.ndarray]],
+        listing_time: Optional[Callable[[], Awaitable[Optional[int]]]] = None
+    ) -> np.ndarray:
+        """
+        Candles for [start_time, end_time], downloading only the ranges the store doesn't have.
+        fetch_range(start, end) must return every candle with an open time in [start, end] and raise
+        on any upstream error. A gap is only marked complete after a successful fetch: up to its end
+        for past windows, up to the last returned candle for windows reaching the present (it may not
+        be published yet), and an empty answer only when listing_time() proves the window predates
+        the listing. Only closed candles are persisted, the still-open tail is fetched every time and
+        returned without being stored. Gaps fetched before an error are kept, then the error is raised.
+        """
+        part = self.partition(exchange, symbol, interval, step_ms, width)
+        last_closed = part.align(int(time.time() * 1000)) - step_ms
+        live_rows = []
+        error = None
+
+        async with part.lock:
+            gaps = part.missing_ranges(start_time, end_time)
+            fetched, covered = [], []
+            for gap_start, gap_end in gaps:
+                try:
+                    rows = await fetch_range(gap_start, gap_end)
+                except Exception as e:
+                    error = e
+                    break
+                rows = rows[(rows[:, 0] >= gap_start) & (rows[:, 0] <= gap_end)] if len(rows) else rows
+                if len(rows):
+                    live_rows.append(rows[rows[:, 0] > last_closed])
+
+                closed_end = min(gap_end, last_closed)
+                if gap_start > closed_end:
+                    continue
+                closed = rows[rows[:, 0] <= closed_end] if len(rows) else rows
+                if len(closed):
+                    covered.append((gap_start, closed_end if closed_end < last_closed else int(closed[:, 0].max())))
+                    fetched.append(closed)
+                elif await self._before_listing(listing_time, closed_end):
+                    covered.append((gap_start, closed_end))
+
+            if covered:
+                part.write(np.concatenate(fetched) if fetched else empty_candles(width), covered)
+
+        if error is not None:
+            raise error
+
+        result = part.read(start_time, end_time)
+        live_rows = [rows for rows in live_rows if len(rows)]
+        if live_rows:
+            result = np.concatenate([result, *live_rows])
+        return result
+
+
+candle_store = CandleStore()
@@ -0,0 +1,76 @@
+import asyncio
+import numpy as np
+from typing import AsyncIterator, List, Sequence
+
+"""Shared candle / funding array formats and helpers for the paginated (streaming) fetchers"""
+
+# Bitget candles: [timestamp, open, high, low, close, volume, notional], Binance has no notional column
+CANDLE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'notional']
+BITGET_CANDLE_WIDTH = 7
+BINANCE_CANDLE_WIDTH = 6
+
+# Funding history chunks, funding_rate in percent like the rest of CryptoDataService
+FUNDING_DTYPE = np.dtype([('funding_rate', 'f8'), ('funding_time', 'i8')])
+
+
+def parse_candles(rows: Sequence[Sequence], width: int) -> np.ndarray:
+    """Exchange rows (strings or numbers) -> float64 array of shape (n, width)"""
+    if not rows:
+        return np.empty((0, width), dtype=np.float64)
+    return np.array([row[:width] for row in rows], dtype=np.float64)
+
+
+def empty_candles(width: int) -> np.ndarray:
+    return np.empty((0, width), dtype=np.float64)
+
+
+async def collect_chunks(chunks: AsyncIterator[np.ndarray], width: int = None, dtype=None) -> np.ndarray:
+    """Drain a page iterator into one array with a single concatenation"""
+    pages: List[np.ndarray] = [chunk async for chunk in chunks if len(chunk)]
+    if pages:
+        return np.concatenate(pages)
+    if dtype is not None:
+        return np.empty(0, dtype=dtype)
+    return empty_candles(width)
+
+
+async def prefetch(chunks: AsyncIterator[np.ndarray], depth: int = 1) -> AsyncIterator[np.ndarray]:
+    """
+    Download up to `depth` pages ahead of the consumer.
+
+    The bounded queue is the backpressure: once `depth` pages are waiting the producer stops
+    requesting until the consumer has processed one. depth=0 means no read-ahead at all.
+    """
+    if depth <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    done = object()
+
+    async def producer():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(producer())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
+
+from src.app.redis_layer import redis_address
+from src.app.funding_rate.interval_cache import FundingIntervalCache
+from src.app.market_data.funding_stream import FundingTable, FundingStreamIngest, funding_table, funding_ingest
+from src.app.market_data.funding_broadcast import FundingBroadcastHub, funding_hub
+
+"""
+Cross-replica funding fan-out over Redis pub/sub.
+
+Exactly one pod (the lease holder) runs the exchange ingest. It publishes every flushed change
+once, on `funding:all` and on `funding:sym:{SYMBOL}`, and keeps the full rows in the
+`funding:table` hash. Every other pod applies the messages to its local table, hands them to
+its local hub, so WebSocket clients see the same deltas whatever pod they are connected to, and
+re-dispatches them to the read-only listeners registered here (spread scanner, live analysis).
+Listeners that write shared state (settlement recorder, leaderboards, calendar) are registered
+with add_writer: they only see the ingest while this pod actually holds the lease.
+
+While Redis is unreachable every pod falls back to a local ingest so its WebSocket clients keep
+receiving deltas, but that fallback is not leadership: writers and leader listeners stay off.
+
+By default every follower keeps the full table: it subscribes to `funding:all` and hydrates from
+the table hash. With FUNDING_BACKPLANE_FULL_TABLE=false pods only subscribe to channels their
+clients want: the hub reports when a symbol (or the whole market) gains its first or loses its
+last local client, and the subscription follows that refcount.
+"""
+
+FUNDING_BACKPLANE_ENABLED = os.getenv("FUNDING_BACKPLANE_ENABLED", "true").lower() == "true"
+FUNDING_BACKPLANE_FULL_TABLE = os.getenv("FUNDING_BACKPLANE_FULL_TABLE", "true").lower() == "true"
+
+ALL_CHANNEL = "funding:all"
+SYMBOL_CHANNEL = "funding:sym:{}"
+TABLE_KEY = "funding:table"
+LEADER_KEY = "funding:ingest:leader"
+
+# Only extend the lease if we still own it
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class FundingBackplane:
+    def __init__(
+        self,
+        table: FundingTable,
+        ingest: FundingStreamIngest,
+        hub: FundingBroadcastHub,
+        client: Optional[aioredis.Redis] = None,
+        lease_ttl: int = 15,
+        renew_interval: float = 5.0,
+        full_table: bool = FUNDING_BACKPLANE_FULL_TABLE
+    ) -> None:
+        self.table = table
+        self.ingest = ingest
+        self.hub = hub
+        self.full_table = full_table
+        self.lease_ttl = lease_ttl
+        self.renew_interval = renew_interval
+        self.pod_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+        if client is None:
+            host, port = redis_address()
+            client = aioredis.Redis(host=host, port=port, decode_responses=True)
+        self._redis = client
+        self._pubsub = None
+
+        self.is_leader = False
+        self.local_fallback = False  # Redis unreachable: local ingest for this pod's clients only
+        self._renewed_at = 0.0
+        self._pending: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._channels: Dict[str, bool] = {}  # channel -> wanted
+        self._tasks: List[asyncio.Task] = []
+        self.listeners: List[Callable[[str, str, Dict[str, float]], None]] = []
+        self.leader_listeners: List[Callable[[bool], None]] = []  # called with is_leader on every lease change
+        self._counters = {"published": 0, "received": 0, "hydrated": 0, "leader_changes": 0, "fallbacks": 0, "redis_errors": 0, "listener_errors": 0}
+
+        ingest.add_listener(self._on_ingest_change)
+        hub.interest_listeners.append(self._on_interest)
+
+    def add_listener(self, listener: Callable[[str, str, Dict[str, float]], None]) -> None:
+        """Read-only listener(exchange, symbol, changed_fields), called for changes received from the leader"""
+        self.listeners.append(listener)
+
+    def add_writer(self, listener: Callable[[str, str, Dict[str, float]], None]) -> None:
+        """
+        Ingest listener that writes shared state, only fed while this pod holds the lease
+        (always when the backplane isn't running, a single pod is its own leader).
+        """
+        def leader_only(exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+            if self.is_leader or not self._tasks:
+                listener(exchange, symbol, changed)
+
+        self.ingest.add_listener(leader_only)
+
+    # ------------------- LEADER LEASE -------------------
+
+    async def _acquire_or_renew(self) -> bool:
+        if self.is_leader:
+            return bool(await self._redis.eval(RENEW_SCRIPT, 1, LEADER_KEY, self.pod_id, self.lease_ttl))
+        return bool(await self._redis.set(LEADER_KEY, self.pod_id, nx=True, ex=self.lease_ttl))
+
+    async def _sync_ingest(self) -> None:
+        """The ingest runs on the lease holder, and on every pod in local fallback"""
+        wanted = self.is_leader or self.local_fallback
+        if wanted and not self.ingest.running:
+            await self.ingest.start()
+        elif not wanted and self.ingest.running:
+            await self.ingest.stop()
+
+    async def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        self._counters["leader_changes"] += 1
+        if leader:
+            print(f"Funding backplane: {self.pod_id} runs the ingest")
+        else:
+            print(f"Funding backplane: {self.pod_id} lost the ingest lease")
+            self._pending.clear()
+        await self._sync_ingest()
+        for listener in self.leader_listeners:
+            try:
+                listener(leader)
+            except Exception as e:
+                print(f"Funding backplane leader listener error: {e}")
+
+    async def _set_fallback(self, active: bool) -> None:
+        if active == self.local_fallback:
+            return
+        self.local_fallback = active
+        if active:
+            self._counters["fallbacks"] += 1
+            print(f"Funding backplane: Redis unreachable, {self.pod_id} runs a local ingest for its own clients")
+        await self._sync_ingest()
+
+    async def _lease_loop(self) -> None:
+        while True:
+            try:
+                leader = await self._acquire_or_renew()
+                if leader:
+                    self._renewed_at = time.monotonic()
+                await self._set_fallback(False)
+                await self._set_leader(leader)
+            except RedisError as e:
+                self._counters["redis_errors"] += 1
+                print(f"Funding backplane Redis error: {e}")
+                # The lease is only ours until its TTL runs out unrenewed, then another pod may take it
+                if not self.is_leader or time.monotonic() - self._renewed_at >= self.lease_ttl:
+                    await self._set_leader(False)
+                    await self._set_fallback(True)
+            await asyncio.sleep(self.renew_interval)
+
+    # ------------------- PUBLISH (LEADER) -------------------
+
+    def _on_ingest_change(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        if self.is_leader:
+            self._pending.setdefault((exchange, symbol), {}).update(changed)
+
+    async def publish_pending(self) -> None:
+        """One pipeline per flush: per-symbol channels, the market channel and the table hash"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+
+        entries, by_symbol, rows = [], {}, {}
+        for (exchange, symbol), changed in pending.items():
+            entry = {"exchange": exchange, "symbol": symbol, **changed}
+            entries.append(entry)
+            by_symbol.setdefault(symbol, []).append(entry)
+            row = self.table.get(exchange, symbol)
+            if row is not None:
+                rows[f"{exchange}:{symbol}"] = json.dumps(row)
+
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for symbol, symbol_entries in by_symbol.items():
+                pipe.publish(SYMBOL_CHANNEL.format(symbol), json.dumps({"origin": self.pod_id, "data": symbol_entries}))
+            pipe.publish(ALL_CHANNEL, json.dumps({"origin": self.pod_id, "data": entries}))
+            if rows:
+                pipe.hset(TABLE_KEY, mapping=rows)
+            await pipe.execute()
+        self._counters["published"] += len(entries)
+
+    async def _publish_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.hub.flush_interval)
+            try:
+                await self.publish_pending()
+            except RedisError as e:
+                self._counters["redis_errors"] += 1
+                print(f"Funding backplane publish error: {e}")
+
+    # ------------------- SUBSCRIBE (EVERY POD) -------------------
+
+    def _on_interest(self, symbol: Optional[str], active: bool) -> None:
+        if self.full_table:
+            return  # funding:all is always wanted
+        channel = ALL_CHANNEL if symbol is None else SYMBOL_CHANNEL.format(symbol)
+        self._channels[channel] = active
+
+    def _apply(self, entries: List[dict]) -> None:
+        for entry in entries:
+            entry = dict(entry)
+            exchange, symbol = entry.pop("exchange"), entry.pop("symbol")
+            changed = self.table.update(exchange, symbol, **entry)
+            if not changed:
+                continue
+            self.hub.publish(exchange, symbol, changed)
+            for listener in self.listeners:
+                try:
+                    listener(exchange, FundingIntervalCache.normalize_symbol(symbol), changed)
+                except Exception as e:
+                    self._counters["listener_errors"] += 1
+                    print(f"Funding backplane listener error on {exchange} {symbol}: {e}")
+
+    async def hydrate(self, symbol: Optional[str]) -> None:
+        """Load rows from the shared table hash, new subscriptions start from the current state"""
+        if symbol is None:
+            values = list((await self._redis.hgetall(TABLE_KEY)).values())
+        else:
+            fields = [f"{exchange}:{symbol}" for exchange in ("binance", "bitget")]
+            values = [value for value in await self._redis.hmget(TABLE_KEY, fields) if value]
+        self._apply([json.loads(value) for value in values])
+        self._counters["hydrated"] += len(values)
+
+    async def _sync_subscriptions(self) -> None:
+        """Follow the wanted channels, the leader already has every value locally"""
+        for channel, wanted in list(self._channels.items()):
+            if wanted:
+                await self._pubsub.subscribe(channel)
+                if not self.is_leader:
+                    await self.hydrate(None if channel == ALL_CHANNEL else channel[len(SYMBOL_CHANNEL.format("")):])
+            else:
+                await self._pubsub.unsubscribe(channel)
+            # Dropped only once done (a RedisError keeps it for the next pass), unless it flipped meanwhile
+            if self._channels.get(channel) == wanted:
+                del self._channels[channel]
+
+    async def _listen_loop(self) -> None:
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        wants_all, symbols = self.hub.interests()
+        if wants_all or self.full_table:
+            self._channels[ALL_CHANNEL] = True
+        for symbol in ([] if self.full_table else symbols):
+            self._channels[SYMBOL_CHANNEL.format(symbol)] = True
+
+        while True:
+            try:
+                await self._sync_subscriptions()
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.2)
+                    continue
+
+                message = await self._pubsub.get_message(timeout=0.2)
+                if message is None or message.get("type") != "message":
+                    continue
+                payload = json.loads(message["data"])
+                if payload.get("origin") == self.pod_id:
+                    continue
+                self._counters["received"] += 1
+                # A pod subscribed to both funding:all and a symbol channel gets that symbol twice,
+                # the table diff makes the second copy a no-op
+                self._apply(payload.get("data") or [])
+            except RedisError as e:
+                self._counters["redis_errors"] += 1
+                print(f"Funding backplane subscribe error: {e}")
+                await asyncio.sleep(1)
+
+    # ------------------- LIFECYCLE -------------------
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._lease_loop(), name="funding-backplane-lease"),
+            asyncio.create_task(self._publish_loop(), name="funding-backplane-publish"),
+            asyncio.create_task(self._listen_loop(), name="funding-backplane-listen")
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self.is_leader:
+            try:
+                # Hand the lease over right away instead of waiting for the TTL
+                if await self._redis.get(LEADER_KEY) == self.pod_id:
+                    await self._redis.delete(LEADER_KEY)
+            except RedisError:
+                pass
+        self.local_fallback = False
+        await self._set_leader(False)
+        await self._sync_ingest()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+
+    def snapshot(self) -> dict:
+        return {
+            "pod_id": self.pod_id,
+            "leader": self.is_leader,
+            "local_fallback": self.local_fallback,
+            "subscribed_channels": sorted(self._pubsub.channels) if self._pubsub is not None else [],
+            **self._counters
+        }
+
+
+funding_backplane = FundingBackplane(funding_table, funding_ingest, funding_hub)
+
+
+async def main_testing():
+    """Two in-process 'pods' sharing one Redis (fakeredis if no server is reachable)"""
+    try:
+        import fakeredis
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    except ImportError:
+        client = None
+
+    pods = []
+    for name in ("leader", "follower"):
+        table = FundingTable()
+        ingest = FundingStreamIngest(table, feeds=[])
+        hub = FundingBroadcastHub(table, flush_interval=0.05)
+        backplane = FundingBackplane(table, ingest, hub, client=client, renew_interval=0.1)
+        await hub.start()
+        await backplane.start()
+        await asyncio.sleep(0.3)
+        pods.append((name, table, ingest, hub, backplane))
+
+    (_, leader_table, _, _, leader), (_, _, _, follower_hub, follower) = pods
+    client_ws = follower_hub.register()
+    follower_hub.subscribe(client_ws, ["BTCUSDT"])
+    print("follower snapshot ->", await client_ws.next_message())
+    await asyncio.sleep(0.3)
+
+    # What the ingest listener would do on the leader pod
+    for rate in (0.0001, 0.0002):
+        leader._on_ingest_change("binance", "BTCUSDT", leader_table.update("binance", "BTCUSDT", funding_rate=rate, mark_price=65000.0))
+        await asyncio.sleep(0.3)
+        print("follower client ->", await client_ws.next_message())
+
+    for name, _, _, hub, backplane in pods:
+        print(name, "->", backplane.snapshot())
+        await backplane.stop()
+        await hub.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
@@ -0,0 +1,231 @@
+import asyncio
+import itertools
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.app.funding_rate.interval_cache import FundingIntervalCache
+from src.app.market_data.funding_stream import FundingTable, funding_table
+
+"""
+In-process fan-out of funding table updates to WebSocket clients.
+
+The hub is a listener of the funding ingest, so one upstream feed serves every connected client.
+Each client owns a bounded queue: when a slow consumer falls behind, the oldest pending message
+is dropped instead of blocking the ingest or growing memory without limit.
+
+Protocol: a client gets a `snapshot` (full rows of what it subscribed) and then `delta` messages
+holding only the changed fields of the rows that changed since the previous flush. Changes are
+coalesced and flushed every `flush_interval`. Every message carries the client's `seq`, a client
+seeing a gap (a dropped delta) sends `resync` and gets a fresh snapshot.
+"""
+
+FUNDING_WS_FLUSH_MS = int(os.getenv("FUNDING_WS_FLUSH_MS", "250"))
+
+
+class FundingSubscriber:
+    """One connected client: its subscriptions and its bounded outbound queue"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, queue_size: int) -> None:
+        self.id = next(self._ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.symbols: Set[str] = set()
+        self.all_market = False
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    def wants(self, symbol: str) -> bool:
+        return self.all_market or symbol in self.symbols
+
+    def push(self, message: dict) -> None:
+        """Never blocks: a full queue loses its oldest message (the client sees a seq gap)"""
+        self.seq += 1
+        message["seq"] = self.seq
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(message)
+
+    def push_snapshot(self, rows: List[dict]) -> None:
+        """A snapshot supersedes every pending delta"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.push({"type": "snapshot", "data": rows})
+
+    async def next_message(self) -> dict:
+        message = await self.queue.get()
+        self.sent += 1
+        return message
+
+    def snapshot(self) -> dict:
+        return {
+            "all_market": self.all_market,
+            "symbols": len(self.symbols),
+            "seq": self.seq,
+            "pending": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs
+        }
+
+
+class FundingBroadcastHub:
+    def __init__(self, table: FundingTable, queue_size: int = 256, flush_interval: float = FUNDING_WS_FLUSH_MS / 1000) -> None:
+        self.table = table
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self._subscribers: Dict[int, FundingSubscriber] = {}
+        self._by_symbol: Dict[str, Set[int]] = {}
+        self._all_market: Set[int] = set()
+        self._pending: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._counters = {"changes": 0, "flushes": 0, "deltas": 0, "delta_rows": 0}
+        # interest(symbol, active): a symbol (None = whole market) gained its first / lost its last local client
+        self.interest_listeners: List[Callable[[Optional[str], bool], None]] = []
+
+    def _notify_interest(self, symbol: Optional[str], active: bool) -> None:
+        for listener in self.interest_listeners:
+            listener(symbol, active)
+
+    def interests(self) -> Tuple[bool, List[str]]:
+        """(whole market wanted, symbols wanted) by the local clients"""
+        return bool(self._all_market), list(self._by_symbol)
+
+    # ------------------- CLIENTS -------------------
+
+    def register(self, queue_size: Optional[int] = None) -> FundingSubscriber:
+        subscriber = FundingSubscriber(queue_size or self.queue_size)
+        self._subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def unregister(self, subscriber: FundingSubscriber) -> None:
+        self.unsubscribe(subscriber, list(subscriber.symbols), all_market=True)
+        self._subscribers.pop(subscriber.id, None)
+
+    def subscribe(self, subscriber: FundingSubscriber, symbols: Iterable[str] = (), all_market: bool = False) -> None:
+        """Add subscriptions and queue a snapshot of everything the client now follows"""
+        if all_market and not subscriber.all_market:
+            subscriber.all_market = True
+            self._all_market.add(subscriber.id)
+            if len(self._all_market) == 1:
+                self._notify_interest(None, True)
+
+        for symbol in symbols:
+            symbol = FundingIntervalCache.normalize_symbol(symbol)
+            subscriber.symbols.add(symbol)
+            if symbol not in self._by_symbol:
+                self._by_symbol[symbol] = set()
+                self._notify_interest(symbol, True)
+            self._by_symbol[symbol].add(subscriber.id)
+        self.resync(subscriber, count=False)
+
+    def resync(self, subscriber: FundingSubscriber, count: bool = True) -> None:
+        if count:
+            subscriber.resyncs += 1
+        if subscriber.all_market:
+            rows = self.table.snapshot()
+        else:
+            rows = [row for symbol in sorted(subscriber.symbols) for row in self.table.get_symbol(symbol).values()]
+        subscriber.push_snapshot(rows)
+
+    def unsubscribe(self, subscriber: FundingSubscriber, symbols: Iterable[str] = (), all_market: bool = False) -> None:
+        if all_market and subscriber.all_market:
+            subscriber.all_market = False
+            self._all_market.discard(subscriber.id)
+            if not self._all_market:
+                self._notify_interest(None, False)
+
+        for symbol in symbols:
+            symbol = FundingIntervalCache.normalize_symbol(symbol)
+            subscriber.symbols.discard(symbol)
+            listeners = self._by_symbol.get(symbol)
+            if listeners is not None:
+                listeners.discard(subscriber.id)
+                if not listeners:
+                    del self._by_symbol[symbol]
+                    self._notify_interest(symbol, False)
+
+    # ------------------- FAN-OUT -------------------
+
+    def publish(self, exchange: str, symbol: str, changed: Dict[str, float]) -> None:
+        """Funding ingest listener, coalesces changes until the next flush"""
+        if not (self._all_market or symbol in self._by_symbol):
+            return
+        self._counters["changes"] += 1
+        self._pending.setdefault((exchange, symbol), {}).update(changed)
+
+    def flush(self) -> None:
+        """One delta per client with the changed fields of the rows it follows"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self._counters["flushes"] += 1
+
+        entries = [
+            (symbol, {"exchange": exchange, "symbol": symbol, **changed})
+            for (exchange, symbol), changed in pending.items()
+        ]
+        for subscriber in self._subscribers.values():
+            data = [entry for symbol, entry in entries if subscriber.wants(symbol)]
+            if data:
+                subscriber.push({"type": "delta", "data": data})
+                self._counters["deltas"] += 1
+                self._counters["delta_rows"] += len(data)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def start(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop(), name="funding-broadcast-flush")
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "clients": len(self._subscribers),
+            "all_market_clients": len(self._all_market),
+            "subscribed_symbols": len(self._by_symbol),
+            "flush_interval": self.flush_interval,
+            **self._counters,
+            "dropped": sum(subscriber.dropped for subscriber in self._subscribers.values()),
+            "subscribers": {subscriber_id: subscriber.snapshot() for subscriber_id, subscriber in self._subscribers.items()}
+        }
+
+
+funding_hub = FundingBroadcastHub(funding_table)
+
+
+async def main_testing():
+    table = FundingTable()
+    hub = FundingBroadcastHub(table, queue_size=3)
+    fast, slow = hub.register(), hub.register()
+    hub.subscribe(fast, ["btc"])
+    hub.subscribe(slow, all_market=True)
+    print("fast ->", await fast.next_message())
+
+    for i in range(5):
+        hub.publish("binance", "BTCUSDT", table.update("binance", "BTCUSDT", funding_rate=0.0001 * i))
+        hub.publish("bitget", "ETHUSDT", table.update("bitget", "ETHUSDT", mark_price=3000.0 + i))
+        hub.flush()
+        print("fast ->", await fast.next_message())
+
+    print("slow pending ->", slow.queue.qsize(), "dropped ->", slow.dropped)
+    hub.resync(slow)
+    print("slow after resync ->", await slow.next_message())
+    print("hub ->", hub.snapshot())
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
@@ -0,0 +1,110 @@
+import asyncio
+import os
+from typing import Callable, Optional
+
+import numpy as np
+
+from src.app.clients.binance import BinanceClient
+from src.app.crypto_data_service import CryptoDataService
+from src.app.market_data.candle_store import CandleStore, candle_store
+
+"""
+Funding settlement history per exchange, persisted in the candle store.
+
+Rows are [funding_time, funding_rate (percent)] under the "funding" interval of the symbol: the
+store only keys on the first column and tracks which ranges were downloaded, so repeated
+backtests over the same years only download the settlements they have never seen.
+"""
+
+FUNDING_HISTORY_WIDTH = 2
+FUNDING_HISTORY_STEP_MS = 60 * 60 * 1000  # settlements fall on whole hours
+BITGET_FUNDING_MAX_PAGES = 100  # newest first
+BITGET_FUNDING_PAGE_SIZE = 100
+FUNDING_SEED_DAYS = int(os.getenv("FUNDING_SEED_DAYS", "365"))
+FUNDING_SEED_TIMEOUT_SECONDS = float(os.getenv("FUNDING_SEED_TIMEOUT_SECONDS", "120"))
+
+
+def _rows(chunk: np.ndarray) -> np.ndarray:
+    # Binance stamps settlements a few ms after the hour, floor them onto the hourly grid
+    times = chunk['funding_time'] // FUNDING_HISTORY_STEP_MS * FUNDING_HISTORY_STEP_MS
+    return np.column_stack([times.astype(np.float64), chunk['funding_rate']])
+
+
+class FundingHistoryStore:
+
+    def __init__(self, store: CandleStore = candle_store, data_service: Optional[CryptoDataService] = None,
+                 binance_client: Optional[BinanceClient] = None) -> None:
+        self.store = store
+        self.data_service = data_service or CryptoDataService()
+        self.binance_client = binance_client or BinanceClient()
+
+    async def _bitget_range(self, symbol: str, start: int, end: int) -> np.ndarray:
+        """
+        Bitget only pages newest first, stop once the pages are older than `start`. Raises ValueError
+        when the page budget runs out before that, a truncated range must not be stored as complete.
+        """
+        pages, reached_start, exhausted = [], False, False
+        async for chunk in self.data_service.iter_historical_funding_rate(symbol, pages=BITGET_FUNDING_MAX_PAGES, page_size=BITGET_FUNDING_PAGE_SIZE):
+            pages.append(_rows(chunk))
+            if chunk['funding_time'].min() < start:
+                reached_start = True
+                break
+            # A short page is the oldest settlement Bitget has (listed after `start`)
+            exhausted = len(chunk) < BITGET_FUNDING_PAGE_SIZE
+        if not reached_start and not exhausted and len(pages) >= BITGET_FUNDING_MAX_PAGES:
+            raise ValueError(f"Bitget funding history of {symbol} truncated after {len(pages)} pages, {start} not reached")
+        rows = np.concatenate(pages) if pages else np.empty((0, FUNDING_HISTORY_WIDTH))
+        return rows[(rows[:, 0] >= start) & (rows[:, 0] <= end)]
+
+    async def _binance_range(self, symbol: str, start: int, end: int) -> np.ndarray:
+        pages = [_rows(chunk) async for chunk in self.binance_client.iter_historical_funding_rate(symbol, start, end)]
+        return np.concatenate(pages) if pages else np.empty((0, FUNDING_HISTORY_WIDTH))
+
+    async def get(self, exchange: str, symbol: str, start_time: int, end_time: int) -> np.ndarray:
+        """Settlements of [start_time, end_time] sorted by time, only missing ranges are downloaded"""
+        fetchers = {"bitget": self._bitget_range, "binance": self._binance_range}
+        if exchange not in fetchers:
+            raise ValueError(f"Exchange {exchange} not supported")
+
+        async def fetch_range(gap_start: int, gap_end: int) -> np.ndarray:
+            return await fetchers[exchange](symbol, gap_start, gap_end)
+
+        if not self.store.enabled:
+            rows = await fetch_range(start_time, end_time)
+        else:
+            rows = await self.store.fetch(
+                exchange, symbol, "funding", FUNDING_HISTORY_STEP_MS, FUNDING_HISTORY_WIDTH, start_time, end_time, fetch_range
+            )
+        return rows[np.argsort(rows[:, 0], kind="stable")]
+
+    def seeder(self, loop: asyncio.AbstractEventLoop, days: int = FUNDING_SEED_DAYS) -> Callable[[str, str, int], np.ndarray]:
+        """
+        Blocking (exchange, symbol, before) -> settlements of the `days` before `before`, run on `loop`.
+        For the Redis sketch writers, which run in worker threads; never call it on the loop itself.
+        """
+        def history(exchange: str, symbol: str, before: int) -> np.ndarray:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                raise RuntimeError("The funding history seeder blocks, call it from a worker thread")
+            future = asyncio.run_coroutine_threadsafe(self.get(exchange, symbol, before - days * 86_400_000, before - 1), loop)
+            return future.result(FUNDING_SEED_TIMEOUT_SECONDS)
+
+        return history
+
+
+funding_history = FundingHistoryStore()
+
+
+async def main_testing():
+    import time
+    end = int(time.time() * 1000)
+    start = end - 30 * 24 * 60 * 60 * 1000
+    for exchange in ("binance", "bitget"):
+        rows = await funding_history.get(exchange, "BTCUSDT", start, end)
+        print(exchange, "settlements ->", len(rows), "last ->", rows[-1] if len(rows) else None)
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
@@ -0,0 +1,440 @@
+import abc
+import asyncio
+import json
+import os
+import random
+import time
+import aiohttp
+import numpy as np
+import websockets
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.app.funding_rate.interval_cache import FundingIntervalCache
+from src.app.rate_control import outbound_limiters
+
+"""
+Streaming funding ingest.
+
+Long running WebSocket consumers for the market-wide Binance mark price stream and the Bitget
+ticker channel. Every update is parsed straight into `funding_table`, a symbol-indexed NumPy
+table, so endpoints and jobs read the current funding rate, mark/index price and next funding
+time from memory instead of polling REST.
+"""
+
+BINANCE_STREAM_URL = os.getenv("BINANCE_MARK_PRICE_WS", "wss://fstream.binance.com/ws/!markPrice@arr@1s")
+BITGET_STREAM_URL = os.getenv("BITGET_PUBLIC_WS", "wss://ws.bitget.com/v2/ws/public")
+BITGET_URL = "https://api.bitget.com"
+# Bitget closes connections sending more than 10 messages per second
+BITGET_WS_SEND_INTERVAL_SECONDS = float(os.getenv("BITGET_WS_SEND_INTERVAL_SECONDS", "0.12"))
+FUNDING_STREAM_ENABLED = os.getenv("FUNDING_STREAM_ENABLED", "true").lower() == "true"
+
+# funding_rate is the raw exchange fraction (0.0001 == 0.01 %), times in ms
+FUNDING_TABLE_DTYPE = np.dtype([
+    ('funding_rate', 'f8'),
+    ('mark_price', 'f8'),
+    ('index_price', 'f8'),
+    ('next_funding_time', 'i8'),
+    ('updated_at', 'i8')
+])
+FUNDING_FIELDS = FUNDING_TABLE_DTYPE.names
+
+
+class FundingTable:
+    """
+    (exchange, symbol) -> row of a preallocated structured array.
+
+    Writers only touch their own row, readers copy a row (or the whole table) out. Everything
+    runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._index: Dict[Tuple[str, str], int] = {}
+        self._keys: List[Tuple[str, str]] = []
+        self._rows = self._empty_rows(capacity)
+
+    @staticmethod
+    def _empty_rows(capacity: int) -> np.ndarray:
+        rows = np.zeros(capacity, dtype=FUNDING_TABLE_DTYPE)
+        for field in ('funding_rate', 'mark_price', 'index_price'):
+            rows[field] = np.nan
+        return rows
+
+    def _slot(self, exchange: str, symbol: str) -> int:
+        key = (exchange, symbol)
+        slot = self._index.get(key)
+        if slot is None:
+            slot = len(self._keys)
+            if slot >= len(self._rows):
+                grown = self._empty_rows(len(self._rows) * 2)
+                grown[:slot] = self._rows
+                self._rows = grown
+            self._index[key] = slot
+            self._keys.append(key)
+        return slot
+
+    def update(self, exchange: str, symbol: str, updated_at: Optional[int] = None, **fields) -> Dict[str, float]:
+        """Write the given fields, returns the ones whose value actually changed"""
+        symbol = FundingIntervalCache.normalize_symbol(symbol)
+        slot = self._slot(exchange, symbol)  # may grow (replace) self._rows
+        row = self._rows[slot]
+        changed = {}
+        for field, value in fields.items():
+            if value is None or field not in FUNDING_FIELDS:
+                continue
+            if row[field] != value:
+                row[field] = value
+                changed[field] = value
+        row['updated_at'] = updated_at or int(time.time() * 1000)
+        return changed
+
+    @staticmethod
+    def _to_dict(exchange: str, symbol: str, row: np.void) -> dict:
+        entry = {"exchange": exchange, "symbol": symbol}
+        for field in FUNDING_FIELDS:
+            value = row[field].item()
+            entry[field] = None if isinstance(value, float) and np.isnan(value) else value
+        return entry
+
+    def get(self, exchange: str, symbol: str, max_age: Optional[float] = None) -> Optional[dict]:
+        """One row, None if unknown or older than `max_age` seconds"""
+        slot = self._index.get((exchange, FundingIntervalCache.normalize_symbol(symbol)))
+        if slot is None:
+            return None
+        row = self._rows[slot]
+        if max_age is not None and (time.time() * 1000 - row['updated_at']) > max_age * 1000:
+            return None
+        return self._to_dict(exchange, self._keys[slot][1], row)
+
+    def get_symbol(self, symbol: str, max_age: Optional[float] = None) -> Dict[str, dict]:
+        """Every exchange quoting `symbol`"""
+        symbol = FundingIntervalCache.normalize_symbol(symbol)
+        result = {}
+        for exchange in self.exchanges():
+            entry = self.get(exchange, symbol, max_age)
+            if entry:
+                result[exchange] = entry
+        return result
+
+    def symbols(self, exchange: str) -> List[str]:
+        return [symbol for key_exchange, symbol in self._keys if key_exchange == exchange]
+
+    def exchanges(self) -> List[str]:
+        return sorted({exchange for exchange, _ in self._keys})
+
+    def snapshot(self, exchange: Optional[str] = None) -> List[dict]:
+        rows = self._rows[:len(self._keys)].copy()
+        return [
+            self._to_dict(key[0], key[1], rows[slot])
+            for slot, key in enumerate(self._keys)
+            if exchange is None or key[0] == exchange
+        ]
+
+    def column(self, exchange: str, field: str) -> Tuple[List[str], np.ndarray]:
+        """(symbols, values) of one field for a whole exchange, for vectorized consumers"""
+        slots = [slot for slot, key in enumerate(self._keys) if key[0] == exchange]
+        return [self._keys[slot][1] for slot in slots], self._rows[field][slots].copy()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, "", "0", 0) else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ExchangeFeed(abc.ABC):
+    """
+    One reconnecting WebSocket connection.
+
+    Subclasses provide the url, the messages to send after every (re)connect and the parser,
+    this class owns the receive loop, idle detection and backoff.
+    """
+
+    exchange = ""
+    send_interval = 0.0  # minimum seconds between two frames sent on the connection
+
+    def __init__(self, url: str, table: FundingTable, idle_timeout: float = 30.0, max_backoff: float = 60.0) -> None:
+        self.url = url
+        self.table = table
+        self.idle_timeout = idle_timeout
+        self.max_backoff = max_backoff
+        self.listeners: List[Callable[[str, str, Dict[str, float]], None]] = []
+        self._ws = None
+        self._send_lock = asyncio.Lock()
+        self._last_send = 0.0
+        self._stats = {"connected": False, "connects": 0, "reconnects": 0, "messages": 0, "updates": 0, "errors": 0, "last_message_at": None}
+
+    async def subscriptions(self) -> List[str]:
+        return []
+
+    @abc.abstractmethod
+    def parse(self, message: str) -> Iterable[Tuple[str, dict]]:
+        """Exchange message -> (symbol, table fields) pairs"""
+
+    async def keepalive(self, ws) -> None:
+        """Application level ping, the protocol level one is handled by websockets"""
+        await asyncio.Event().wait()
+
+    def handle(self, message: str) -> None:
+        self._stats["messages"] += 1
+        self._stats["last_message_at"] = int(time.time() * 1000)
+        for symbol, fields in self.parse(message):
+            changed = self.table.update(self.exchange, symbol, **fields)
+            self._stats["updates"] += 1
+            if changed:
+                for listener in self.listeners:
+                    listener(self.exchange, FundingIntervalCache.normalize_symbol(symbol), changed)
+
+    async def _session(self) -> None:
+        async with websockets.connect(self.url, ping_interval=20, max_size=2 ** 24) as ws:
+            self._ws = ws
+            self._stats["connected"] = True
+            self._stats["connects"] += 1
+            for message in await self.subscriptions():
+                await self._paced_send(ws, message)
+
+            keepalive = asyncio.create_task(self.keepalive(ws))
+            try:
+                while True:
+                    message = await asyncio.wait_for(ws.recv(), timeout=self.idle_timeout)
+                    self.handle(message)
+            finally:
+                keepalive.cancel()
+                self._ws = None
+                self._stats["connected"] = False
+
+    async def _paced_send(self, ws, message: str) -> None:
+        """Every frame of the connection goes through here, at most one per `send_interval`"""
+        async with self._send_lock:
+            wait = self._last_send + self.send_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await ws.send(message)
+            self._last_send = time.monotonic()
+
+    async def send(self, message: str) -> bool:
+        """Send on the live connection (e.g. a new subscription), False when disconnected"""
+        if self._ws is None:
+            return False
+        await self._paced_send(self._ws, message)
+        return True
+
+    async def run(self) -> None:
+        """Connect forever, exponential backoff with jitter between failed sessions"""
+        backoff = 1.0
+        while True:
+            started = time.monotonic()
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                print(f"{self.exchange} stream idle for {self.idle_timeout}s, reconnecting")
+            except websockets.ConnectionClosed as e:
+                print(f"{self.exchange} stream closed ({e.rcvd.code if e.rcvd else 'no close frame'}), reconnecting")
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"{self.exchange} stream error: {e}")
+
+            # A session that lived for a while resets the backoff
+            if time.monotonic() - started > 60:
+                backoff = 1.0
+            self._stats["reconnects"] += 1
+            await asyncio.sleep(backoff * (0.5 + random.random() / 2))
+            backoff = min(self.max_backoff, backoff * 2)
+
+    def snapshot(self) -> dict:
+        return {"url": self.url, **self._stats}
+
+
+class BinanceMarkPriceFeed(ExchangeFeed):
+    """`!markPrice@arr` pushes every perpetual in one array, no subscription needed"""
+
+    exchange = "binance"
+
+    def __init__(self, table: FundingTable, url: str = BINANCE_STREAM_URL, **kwargs) -> None:
+        super().__init__(url, table, **kwargs)
+
+    def parse(self, message: str) -> Iterable[Tuple[str, dict]]:
+        data = json.loads(message)
+        for entry in data if isinstance(data, list) else [data]:
+            if entry.get("e") != "markPriceUpdate" or not entry.get("s"):
+                continue
+            yield entry["s"], {
+                "funding_rate": _float(entry.get("r")),
+                "mark_price": _float(entry.get("p")),
+                "index_price": _float(entry.get("i")),
+                "next_funding_time": _int(entry.get("T")),
+                "updated_at": _int(entry.get("E"))
+            }
+
+
+class BitgetTickerFeed(ExchangeFeed):
+    """
+    Bitget has no market-wide stream: one `ticker` subscription per symbol, sent in batches.
+    The symbol list is refreshed (and the table seeded from REST tickers) on every reconnect.
+    """
+
+    exchange = "bitget"
+    send_interval = BITGET_WS_SEND_INTERVAL_SECONDS
+
+    def __init__(
+        self,
+        table: FundingTable,
+        url: str = BITGET_STREAM_URL,
+        symbols: Optional[Callable[[], Awaitable[List[str]]]] = None,
+        batch_size: int = 50,
+        ping_interval: float = 25.0,
+        **kwargs
+    ) -> None:
+        super().__init__(url, table, **kwargs)
+        self.symbols = symbols or self._rest_symbols
+        self.batch_size = batch_size
+        self.ping_interval = ping_interval
+
+    async def _rest_symbols(self) -> List[str]:
+        """All USDT perpetuals, seeding the table with the REST ticker values on the way"""
+        url = BITGET_URL + "/api/v2/mix/market/tickers"
+        async with aiohttp.ClientSession() as session:
+            async with outbound_limiters.slot(url) as ticket, session.get(url, params={"productType": "USDT-FUTURES"}) as response:
+                ticket.observe(response.status, response.headers)
+                if response.status != 200:
+                    print(f"Error fetching Bitget tickers: {response.status}")
+                    return self.table.symbols(self.exchange)
+                data = (await response.json()).get("data") or []
+
+        for entry in data:
+            self.table.update(self.exchange, entry["symbol"], **self._fields(entry))
+        return [entry["symbol"] for entry in data]
+
+    @staticmethod
+    def _fields(entry: dict) -> dict:
+        return {
+            "funding_rate": _float(entry.get("fundingRate")),
+            "mark_price": _float(entry.get("markPrice")),
+            "index_price": _float(entry.get("indexPrice")),
+            "next_funding_time": _int(entry.get("nextFundingTime")),
+            "updated_at": _int(entry.get("ts"))
+        }
+
+    async def subscriptions(self) -> List[str]:
+        symbols = await self.symbols()
+        args = [{"instType": "USDT-FUTURES", "channel": "ticker", "instId": symbol} for symbol in symbols]
+        return [
+            json.dumps({"op": "subscribe", "args": args[i:i + self.batch_size]})
+            for i in range(0, len(args), self.batch_size)
+        ]
+
+    async def keepalive(self, ws) -> None:
+        """Bitget drops connections that don't send a text 'ping' every 30s"""
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await self._paced_send(ws, "ping")
+
+    def parse(self, message: str) -> Iterable[Tuple[str, dict]]:
+        if message == "pong":
+            return
+        data = json.loads(message)
+        if data.get("event") == "error":
+            print(f"Bitget stream error: {data.get('msg')}")
+            return
+        if data.get("arg", {}).get("channel") != "ticker":
+            return
+        for entry in data.get("data") or []:
+            if entry.get("instId"):
+                yield entry["instId"], self._fields(entry)
+
+
+class FundingStreamIngest:
+    """Owns the feed tasks, started and stopped from the FastAPI lifespan"""
+
+    def __init__(self, table: FundingTable, feeds: Optional[List[ExchangeFeed]] = None) -> None:
+        self.table = table
+        self.feeds = feeds if feeds is not None else [BinanceMarkPriceFeed(table), BitgetTickerFeed(table)]
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def add_listener(self, listener: Callable[[str, str, Dict[str, float]], None]) -> None:
+        """listener(exchange, symbol, changed_fields) is called for every changed row"""
+        for feed in self.feeds:
+            feed.listeners.append(listener)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._tasks = [asyncio.create_task(feed.run(), name=f"funding-stream-{feed.exchange}") for feed in self.feeds]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "rows": len(self.table),
+            "feeds": {feed.exchange: feed.snapshot() for feed in self.feeds}
+        }
+
+
+funding_table = FundingTable()
+funding_ingest = FundingStreamIngest(funding_table)
+
+
+async def main_testing():
+    """Run both feeds against a local stand-in server that drops the connection after each push"""
+    async def stand_in(ws):
+        async for message in ws:
+            if message == "ping":
+                await ws.send("pong")
+                continue
+            request = json.loads(message)
+            for arg in request.get("args", []):
+                await ws.send(json.dumps({
+                    "action": "snapshot", "arg": arg,
+                    "data": [{"instId": arg["instId"], "fundingRate": "0.0003", "markPrice": "1.5", "indexPrice": "1.49", "nextFundingTime": "1700000000000", "ts": str(int(time.time() * 1000))}]
+                }))
+            await ws.close()
+
+    async def binance_stand_in(ws):
+        await ws.send(json.dumps([
+            {"e": "markPriceUpdate", "E": int(time.time() * 1000), "s": "BTCUSDT", "p": "65000.1", "i": "64990.2", "r": "0.00010000", "T": 1700000000000},
+            {"e": "markPriceUpdate", "E": int(time.time() * 1000), "s": "ETHUSDT", "p": "3500.5", "i": "3499.9", "r": "-0.00002000", "T": 1700000000000}
+        ]))
+        await ws.close()
+
+    async def symbols():
+        return ["BTCUSDT", "SOLUSDT"]
+
+    table = FundingTable(capacity=1)
+    async with websockets.serve(stand_in, "127.0.0.1", 0) as bitget_server, websockets.serve(binance_stand_in, "127.0.0.1", 0) as binance_server:
+        bitget_port = bitget_server.sockets[0].getsockname()[1]
+        binance_port = binance_server.sockets[0].getsockname()[1]
+        ingest = FundingStreamIngest(table, [
+            BinanceMarkPriceFeed(table, url=f"ws://127.0.0.1:{binance_port}", max_backoff=0.2),
+            BitgetTickerFeed(table, url=f"ws://127.0.0.1:{bitget_port}", symbols=symbols, max_backoff=0.2)
+        ])
+        ingest.add_listener(lambda exchange, symbol, changed: print("changed ->", exchange, symbol, changed))
+        await ingest.start()
+        await asyncio.sleep(2)
+        await ingest.stop()
+
+    print("BTC ->", table.get_symbol("btc"))
+    print("stats ->", ingest.snapshot())
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
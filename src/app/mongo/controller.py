@@ -1,7 +1,9 @@
-from typing import TypedDict, Optional, Dict
+from typing import TypedDict, Optional, Dict, List
 from bson import ObjectId
-import asyncio, re
+from pymongo import UpdateOne
+import asyncio, re, uuid
 
+from src.app.redis_layer import RedisService
 from .database import ConnectionMongo
 from .schema import *
 
@@ -19,6 +21,15 @@ class MongoDB_Crypto(ConnectionMongo):
 
         # Historical funding rate Collections
         self.count_collection = self.db_historical_funding_rate["count"]
+        self.analysis_collection = self.db_historical_funding_rate["analysis"]
+
+        # Redis fr_expiration:{interval} index, kept in step with funding_rate_interval (created on first write)
+        self._interval_index = None
+
+    def _index_funding_interval(self, symbol: str, interval):
+        if self._interval_index is None:
+            self._interval_index = RedisService()
+        self._interval_index.set_funding_interval(symbol, interval)
 
 
     # - - - - LIST  CRYPTOS - - - - 
@@ -90,6 +101,9 @@ class MongoDB_Crypto(ConnectionMongo):
         
         print(f"Matched Count: {result.matched_count}, Modified Count: {result.modified_count}, Upserted ID: {result.upserted_id}")
 
+        if "funding_rate_interval" in document:
+            self._index_funding_interval(symbol, document["funding_rate_interval"])
+
     async def search_metadata(self, query: str, limit: int = 20, offset: int = 0):
         # First, search for exact matches
         exact_filter = {
@@ -156,11 +170,26 @@ class MongoDB_Crypto(ConnectionMongo):
         return None
 
 
+    async def reindex_funding_intervals(self) -> int:
+        """
+        Rebuilds the Redis funding interval index from the stored metadata, returns the symbols indexed.
+        """
+        indexed = 0
+        async for document in self.crypto_collection.find({}, {"_id": 0, "symbol": 1, "funding_rate_interval": 1}):
+            if document.get("symbol"):
+                self._index_funding_interval(document["symbol"], document.get("funding_rate_interval"))
+                indexed += 1
+        return indexed
+
     async def update_crypto_metadata(self, symbol: str, updates: Dict):
         """
         Updates metadata fields for a given cryptocurrency symbol.
         """
-        pass
+        result = await self.crypto_collection.update_one({"symbol": symbol}, {"$set": updates})
+
+        if result.matched_count and "funding_rate_interval" in updates:
+            self._index_funding_interval(symbol, updates["funding_rate_interval"])
+        return result.modified_count > 0
 
     async def delete_crypto_metadata(self, symbol: str):
         """
@@ -173,15 +202,107 @@ class MongoDB_Crypto(ConnectionMongo):
 
     async def add_funding_rate_analysis(self, symbol: str, funding_rate_analysis: FundingRateAnalysis):
         """
-        Adds a new funding rate analysis entry for a given cryptocurrency symbol.
+        Adds the funding rate analysis entry of a period for a given cryptocurrency symbol.
+        Keyed by (symbol, period_ts) like the backfill, a period stored twice is overwritten.
         """
-        pass
+        document = {"id": str(uuid.uuid4()), **funding_rate_analysis, "symbol": symbol}
+        return await self.bulk_upsert_funding_rate_analysis([document])
 
-    async def set_last_analysis(self, symbol: str, analysis_data: Dict):
+    async def get_symbols_with_analysis(self, symbols: List[str]) -> List[str]:
         """
-        Sets the last analysis data for a given cryptocurrency symbol.
+        The subset of `symbols` that already has funding rate analysis entries stored.
         """
-        pass
+        if not symbols:
+            return []
+        stored = set(await self.analysis_collection.distinct("symbol", {"symbol": {"$in": list(symbols)}}))
+        return [symbol for symbol in symbols if symbol in stored]
+
+    async def get_funding_rate_histories(self, symbols: List[str], limit: int = 50) -> List[Dict]:
+        """
+        The last `limit` funding rate analysis entries of every symbol (oldest first) in one query,
+        [{symbol, data}] for the symbols with a stored history.
+        """
+        if not symbols:
+            return []
+        pipeline = [
+            {"$match": {"symbol": {"$in": list(symbols)}}},
+            {"$group": {
+                "_id": "$symbol",
+                "data": {"$topN": {"n": limit, "sortBy": {"period_ts": -1}, "output": "$$ROOT"}}
+            }},
+            {"$project": {"_id": 0, "symbol": "$_id", "data": {"$reverseArray": "$data"}}},
+            {"$unset": "data._id"},
+            {"$sort": {"symbol": 1}}
+        ]
+        cursor = await self.analysis_collection.aggregate(pipeline)
+        return await cursor.to_list(length=None)
+
+    async def ensure_analysis_indexes(self):
+        """
+        Unique (symbol, period_ts) index, the upsert key of the analysis collection.
+        """
+        await self.analysis_collection.create_index([("symbol", 1), ("period_ts", 1)], unique=True)
+
+    async def bulk_upsert_funding_rate_analysis(self, documents: List[Dict]) -> Dict:
+        """
+        Upserts many funding rate analysis entries in one round trip, keyed by (symbol, period_ts).
+        Re-running a backfill over the same periods overwrites instead of duplicating.
+        """
+        if not documents:
+            return {"upserted": 0, "modified": 0}
+
+        operations = [
+            UpdateOne(
+                {"symbol": document["symbol"], "period_ts": document["period_ts"]},
+                {
+                    "$set": {key: value for key, value in document.items() if key != "id"},
+                    "$setOnInsert": {"id": document["id"]}
+                },
+                upsert=True
+            )
+            for document in documents
+        ]
+        result = await self.analysis_collection.bulk_write(operations, ordered=False)
+        return {"upserted": result.upserted_count, "modified": result.modified_count}
+
+    async def find_funding_events(self, max_rate: Optional[float] = None, min_rate: Optional[float] = None,
+                                  symbols: Optional[List[str]] = None, start: Optional[int] = None,
+                                  end: Optional[int] = None, limit: int = 5000) -> List[Dict]:
+        """
+        Funding periods (symbol, period_ts, funding_rate_value) matching the filter across symbols,
+        most recent first.
+        """
+        query: Dict = {}
+        if max_rate is not None or min_rate is not None:
+            query["funding_rate_value"] = {
+                **({"$lte": max_rate} if max_rate is not None else {}),
+                **({"$gte": min_rate} if min_rate is not None else {})
+            }
+        if symbols:
+            query["symbol"] = {"$in": symbols}
+        if start is not None or end is not None:
+            query["period_ts"] = {
+                **({"$gte": start} if start is not None else {}),
+                **({"$lte": end} if end is not None else {})
+            }
+
+        cursor = self.analysis_collection.find(
+            query, {"_id": 0, "symbol": 1, "period_ts": 1, "funding_rate_value": 1}
+        ).sort("period_ts", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def set_last_analysis(self, symbol: str, analysis_data: Dict, period_ts: Optional[int] = None):
+        """
+        Sets the analysis data of a period (the latest stored one by default) for a given cryptocurrency symbol.
+        """
+        query: Dict = {"symbol": symbol}
+        if period_ts is not None:
+            query["period_ts"] = int(period_ts)
+        document = await self.analysis_collection.find_one(query, {"_id": 1}, sort=[("period_ts", -1)])
+        if document is None:
+            return False
+        result = await self.analysis_collection.update_one({"_id": document["_id"]}, {"$set": {"analysis": analysis_data}})
+        return result.matched_count > 0
 
     async def get_funding_rate_history(self, symbol: str, limit: Optional[int] = None):
         """
@@ -2,6 +2,11 @@ from typing import List, TypedDict, Optional, Dict
 from datetime import datetime
 
 class FundingRateAnalysis(TypedDict, total=False):
-    period: datetime
+    id: str
+    symbol: str
+    period: str  # ISO time, Europe/Amsterdam
+    period_ts: int
     funding_rate_value: float
-    analysis: Optional[Dict]
\ No newline at end of file
+    index_period_price: float
+    key_moment: bool
+    analysis: Optional[Dict]
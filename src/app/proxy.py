@@ -1,17 +1,133 @@
 # File: src/app/proxy.py
 
-from typing import Literal, Optional
+from typing import Dict, List, Literal, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio, time, random
 import httpx
 import os
 from dotenv import load_dotenv
-from tenacity import retry, wait_exponential, stop_after_attempt
+
+from src.app.rate_control import outbound_limiters, OVERLOAD_STATUSES
+from src.app.resilience import host_health, HostHealth
 
 load_dotenv()
 
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when the h2 package is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 CUSTOMER_ID = os.getenv("BRIGHTDATA_CUSTOMER_ID", "hl_9f87e5f6")
 PROXY_ADDRESS = "brd.superproxy.io:33335"
-ZONES = ["isp_proxy1"]
+ZONES = [zone.strip() for zone in os.getenv("BRIGHTDATA_ZONES", "isp_proxy1").split(",") if zone.strip()]
 PROXY_PASSWORD = os.getenv("BRIGHTDATA_PROXY_PASSWORD", "79c83umx6jkd") 
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = float(os.getenv("PROXY_RETRY_BACKOFF_SECONDS", "0.25"))
+
+# (host, path prefix) -> route. Longest prefix wins, anything not listed goes through the proxy.
+# Public market data doesn't need the proxy hop, so the high volume endpoints are sent direct.
+ROUTES: Dict[Tuple[str, str], Literal["direct", "proxy"]] = {
+    ("fapi.binance.com", "/fapi/v1/klines"): "direct",
+    ("fapi.binance.com", "/fapi/v1/fundingRate"): "direct",
+    ("fapi.binance.com", "/fapi/v1/fundingInfo"): "direct",
+    ("fapi.binance.com", "/fapi/v1/premiumIndex"): "direct",
+    ("fapi.binance.com", "/fapi/v1/ticker"): "direct",
+    ("fapi.binance.com", "/fapi/v1/exchangeInfo"): "direct",
+    ("api.bitget.com", "/api/v2/mix/market"): "direct",
+    ("api.bitget.com", "/api/mix/v1/market"): "direct",
+}
+if os.getenv("PROXY_ALL_ROUTES", "false").lower() == "true":
+    ROUTES = {}
+
+
+class TransportPool:
+    """
+    Shared HTTP clients: one direct client and one client per proxy zone.
+
+    Clients are shared by every APIProxy instance so connections (HTTP/2 streams when the
+    upstream supports it) are reused instead of being opened per service object. Proxied calls
+    go to the zone with the lowest observed latency (EWMA), with a small share of exploration
+    so a zone that got faster is noticed again.
+    """
+
+    def __init__(self, zones: List[str], customer_id: str, proxy_address: str, proxy_pass: str, timeout: float = 10.0, explore: float = 0.1) -> None:
+        self.zones = zones
+        self.customer_id = customer_id
+        self.proxy_address = proxy_address
+        self.proxy_pass = proxy_pass
+        self.timeout = timeout
+        self.explore = explore
+
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._latency: Dict[str, Optional[float]] = {label: None for label in ["direct", *zones]}
+        self._requests: Dict[str, int] = {label: 0 for label in ["direct", *zones]}
+        self._errors: Dict[str, int] = {label: 0 for label in ["direct", *zones]}
+
+    def construct_proxy_url(self, zone: str) -> str:
+        return f"http://brd-customer-{self.customer_id}-zone-{zone}:{self.proxy_pass}@{self.proxy_address}"
+
+    def _client(self, label: str) -> httpx.AsyncClient:
+        client = self._clients.get(label)
+        if client is None or client.is_closed:
+            proxy = None if label == "direct" else self.construct_proxy_url(label)
+            client = httpx.AsyncClient(proxy=proxy, http2=HTTP2_AVAILABLE, timeout=self.timeout)
+            self._clients[label] = client
+        return client
+
+    @staticmethod
+    def route_for(url: str) -> Literal["direct", "proxy"]:
+        parsed = urlparse(url)
+        host, path = parsed.netloc.lower(), parsed.path
+        best, route = -1, "proxy"
+        for (route_host, prefix), mode in ROUTES.items():
+            if host == route_host and path.startswith(prefix) and len(prefix) > best:
+                best, route = len(prefix), mode
+        return route
+
+    def pick_zone(self) -> str:
+        untried = [zone for zone in self.zones if self._latency[zone] is None]
+        if untried:
+            return untried[0]
+        if len(self.zones) > 1 and random.random() < self.explore:
+            return random.choice(self.zones)
+        return min(self.zones, key=lambda zone: self._latency[zone])
+
+    def client_for(self, url: str) -> Tuple[str, httpx.AsyncClient]:
+        """Returns (route label, client), label is 'direct' or the proxy zone"""
+        label = "direct" if self.route_for(url) == "direct" else self.pick_zone()
+        return label, self._client(label)
+
+    def record(self, label: str, latency: float, ok: bool) -> None:
+        self._requests[label] += 1
+        if not ok:
+            self._errors[label] += 1
+            # A failing zone looks slow, so traffic drifts to the healthy ones
+            latency = max(latency, self.timeout)
+        previous = self._latency[label]
+        self._latency[label] = latency if previous is None else 0.8 * previous + 0.2 * latency
+
+    def snapshot(self) -> dict:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "routes": {
+                label: {
+                    "latency_ewma": round(self._latency[label], 4) if self._latency[label] is not None else None,
+                    "requests": self._requests[label],
+                    "errors": self._errors[label]
+                }
+                for label in self._latency
+            }
+        }
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+transport_pool = TransportPool(ZONES, CUSTOMER_ID, PROXY_ADDRESS, PROXY_PASSWORD)
+
 
 class APIProxy:
     def __init__(self) -> None:
@@ -19,56 +135,135 @@ class APIProxy:
         self.zones = ZONES
         self.proxy_address = PROXY_ADDRESS
         self.proxy_pass = PROXY_PASSWORD  # Retrieved from environment
-        self.client = httpx.AsyncClient(proxies=self.construct_proxy_url(), timeout=10.0)
+        self.transport = transport_pool
 
-    def construct_proxy_url(self) -> str:
-        return f"http://brd-customer-{self.customer_id}-zone-{self.zones[0]}:{self.proxy_pass}@{self.proxy_address}"
+    def construct_proxy_url(self, zone: Optional[str] = None) -> str:
+        return self.transport.construct_proxy_url(zone or self.zones[0])
 
-    @retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(3))
     async def curl_api(
         self, 
         url: str, 
         method: Literal['GET', 'POST', 'PUT', 'DELETE'] = 'GET', 
         body: Optional[dict] = None, 
-        headers: Optional[dict] = None
+        headers: Optional[dict] = None,
+        hedge: bool = False
     ):
-        """Send request using static PROXY and ensure JSON or text response."""
-        if not self.proxy_pass:
+        """
+        Send request (direct or through the fastest proxy zone, see ROUTES) and ensure JSON or text response.
+        Concurrency is governed by the adaptive limiter of the (exchange, endpoint) pair, a 429/418
+        pauses that limiter for Retry-After and the request is tried again instead of sleeping blindly.
+        Every host has a circuit breaker: while it's open the call fails fast with an error dict.
+        Failed attempts (no answer or 5xx) are retried with exponential backoff and jitter.
+        hedge=True (GET only) fires a second attempt if the first one is slower than the host's p95.
+        """
+        if not self.proxy_pass and self.transport.route_for(url) == "proxy":
             raise Exception("Proxy password not set. Ensure PROXY_PASSWORD is correctly configured.")
 
         method = method.upper()
-        request_method = getattr(self.client, method.lower(), None)
-        if not request_method:
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
             raise ValueError(f"Unsupported HTTP method: {method}")
-        
+
+        health = host_health.get(urlparse(url).netloc)
+        result = None
+        for attempt in range(MAX_ATTEMPTS):
+            if not health.breaker.allow_request():
+                return {"error": f"Circuit open for {health.host}", "details": health.breaker.snapshot()}
+
+            # A cancelled attempt (client gone, hedged loser) must not keep the half-open probe slot
+            completed = False
+            try:
+                if hedge and method == "GET":
+                    status, result = await self._send_hedged(health, url, method, body, headers)
+                else:
+                    status, result = await self._send(health, url, method, body, headers)
+                completed = True
+            finally:
+                if not completed:
+                    health.breaker.release()
+
+            if status is None or status >= 500:
+                health.breaker.record_failure()
+                if attempt < MAX_ATTEMPTS - 1:
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt * (1 + random.random()))
+                continue
+            health.breaker.record_success()
+            if status not in OVERLOAD_STATUSES:
+                break
+        return result
+
+    async def _send_hedged(self, health: HostHealth, url: str, method: str, body: Optional[dict], headers: Optional[dict]):
+        """Send once, and once more if no answer arrived after the p95 delay. First good answer wins."""
+        primary = asyncio.ensure_future(self._send(health, url, method, body, headers))
+        done, _ = await asyncio.wait({primary}, timeout=health.hedge_delay())
+        if done:
+            return primary.result()
+
+        health.hedges_sent += 1
+        backup = asyncio.ensure_future(self._send(health, url, method, body, headers))
+        pending = {primary, backup}
+        result = None
         try:
-            if method == "GET":
-                response = await request_method(url, params=body, headers=headers)
-            else:
-                response = await request_method(url, json=body, headers=headers)
-            
-            response.raise_for_status()  # Raises an exception for 4xx/5xx responses
-            
-            # Determine response type based on Content-Type header
-            content_type = response.headers.get("Content-Type", "")
-            if "application/json" in content_type:
-                return response.json()
-            else:
-                return response.text
-        except httpx.HTTPStatusError as e:
-            return {
-                "error": f"HTTP error: {e.response.status_code}",
-                "details": e.response.text
-            }
-        except httpx.RequestError as e:
-            return {
-                "error": f"Request error: {str(e)}"
-            }
-        except Exception as e:
-            return {
-                "error": f"Unexpected error: {str(e)}"
-            }
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    status = result[0]
+                    if status is not None and status < 500:
+                        if task is backup:
+                            health.hedges_won += 1
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, health: HostHealth, url: str, method: str, body: Optional[dict], headers: Optional[dict]):
+        """Single attempt, returns (status, parsed response or error dict)"""
+        async with outbound_limiters.slot(url) as ticket:
+            route, client = self.transport.client_for(url)
+            request_method = getattr(client, method.lower())
+            try:
+                if method == "GET":
+                    response = await request_method(url, params=body, headers=headers)
+                else:
+                    response = await request_method(url, json=body, headers=headers)
+                latency = time.monotonic() - ticket.started
+                health.latency.record(latency)
+                self.transport.record(route, latency, response.status_code < 500)
+
+                # Bitget answers rate limits with code 429 in the body as well
+                status = response.status_code
+                content_type = response.headers.get("Content-Type", "")
+                if "application/json" in content_type:
+                    data = response.json()
+                    if isinstance(data, dict) and str(data.get("code")) == "429":
+                        status = 429
+                else:
+                    data = response.text
+                ticket.observe(status, response.headers)
+
+                response.raise_for_status()  # Raises an exception for 4xx/5xx responses
+                return status, data
+            except httpx.HTTPStatusError as e:
+                return e.response.status_code, {
+                    "error": f"HTTP error: {e.response.status_code}",
+                    "details": e.response.text
+                }
+            except httpx.RequestError as e:
+                self.transport.record(route, time.monotonic() - ticket.started, False)
+                return None, {
+                    "error": f"Request error: {str(e)}"
+                }
+            except Exception as e:
+                return None, {
+                    "error": f"Unexpected error: {str(e)}"
+                }
+
+    @staticmethod
+    def is_error(data) -> bool:
+        """curl_api reports failures as {"error": ...} instead of raising"""
+        return isinstance(data, dict) and "error" in data
 
     async def close_client(self):
-        """Close the AsyncClient when done."""
-        await self.client.aclose()
+        """Close the shared clients when done (they are rebuilt on the next request)."""
+        await self.transport.aclose()
@@ -0,0 +1,240 @@
+# File: src/app/rate_control.py
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+
+# Exchange quotas, used to slow down before the exchange starts answering 429
+BINANCE_WEIGHT_LIMIT_1M = 2400
+OVERLOAD_STATUSES = (418, 429)
+
+DEFAULT_LIMITS = {
+    # exchange: (initial, min, max)
+    "binance": (5, 1, 40),
+    "bitget": (5, 1, 20),
+    "default": (5, 1, 20),
+}
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency limit.
+
+    Every healthy response grows the limit by `increase / limit` (about +1 per full window of
+    requests), while a 429/418, a timeout, a latency spike or a quota header close to the cap
+    cuts it by `decrease`. Cuts are rate limited by `cooldown` so one burst of 429s counts once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: float = 5,
+        min_limit: float = 1,
+        max_limit: float = 20,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_factor: float = 3.0,
+        min_spike_latency: float = 1.0,
+        weight_threshold: float = 0.8,
+        cooldown: float = 1.0
+    ) -> None:
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_spike_latency = min_spike_latency
+        self.weight_threshold = weight_threshold
+        self.cooldown = cooldown
+
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self.used_weight: Optional[int] = None
+        self.paused_until = 0.0
+
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+        self._counters = {"requests": 0, "overloads": 0, "latency_spikes": 0, "decreases": 0}
+
+    # ------------------- ACQUIRE / RELEASE -------------------
+
+    async def acquire(self) -> None:
+        while True:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+
+            async with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    self._counters["requests"] += 1
+                    return
+                # Wake up on release or after a while, the limit may have grown in between
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        """async with limiter.slot() as ticket: ... ticket.observe(status, headers)"""
+        await self.acquire()
+        ticket = LimiterTicket(self)
+        try:
+            yield ticket
+        finally:
+            if not ticket.observed:
+                ticket.observe(None)
+            await self.release()
+
+    # ------------------- FEEDBACK -------------------
+
+    def on_response(self, status: Optional[int], latency: float, headers: Optional[Mapping] = None) -> None:
+        if status in OVERLOAD_STATUSES:
+            self._counters["overloads"] += 1
+            self._pause_from_headers(headers)
+            self.on_overload()
+            return
+
+        if status is None or status >= 500:
+            # Transport error or exchange failure, don't grow on it
+            self.on_overload()
+            return
+
+        if self._is_latency_spike(latency):
+            self._counters["latency_spikes"] += 1
+            self.on_overload()
+        elif not self._near_weight_quota(headers):
+            self.limit = min(self.max_limit, self.limit + self.increase / max(self.limit, 1.0))
+
+        # Slow EWMA, so a spike doesn't become the new normal immediately
+        if self.baseline_latency is None:
+            self.baseline_latency = latency
+        else:
+            self.baseline_latency = 0.9 * self.baseline_latency + 0.1 * latency
+
+    def on_overload(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._counters["decreases"] += 1
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+
+    def _is_latency_spike(self, latency: float) -> bool:
+        if self.baseline_latency is None:
+            return False
+        return latency > self.min_spike_latency and latency > self.baseline_latency * self.latency_factor
+
+    def _near_weight_quota(self, headers: Optional[Mapping]) -> bool:
+        """Binance reports the used request weight of the current minute on every response"""
+        if not headers:
+            return False
+        used = headers.get("X-MBX-USED-WEIGHT-1M") or headers.get("x-mbx-used-weight-1m")
+        if used is None:
+            return False
+        try:
+            self.used_weight = int(used)
+        except ValueError:
+            return False
+
+        usage = self.used_weight / BINANCE_WEIGHT_LIMIT_1M
+        if usage >= 0.95:
+            self.on_overload()
+        return usage >= self.weight_threshold
+
+    def _pause_from_headers(self, headers: Optional[Mapping]) -> None:
+        retry_after = headers.get("Retry-After") if headers else None
+        try:
+            seconds = float(retry_after) if retry_after is not None else self.cooldown
+        except ValueError:
+            seconds = self.cooldown
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "baseline_latency": round(self.baseline_latency, 4) if self.baseline_latency else None,
+            "used_weight_1m": self.used_weight,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            **self._counters
+        }
+
+
+class LimiterTicket:
+    """Measures one request and feeds the outcome back into its limiter"""
+
+    def __init__(self, limiter: AdaptiveConcurrencyLimiter) -> None:
+        self.limiter = limiter
+        self.started = time.monotonic()
+        self.observed = False
+
+    def observe(self, status: Optional[int], headers: Optional[Mapping] = None) -> None:
+        self.observed = True
+        self.limiter.on_response(status, time.monotonic() - self.started, headers)
+
+
+def classify_url(url: str) -> Tuple[str, str]:
+    """Map a request URL to (exchange, endpoint class)"""
+    parsed = urlparse(url)
+    host, path = parsed.netloc.lower(), parsed.path.lower()
+
+    if "binance" in host:
+        exchange = "binance"
+    elif "bitget" in host:
+        exchange = "bitget"
+    else:
+        exchange = host or "default"
+
+    if "kline" in path or "candles" in path:
+        endpoint_class = "candles"
+    elif "fund" in path:
+        endpoint_class = "funding"
+    elif "account" in path or "order" in path:
+        endpoint_class = "account"
+    else:
+        endpoint_class = "market"
+
+    return exchange, endpoint_class
+
+
+class LimiterRegistry:
+    """One adaptive limiter per (exchange, endpoint class), created on first use"""
+
+    def __init__(self) -> None:
+        self._limiters: Dict[Tuple[str, str], AdaptiveConcurrencyLimiter] = {}
+
+    def get(self, exchange: str, endpoint_class: str) -> AdaptiveConcurrencyLimiter:
+        key = (exchange, endpoint_class)
+        if key not in self._limiters:
+            initial, min_limit, max_limit = DEFAULT_LIMITS.get(exchange, DEFAULT_LIMITS["default"])
+            self._limiters[key] = AdaptiveConcurrencyLimiter(
+                f"{exchange}:{endpoint_class}", initial=initial, min_limit=min_limit, max_limit=max_limit
+            )
+        return self._limiters[key]
+
+    def for_url(self, url: str) -> AdaptiveConcurrencyLimiter:
+        return self.get(*classify_url(url))
+
+    def slot(self, url: str):
+        return self.for_url(url).slot()
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {limiter.name: limiter.snapshot() for limiter in self._limiters.values()}
+
+
+outbound_limiters = LimiterRegistry()
@@ -5,11 +5,13 @@ import json
 import time
 import re
 import numpy as np
-from typing import List, Literal, Dict, TypedDict, Optional, Tuple
+from typing import Callable, List, Literal, Dict, TypedDict, Optional, Tuple
 from fastapi import HTTPException
 from datetime import datetime, timezone
 from pprint import pprint
 
+from src.app.tdigest import TDigest
+
 class FundingRateAnalysis(TypedDict, total=False):
     period: datetime
     funding_rate_value: float
@@ -29,20 +31,84 @@ class CryptoMetadata(TypedDict):
     funding_rate_del: str
     description: str
 
+def redis_address() -> Tuple[str, int]:
+    """(host, port) of the Redis instance for the current deployment"""
+    hostname = socket.gethostname()
+    print("HOSTNAME! -> ", hostname)
+    if hostname == 'mamadocomputer':
+        # Developerment deployment
+        return 'localhost', 6378
+    # Server / Test deployment
+    return 'redis_tasks', 6379
+
+FUNDING_PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+FUNDING_SKETCH_EXCHANGES = ("bitget", "binance")
+FUNDING_LEADERBOARD_EXCHANGES = ("bitget", "binance")
+FUNDING_INTERVALS = ("1h", "2h", "4h", "8h")
+FUNDING_LEADERBOARD_INTERVALS = FUNDING_INTERVALS
+
+# Score the symbol on the exchange-wide board and on the board of its funding interval. An unknown
+# interval ('') keeps the last one seen, a changed interval moves the symbol between boards.
+# Every key is passed in KEYS (same {exchange} hash tag, one cluster slot):
+# KEYS[1] exchange board, KEYS[2] symbol -> interval hash, KEYS[3..] the interval boards named by ARGV[4..]
+LEADERBOARD_SCRIPT = """
+local boards = {}
+for i = 4, #ARGV do boards[ARGV[i]] = KEYS[i - 1] end
+redis.call('zadd', KEYS[1], ARGV[2], ARGV[1])
+local previous = redis.call('hget', KEYS[2], ARGV[1])
+local interval = ARGV[3]
+if interval == '' then interval = previous end
+if previous and previous ~= interval and boards[previous] then redis.call('zrem', boards[previous], ARGV[1]) end
+if interval and boards[interval] then
+    redis.call('hset', KEYS[2], ARGV[1], interval)
+    redis.call('zadd', boards[interval], ARGV[2], ARGV[1])
+end
+return 1
+"""
+
+
+def normalize_funding_interval(interval) -> Optional[str]:
+    """'8', 8, 8.0 and '8h' -> '8h', None for anything that isn't a known funding interval"""
+    if interval is None:
+        return None
+    try:
+        hours = int(float(str(interval).strip().lower().rstrip("h")))
+    except ValueError:
+        return None
+    interval = f"{hours}h"
+    return interval if interval in FUNDING_INTERVALS else None
+
+
+def leaderboard_key(exchange: str, interval: str = "all") -> str:
+    return f"fr_leaderboard:{{{exchange}}}:{interval}"
+
+
+def leaderboard_interval_key(exchange: str) -> str:
+    return f"fr_leaderboard_interval:{{{exchange}}}"
+
+
+def leaderboard_call(exchange: str, symbol: str, funding_rate_value: float, interval: Optional[str] = None) -> Tuple[List[str], List]:
+    """(keys, args) of LEADERBOARD_SCRIPT, shared by the sync service and the async stream writer"""
+    keys = [leaderboard_key(exchange), leaderboard_interval_key(exchange)]
+    keys += [leaderboard_key(exchange, board) for board in FUNDING_LEADERBOARD_INTERVALS]
+    return keys, [symbol, funding_rate_value, interval or "", *FUNDING_LEADERBOARD_INTERVALS]
+
+
+# Blocking (exchange, symbol, before) -> [[period_ts, funding_rate %]] settled before `before`, seeds
+# the quantile sketches missing in Redis (see funding_history.FundingHistoryStore.seeder)
+_funding_history_source: Optional[Callable[[str, str, int], np.ndarray]] = None
+
+
+def set_funding_history_source(source: Optional[Callable[[str, str, int], np.ndarray]]) -> None:
+    global _funding_history_source
+    _funding_history_source = source
+
+
 class RedisService:
     def __init__(self) -> None:
-        hostname = socket.gethostname()
-        print("HOSTNAME! -> ", hostname)
-        if hostname == 'mamadocomputer':
-            # Developerment deployment
-            redis_host = 'localhost'
-            port = 6378 
-        else: 
-            # Server / Test deployment
-            redis_host = 'redis_tasks'  
-            port = 6379
-
+        redis_host, port = redis_address()
         self._r = redis.Redis(host=redis_host, port=port, decode_responses=True)
+        self._leaderboard_script = self._r.register_script(LEADERBOARD_SCRIPT)
 
     # ------------------- LIST_CRYPTO FUNCTIONS -------------------
 
@@ -114,6 +180,7 @@ class RedisService:
 
         # Add symbol to list_crypto
         self.add_to_list_crypto(symbol)
+        self.set_funding_interval(symbol, funding_rate_del)
 
     def get_crypto_metadata(self, symbol: str) -> Optional[CryptoMetadata]:
         """
@@ -140,6 +207,9 @@ class RedisService:
         metadata.update(updates)
         try:
             self._r.hset("crypto_metadata", symbol, json.dumps(metadata))
+            for field in ("funding_rate_interval", "funding_rate_del"):
+                if field in updates:
+                    self.set_funding_interval(symbol, updates[field])
             print(f"Successfully updated metadata for symbol: {symbol}")
             return True
         except redis.RedisError as e:
@@ -156,6 +226,7 @@ class RedisService:
                 print(f"Successfully deleted metadata for symbol: {symbol}")
                 self.remove_from_list_crypto(symbol)
                 self.delete_all_analysis_for_symbol(symbol)
+                self.set_funding_interval(symbol, None)
                 return True
             else:
                 print(f"No metadata found for symbol: {symbol}")
@@ -316,6 +387,8 @@ class RedisService:
         Deletes all analysis-related data for a specific cryptocurrency symbol.
         """
         self._r.hdel("all_crypto_analysis", symbol)
+        self._r.delete(*[f"fr_digest:{exchange}:{symbol}" for exchange in FUNDING_SKETCH_EXCHANGES])
+        self.remove_from_funding_leaderboards(symbol)
 
     def delete_all_analysis(self) -> str:
         """
@@ -323,10 +396,196 @@ class RedisService:
         """
         try:
             self._r.delete("all_crypto_analysis")
+            for pattern in ("fr_digest:*", "fr_leaderboard*"):
+                for key in self._r.scan_iter(match=pattern, count=500):
+                    self._r.delete(key)
             return "All analysis-related data has been successfully deleted from 'all_crypto_analysis'."
         except redis.RedisError as e:
             raise HTTPException(status_code=400, detail=f"An error occurred while deleting analysis data: {e}")
 
+    # ------------------- FUNDING_SKETCH FUNCTIONS -------------------
+
+    def _funding_seed(self, exchange: str, symbol: str, before: Optional[int], fetched: List[np.ndarray]) -> Optional[np.ndarray]:
+        """
+        Settled history a missing sketch starts from, fetched once per transaction (`fetched` survives
+        the WATCH retries). Empty without a history source, None if the source failed.
+        """
+        if not fetched:
+            if _funding_history_source is None:
+                fetched.append(np.empty((0, 2)))
+            else:
+                try:
+                    before = before if before is not None else int(time.time() * 1000)
+                    rows = _funding_history_source(exchange, symbol, before)
+                    fetched.append(np.asarray(rows, dtype=np.float64).reshape(-1, 2))
+                except Exception as e:
+                    print(f"Error fetching the funding history to seed the sketch of {symbol} ({exchange}): {e}")
+                    return None
+        return fetched[0]
+
+    def record_funding_value(self, symbol: str, funding_rate_value: float, period_ts: Optional[int] = None, exchange: str = "bitget") -> bool:
+        """
+        Adds a settled funding rate (percent) to the quantile sketch of the symbol on an exchange.
+        A period already recorded (period_ts <= last recorded) is skipped, so replays don't double count.
+        A missing sketch is first seeded with the settled history before the period, in the same transaction.
+        """
+        key = f"fr_digest:{exchange}:{symbol}"
+        fetched: List[np.ndarray] = []
+
+        def update(pipe) -> bool:
+            stored = pipe.hgetall(key)
+            if period_ts is not None and stored.get("last_ts") and int(stored["last_ts"]) >= period_ts:
+                return False
+            if stored.get("digest"):
+                digest = TDigest.from_string(stored["digest"])
+            else:
+                history = self._funding_seed(exchange, symbol, period_ts, fetched)
+                if history is None:
+                    return False  # retried at the next settlement, the history will hold this one
+                digest = TDigest()
+                digest.update(history[:, 1])
+            digest.add(funding_rate_value)
+            pipe.multi()
+            pipe.hset(key, mapping={"digest": digest.to_string(), "last_ts": period_ts if period_ts is not None else stored.get("last_ts", 0)})
+            return True
+
+        try:
+            return self._r.transaction(update, key, value_from_callable=True)
+        except redis.RedisError as e:
+            print(f"Redis error while recording the funding sketch of {symbol} ({exchange}): {e}")
+            return False
+
+    def seed_funding_sketch(self, symbol: str, exchange: str = "bitget") -> Optional[TDigest]:
+        """Builds the sketch of a symbol from its settled history if it is still missing, None without history"""
+        key = f"fr_digest:{exchange}:{symbol}"
+        fetched: List[np.ndarray] = []
+
+        def update(pipe) -> Optional[str]:
+            stored = pipe.hgetall(key)
+            if stored.get("digest"):
+                return stored["digest"]  # a concurrent record_funding_value won
+            history = self._funding_seed(exchange, symbol, None, fetched)
+            if history is None or not len(history):
+                return None
+            digest = TDigest()
+            digest.update(history[:, 1])
+            encoded = digest.to_string()
+            pipe.multi()
+            pipe.hset(key, mapping={"digest": encoded, "last_ts": int(history[:, 0].max())})
+            return encoded
+
+        try:
+            encoded = self._r.transaction(update, key, value_from_callable=True)
+        except redis.RedisError as e:
+            print(f"Redis error while seeding the funding sketch of {symbol} ({exchange}): {e}")
+            return None
+        return TDigest.from_string(encoded) if encoded else None
+
+    def get_funding_sketch(self, symbol: str, exchanges: List[str] = ["bitget"]) -> Optional[TDigest]:
+        """Sketch of the symbol merged across `exchanges`, None if nothing was recorded"""
+        pipeline = self._r.pipeline()
+        for exchange in exchanges:
+            pipeline.hget(f"fr_digest:{exchange}:{symbol}", "digest")
+        encoded = pipeline.execute()
+
+        digests = []
+        for exchange, value in zip(exchanges, encoded):
+            if value:
+                digests.append(TDigest.from_string(value))
+            else:
+                seeded = self.seed_funding_sketch(symbol, exchange)
+                if seeded is not None:
+                    digests.append(seeded)
+
+        if not digests:
+            return None
+        merged = digests[0]
+        for digest in digests[1:]:
+            merged = merged.merge(digest)
+        return merged
+
+    def get_funding_percentile(self, symbol: str, value: float, exchanges: List[str] = ["bitget"]) -> Optional[Dict]:
+        """
+        Historical percentile of a funding rate (percent) for the symbol, plus the reference quantiles.
+        """
+        digest = self.get_funding_sketch(symbol, exchanges)
+        if digest is None:
+            return None
+        return {
+            "symbol": symbol,
+            "exchanges": exchanges,
+            "funding_rate_value": value,
+            "percentile": round(digest.cdf(value) * 100, 4),
+            "observations": int(digest.count),
+            "quantiles": {f"p{q}": round(digest.quantile(q / 100), 6) for q in FUNDING_PERCENTILES}
+        }
+
+    # ------------------- FUNDING_LEADERBOARD FUNCTIONS -------------------
+
+    def update_funding_leaderboard(self, exchange: str, symbol: str, funding_rate_value: float, interval: Optional[str] = None) -> None:
+        """
+        Scores the symbol with its funding rate (percent) on fr_leaderboard:{exchange}:all and
+        fr_leaderboard:{exchange}:{interval} (1h / 2h / 4h / 8h), the exchange in a {} hash tag.
+        """
+        keys, args = leaderboard_call(exchange, symbol, funding_rate_value, interval)
+        try:
+            self._leaderboard_script(keys=keys, args=args)
+        except redis.RedisError as e:
+            print(f"Redis error while updating the funding leaderboard of {symbol} ({exchange}): {e}")
+
+    def remove_from_funding_leaderboards(self, symbol: str) -> None:
+        pipeline = self._r.pipeline(transaction=False)
+        for exchange in FUNDING_LEADERBOARD_EXCHANGES:
+            for interval in ("all", *FUNDING_LEADERBOARD_INTERVALS):
+                pipeline.zrem(leaderboard_key(exchange, interval), symbol)
+            pipeline.hdel(leaderboard_interval_key(exchange), symbol)
+        pipeline.execute()
+
+    def get_funding_leaderboard(self, exchange: str, interval: str = "all", side: Literal["negative", "positive"] = "negative",
+                                limit: int = 20, offset: int = 0) -> Dict:
+        """Most negative (or positive) funding rates of a board, O(log n + limit)"""
+        key = leaderboard_key(exchange, interval)
+        pipeline = self._r.pipeline()
+        pipeline.zrange(key, offset, offset + limit - 1, desc=(side == "positive"), withscores=True)
+        pipeline.zcard(key)
+        entries, size = pipeline.execute()
+        return {
+            "exchange": exchange,
+            "interval": interval,
+            "side": side,
+            "size": size,
+            "data": [
+                {"rank": offset + i + 1, "symbol": symbol, "funding_rate_value": score}
+                for i, (symbol, score) in enumerate(entries)
+            ]
+        }
+
+    def get_funding_rank(self, exchange: str, symbol: str, interval: str = "all",
+                         side: Literal["negative", "positive"] = "negative") -> Optional[Dict]:
+        """1-based rank of one symbol on a board, None if it isn't on it"""
+        key = leaderboard_key(exchange, interval)
+        pipeline = self._r.pipeline()
+        if side == "positive":
+            pipeline.zrevrank(key, symbol)
+        else:
+            pipeline.zrank(key, symbol)
+        pipeline.zscore(key, symbol)
+        pipeline.zcard(key)
+        rank, score, size = pipeline.execute()
+        if rank is None:
+            return None
+        return {"symbol": symbol, "rank": rank + 1, "size": size, "funding_rate_value": score}
+
+    # ------------------- LIVE INDICATORS -------------------
+
+    def save_live_indicators(self, state: Dict) -> None:
+        """Streaming indicator state of every symbol (chart_analysis.LiveIndicatorBook)"""
+        self._r.set("live_indicators", json.dumps(state))
+
+    def get_live_indicators(self) -> Dict:
+        state = self._r.get("live_indicators")
+        return json.loads(state) if state else {}
+
     # ------------------- UTILITY FUNCTIONS -------------------
 
     def add_crypto_offset(self) -> int:
@@ -403,31 +662,36 @@ class RedisService:
         
         return sorted_all
 
-    def get_cryptos_by_fr_expiration_optimized(self, expirations: List[str] = ["4h", "8h"]) -> List[Dict]:
+    # ------------------- FUNDING_INTERVAL INDEX -------------------
+
+    def set_funding_interval(self, symbol: str, interval) -> Optional[str]:
         """
-        Retrieves cryptocurrencies filtered by funding rate expiration times.
+        Moves the symbol to fr_expiration:{interval} (1h / 2h / 4h / 8h) and out of every other interval
+        set in one transaction, an unknown interval (None) just removes it from the index.
         """
-        matching_cryptos = []
-        symbols = set()
-
-        for exp in expirations:
-            symbols.update(self._r.smembers(f"fr_expiration:{exp}"))
-
-        if symbols:
-            pipeline = self._r.pipeline()
-            for symbol in symbols:
-                pipeline.hget("all_crypto_analysis", symbol)
-            crypto_data_json_list = pipeline.execute()
+        interval = normalize_funding_interval(interval)
+        pipeline = self._r.pipeline(transaction=True)
+        for other in FUNDING_INTERVALS:
+            if other != interval:
+                pipeline.srem(f"fr_expiration:{other}", symbol)
+        if interval:
+            pipeline.sadd(f"fr_expiration:{interval}", symbol)
+            pipeline.hset("fr_expiration_index", symbol, interval)
+        else:
+            pipeline.hdel("fr_expiration_index", symbol)
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            print(f"Redis error while indexing the funding interval of {symbol}: {e}")
+        return interval
 
-            for crypto_data_json in crypto_data_json_list:
-                if crypto_data_json:
-                    try:
-                        crypto_data = json.loads(crypto_data_json)
-                        matching_cryptos.append(crypto_data)
-                    except json.JSONDecodeError:
-                        continue
+    def get_funding_interval(self, symbol: str) -> Optional[str]:
+        return self._r.hget("fr_expiration_index", symbol)
 
-        return matching_cryptos
+    def get_symbols_by_fr_expiration(self, expirations: List[str]) -> List[str]:
+        """Symbols settling at any of the given intervals, one SUNION"""
+        keys = [f"fr_expiration:{interval}" for interval in filter(None, map(normalize_funding_interval, expirations))]
+        return sorted(self._r.sunion(keys)) if keys else []
 
     # ------------------- DELETION FUNCTIONS -------------------
 
@@ -439,6 +703,7 @@ class RedisService:
             self._r.hdel("crypto_metadata", symbol)
             self.delete_all_analysis_for_symbol(symbol)
             self.remove_from_list_crypto(symbol)
+            self.set_funding_interval(symbol, None)
             print(f"Successfully deleted all data for symbol: {symbol}")
             return True
         except redis.RedisError as e:
@@ -0,0 +1,134 @@
+# File: src/app/resilience.py
+
+import time
+from collections import deque
+from typing import Deque, Dict, Literal, Optional
+
+import numpy as np
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker.
+
+    closed    -> every call goes through, `failure_threshold` consecutive failures open it
+    open      -> calls fail fast until `recovery_timeout` seconds have passed
+    half_open -> up to `half_open_max_calls` probes go through, a success closes the
+                 circuit again and a failure re-opens it
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0, half_open_max_calls: int = 1) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state: Literal["closed", "open", "half_open"] = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._half_open_calls = 0
+        self._counters = {"successes": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+
+    def allow_request(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self._counters["short_circuited"] += 1
+                return False
+            self.state = "half_open"
+            self._half_open_calls = 0
+
+        if self.state == "half_open":
+            if self._half_open_calls >= self.half_open_max_calls:
+                self._counters["short_circuited"] += 1
+                return False
+            self._half_open_calls += 1
+
+        return True
+
+    def release(self) -> None:
+        """Give back a half-open probe slot whose call ended without an outcome (e.g. cancelled)"""
+        if self.state == "half_open" and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self) -> None:
+        self._counters["successes"] += 1
+        self.consecutive_failures = 0
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self._counters["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._counters["opened"] += 1
+
+    def snapshot(self) -> dict:
+        retry_in = self.recovery_timeout - (time.monotonic() - self.opened_at) if self.state == "open" else 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": round(max(0.0, retry_in), 2),
+            **self._counters
+        }
+
+
+class LatencyTracker:
+    """Sliding window of response times, used to pick the hedging delay"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        return float(np.percentile(np.fromiter(self._samples, dtype=float), q))
+
+
+class HostHealth:
+    """Breaker, latency window and hedge counters of one upstream host"""
+
+    def __init__(self, host: str) -> None:
+        self.host = host
+        self.breaker = CircuitBreaker(host)
+        self.latency = LatencyTracker()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def hedge_delay(self, default: float = 1.0, floor: float = 0.05) -> float:
+        p95 = self.latency.percentile(95)
+        return max(floor, p95) if p95 is not None else default
+
+    def snapshot(self) -> dict:
+        p50, p95, p99 = (self.latency.percentile(q) for q in (50, 95, 99))
+        return {
+            "circuit": self.breaker.snapshot(),
+            "latency_p50": round(p50, 4) if p50 is not None else None,
+            "latency_p95": round(p95, 4) if p95 is not None else None,
+            "latency_p99": round(p99, 4) if p99 is not None else None,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won
+        }
+
+
+class HostHealthRegistry:
+    def __init__(self) -> None:
+        self._hosts: Dict[str, HostHealth] = {}
+
+    def get(self, host: str) -> HostHealth:
+        if host not in self._hosts:
+            self._hosts[host] = HostHealth(host)
+        return self._hosts[host]
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {host: health.snapshot() for host, health in self._hosts.items()}
+
+
+host_health = HostHealthRegistry()
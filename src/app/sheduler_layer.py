@@ -17,7 +17,8 @@ class ScheduleLayer:
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone(self._timezone))
         logger.info(f"Scheduler initialized with timezone: {self._timezone}")
 
-    def schedule_process_time(self, run_time: datetime, function_to_call: Callable[..., Coroutine], *args):
+    def schedule_process_time(self, run_time: datetime, function_to_call: Callable[..., Coroutine], *args, job_id: Optional[str] = None):
+        """One-off job at run_time, scheduling again with the same job_id moves the pending job instead of adding one"""
         timezone = pytz.timezone(self._timezone)
         if run_time.tzinfo is None:
             run_time = timezone.localize(run_time)
@@ -29,6 +30,8 @@ class ScheduleLayer:
             'date', 
             run_date=run_time, 
             args=[function_to_call, *args], 
+            id=job_id,
+            replace_existing=job_id is not None,
             coalesce=True, 
             misfire_grace_time=30
         )
@@ -0,0 +1,104 @@
+# File: src/app/singleflight.py
+
+import asyncio
+import functools
+import numpy as np
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Request coalescing for identical upstream calls.
+
+    While a call for a key is in flight every other caller with the same key awaits the same
+    task instead of hitting the exchange again. The shared task is shielded, so a caller that
+    disconnects (cancelled request) doesn't cancel the download for everybody else.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"calls": 0, "coalesced": 0, "errors": 0})
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per key at a time and share its result"""
+        counter = self._counters[key[0] if isinstance(key, tuple) else key]
+        counter["calls"] += 1
+
+        task = self._inflight.get(key)
+        if task is not None:
+            counter["coalesced"] += 1
+            result = await asyncio.shield(task)
+            # numpy results are mutable, followers get their own copy
+            return result.copy() if isinstance(result, np.ndarray) else result
+
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            counter["errors"] += 1
+            raise
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        """Per-function counters plus the overall coalescing hit-rate"""
+        functions = {}
+        total_calls = total_coalesced = 0
+        for name, counter in self._counters.items():
+            calls, coalesced = counter["calls"], counter["coalesced"]
+            total_calls += calls
+            total_coalesced += coalesced
+            functions[name] = {
+                **counter,
+                "upstream": calls - coalesced,
+                "hit_rate": round(coalesced / calls, 4) if calls else 0.0
+            }
+
+        return {
+            "group": self.name,
+            "in_flight": self.in_flight(),
+            "calls": total_calls,
+            "coalesced": total_coalesced,
+            "upstream": total_calls - total_coalesced,
+            "hit_rate": round(total_coalesced / total_calls, 4) if total_calls else 0.0,
+            "functions": functions
+        }
+
+
+def _freeze(value: Any) -> Hashable:
+    """Turn call arguments into a hashable key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return value.tobytes()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+upstream_flights = SingleFlight("upstream")
+
+
+def coalesce(method: Callable[..., Awaitable] = None, *, group: SingleFlight = upstream_flights):
+    """
+    Decorator for client methods. Calls are keyed by the method and its arguments (not by the
+    instance), so every service instance in the process shares the same in-flight request.
+    """
+    def decorator(fn):
+        name = fn.__qualname__
+
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            key = (name, _freeze(args), _freeze(kwargs))
+            return await group.do(key, fn, self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator(method) if method is not None else decorator
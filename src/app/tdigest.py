@@ -0,0 +1,159 @@
+import base64
+from typing import Iterable, Optional
+
+import numpy as np
+
+"""
+Merging t-digest (Dunning & Ertl) over NumPy arrays.
+
+A digest keeps at most ~`compression` weighted centroids whatever the number of values it has
+seen, small near the tails and large around the median, so extreme quantiles stay accurate.
+Digests of two sources merge into one by re-compressing their centroids together, and the
+whole digest serializes to a short base64 string.
+"""
+
+DEFAULT_COMPRESSION = 200
+
+
+class TDigest:
+
+    def __init__(self, compression: float = DEFAULT_COMPRESSION, means: Optional[np.ndarray] = None,
+                 weights: Optional[np.ndarray] = None, minimum: float = np.inf, maximum: float = -np.inf) -> None:
+        self.compression = compression
+        self.means = np.empty(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.empty(0) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.minimum = minimum
+        self.maximum = maximum
+        self._buffer = []
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum()) + len(self._buffer)
+
+    # ------------------- UPDATE -------------------
+
+    def add(self, value: float) -> None:
+        value = float(value)
+        if not np.isfinite(value):
+            return
+        self._buffer.append(value)
+        if len(self._buffer) >= 5 * self.compression:
+            self.compress()
+
+    def update(self, values: Iterable[float]) -> None:
+        values = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values):
+            self._merge(values, np.ones(len(values)))
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """New digest of both sources (e.g. the same symbol on two exchanges)"""
+        merged = TDigest(max(self.compression, other.compression), self.means, self.weights, self.minimum, self.maximum)
+        merged._buffer = list(self._buffer)
+        other.compress()
+        if len(other.means):
+            merged._merge(other.means, other.weights)
+            merged.minimum, merged.maximum = min(merged.minimum, other.minimum), max(merged.maximum, other.maximum)
+        merged.compress()
+        return merged
+
+    def compress(self) -> None:
+        if self._buffer:
+            values = np.array(self._buffer)
+            self._buffer = []
+            values = values[np.isfinite(values)]
+            if len(values):
+                self._merge(values, np.ones(len(values)))
+
+    def _merge(self, means: np.ndarray, weights: np.ndarray) -> None:
+        if self._buffer:
+            buffered, self._buffer = np.array(self._buffer), []
+            means, weights = np.concatenate([means, buffered]), np.concatenate([weights, np.ones(len(buffered))])
+        self.minimum = min(self.minimum, float(means.min()))
+        self.maximum = max(self.maximum, float(means.max()))
+
+        # Equal values collapse losslessly first, funding rates repeat a lot (caps, default rates)
+        means, inverse = np.unique(np.concatenate([self.means, means]), return_inverse=True)
+        weights = np.bincount(inverse, weights=np.concatenate([self.weights, weights]))
+
+        total = weights.sum()
+        # k1 scale: a centroid may span at most one unit of k(q) = compression / 2pi * asin(2q - 1)
+        limit = np.arcsin(2 * np.cumsum(weights) / total - 1) * self.compression / (2 * np.pi)
+        merged_means, merged_weights = [], []
+        current_mean, current_weight, k_start = means[0], weights[0], np.arcsin(-1) * self.compression / (2 * np.pi)
+        for i in range(1, len(means)):
+            if limit[i] - k_start <= 1:
+                current_weight += weights[i]
+                current_mean += (means[i] - current_mean) * weights[i] / current_weight
+            else:
+                merged_means.append(current_mean)
+                merged_weights.append(current_weight)
+                k_start = limit[i - 1]
+                current_mean, current_weight = means[i], weights[i]
+        merged_means.append(current_mean)
+        merged_weights.append(current_weight)
+        self.means, self.weights = np.array(merged_means), np.array(merged_weights)
+
+    # ------------------- QUERY -------------------
+
+    def _curve(self):
+        """Cumulative share at every centroid mean, pinned to 0 / 1 at the observed min / max"""
+        self.compress()
+        total = self.weights.sum()
+        midpoints = (np.cumsum(self.weights) - self.weights / 2) / total
+        xs = np.concatenate([[self.minimum], self.means, [self.maximum]])
+        ys = np.concatenate([[0.0], midpoints, [1.0]])
+        keep = np.concatenate([[True], np.diff(xs) > 0])
+        return xs[keep], ys[keep]
+
+    def cdf(self, value: float) -> Optional[float]:
+        """Share of the values below `value` (ties count half)"""
+        if not self.count:
+            return None
+        self.compress()  # buffered values move the min / max
+        if value < self.minimum:
+            return 0.0
+        if value > self.maximum:
+            return 1.0
+        xs, ys = self._curve()
+        if len(xs) == 1:
+            return 0.5
+        return float(np.interp(value, xs, ys))
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        xs, ys = self._curve()
+        if len(xs) == 1:
+            return float(xs[0])
+        return float(np.interp(min(max(q, 0.0), 1.0), ys, xs))
+
+    # ------------------- SERIALIZATION -------------------
+
+    def to_string(self) -> str:
+        self.compress()
+        header = np.array([self.compression, self.minimum, self.maximum])
+        return base64.b64encode(np.concatenate([header, self.means, self.weights]).tobytes()).decode("ascii")
+
+    @classmethod
+    def from_string(cls, encoded: str) -> "TDigest":
+        values = np.frombuffer(base64.b64decode(encoded), dtype=np.float64)
+        compression, minimum, maximum = values[:3]
+        centroids = values[3:].reshape(2, -1)
+        return cls(float(compression), centroids[0].copy(), centroids[1].copy(), float(minimum), float(maximum))
+
+
+def main_testing():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([np.full(4000, 0.01), rng.standard_t(3, 6000) * 0.02])
+    digest = TDigest()
+    for value in values:
+        digest.add(value)
+    encoded = digest.to_string()
+    restored = TDigest.from_string(encoded)
+    print(f"{len(values)} values -> {len(restored.means)} centroids, {len(encoded)} bytes")
+    for q in (0.001, 0.01, 0.5, 0.99, 0.999):
+        print(q, "->", round(restored.quantile(q), 6), "exact ->", round(float(np.quantile(values, q)), 6))
+
+if __name__ == "__main__":
+    main_testing()
@@ -7,15 +7,33 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
 from contextlib import asynccontextmanager
 from typing import Optional, List
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timedelta
 import asyncio, logging, pytz
 
 from src.app.crypto_data_service import CryptoDataService
-from src.app.redis_layer import RedisService
-from src.app.chart_analysis import FundingRateChart
+from src.app.redis_layer import RedisService, set_funding_history_source, FUNDING_SKETCH_EXCHANGES, FUNDING_LEADERBOARD_EXCHANGES, FUNDING_LEADERBOARD_INTERVALS, FUNDING_INTERVALS
+from src.app.chart_analysis import live_indicators
 from src.app.mongo.controller import MongoDB_Crypto
 from src.app.funding_rate.funding_rate_analysis import FundingRateArbitrageBot
 from src.app.security import get_current_user_id
+from src.app.singleflight import upstream_flights
+from src.app.rate_control import outbound_limiters
+from src.app.resilience import host_health
+from src.app.proxy import transport_pool
+from src.app.market_data.funding_stream import funding_table, funding_ingest, FUNDING_STREAM_ENABLED
+from src.app.market_data.funding_broadcast import funding_hub
+from src.app.market_data.funding_backplane import funding_backplane, FUNDING_BACKPLANE_ENABLED
+from src.app.market_data.funding_history import funding_history
+from src.app.market_data.candle_ring import RingCandleSource, candle_rings, candle_feed, CANDLE_RING_TOP_UP_SECONDS
+from src.app.funding_rate.data_fecher import DataFecher
+from src.app.funding_rate.live_analysis import LiveAnalysisMaterializer
+from src.app.funding_rate.interval_cache import FundingIntervalCache
+from src.app.funding_rate.event_study import FundingEventStudy, EVENT_STUDY_HORIZONS
+from src.app.funding_rate.spread_scanner import spread_scanner
+from src.app.funding_rate.settlement_recorder import FundingSettlementRecorder
+from src.app.funding_rate.leaderboard import funding_leaderboard
+from src.app.funding_rate.funding_calendar import FundingCalendar
+from src.app.compute import compute_executor
 from src.app.schemas import *
 
 from src.app.sheduler_layer import ScheduleLayer
@@ -31,6 +49,44 @@ async_scheduler = ScheduleLayer("Europe/Amsterdam")
 redis_memory = RedisService()
 funding_rate = FundingRateArbitrageBot()
 mongod_service = MongoDB_Crypto()
+data_fecher = DataFecher()
+event_study = FundingEventStudy(storage=mongod_service)
+ring_candle_source = RingCandleSource(CryptoDataService(), candle_rings, feed=candle_feed)
+
+# Streaming trend / volatility indicators advance on every candle close of the rings
+candle_rings.close_listeners.append(live_indicators.on_candle_close)
+candle_rings.listeners.append(live_indicators.on_track)
+
+# Followed symbols get their analysis recomputed on candle close / funding settlement
+live_analysis = LiveAnalysisMaterializer(candle_source=ring_candle_source, indicators=live_indicators)
+candle_rings.close_listeners.append(live_analysis.on_candle_close)
+funding_ingest.add_listener(live_analysis.on_funding_change)
+funding_backplane.add_listener(live_analysis.on_funding_change)
+
+# Every streamed change is fanned out to the /funding-rate/ws clients
+funding_ingest.add_listener(funding_hub.publish)
+
+# Cross-exchange spreads are re-ranked on every streamed funding change
+funding_ingest.add_listener(spread_scanner.on_funding_change)
+funding_backplane.add_listener(spread_scanner.on_funding_change)
+
+# Writers of shared state below are only fed while this pod holds the ingest lease (see funding_backplane)
+
+# Settled rates feed the per-symbol funding percentile sketches
+settlement_recorder = FundingSettlementRecorder(redis_memory)
+funding_backplane.add_writer(settlement_recorder.on_funding_change)
+
+# Most negative / positive funding boards per exchange and interval
+funding_backplane.add_writer(funding_leaderboard.on_funding_change)
+
+# Settlement-driven analysis: wakes at each Bitget settlement cluster with only the symbols settling then
+funding_calendar = FundingCalendar(
+    funding_table, async_scheduler, funding_rate.process_settlement,
+    interval_lookup=lambda symbol: spread_scanner.interval_hours("bitget", symbol)
+)
+funding_backplane.add_writer(funding_calendar.on_funding_change)
+# With the backplane the calendar follows the ingest lease, it's seeded from the (hydrated) table when won
+funding_backplane.leader_listeners.append(lambda leader: funding_calendar.start() if leader else funding_calendar.stop())
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -38,6 +94,41 @@ async def lifespan(app: FastAPI):
     async_scheduler.scheduler.start()
     logger.info("Scheduler started.")
 
+    # Streaming indicators resume from the state saved at the last shutdown
+    try:
+        live_indicators.load_state(redis_memory.get_live_indicators())
+    except Exception as e:
+        logger.warning(f"Live indicator state not restored: {e}")
+
+    # fr_expiration:{interval} index (settlement cohorts) and the (symbol, period_ts) upsert key of the analysis
+    try:
+        indexed = await mongod_service.reindex_funding_intervals()
+        logger.info(f"Indexed the funding interval of {indexed} symbols.")
+        await mongod_service.ensure_analysis_indexes()
+    except Exception as e:
+        logger.warning(f"Funding indexes not rebuilt: {e}")
+
+    # Missing funding sketches are seeded from the settled history (worker threads block on this loop)
+    set_funding_history_source(funding_history.seeder(asyncio.get_running_loop()))
+
+    # Keep the in-memory candle rings current (kline stream + REST top-ups)
+    await ring_candle_source.start(CANDLE_RING_TOP_UP_SECONDS)
+    await live_analysis.start()
+
+    # Start the WebSocket funding ingest, with the backplane only the lease holder pod runs it
+    if FUNDING_STREAM_ENABLED:
+        await funding_hub.start()
+        if FUNDING_BACKPLANE_ENABLED:
+            await funding_backplane.start()
+            logger.info("Funding backplane started.")
+        else:
+            await funding_ingest.start()
+            logger.info("Funding stream ingest started.")
+        await spread_scanner.start()
+        await funding_leaderboard.start()
+        if not FUNDING_BACKPLANE_ENABLED:
+            funding_calendar.start()
+
     # Schedule the daily crypto_rebase job at 9:00 AM Spanish time
     # async_scheduler.schedule_daily_job(9, 0, main_services.crypto_rebase)
 
@@ -59,6 +150,22 @@ async def lifespan(app: FastAPI):
     try:
         yield
     finally:
+        await live_analysis.stop()
+        await spread_scanner.stop()
+        await funding_leaderboard.stop()
+        funding_calendar.stop()
+        await ring_candle_source.stop()
+        try:
+            redis_memory.save_live_indicators(live_indicators.get_state())
+        except Exception as e:
+            logger.warning(f"Live indicator state not saved: {e}")
+        await funding_backplane.stop()
+        await funding_hub.stop()
+        settlement_recorder.close()
+        set_funding_history_source(None)
+        await funding_ingest.stop()
+        compute_executor.shutdown()
+
         # Shutdown the scheduler
         async_scheduler.scheduler.shutdown()
         logger.info("Scheduler shut down.")
@@ -112,15 +219,140 @@ async def get_historical_funding_rate(
     else:
         return []
 
+@app.get("/funding-rate/current/{symbol}", 
+    description="### Get Current Funding Rate\n\n Live funding rate, mark price, index price and next funding time per exchange, read from the streamed table (REST fallback when the stream has no recent value)", 
+    tags=["Funding Rate"])
+async def get_current_funding_rate(
+    symbol: str = Path(..., description="Symbol to be searched")
+):
+    streamed = funding_table.get_symbol(symbol, max_age=60)
+    if streamed:
+        return list(streamed.values())
+
+    data = await data_fecher.fetch_funding_rate(FundingIntervalCache.normalize_symbol(symbol))
+    return data["funding_rate"]
+
+@app.get("/funding-rate/spreads",
+    description="### Funding Spreads\n\n Widest Binance / Bitget funding spreads across the universe, normalized for each side's funding interval. Rates and spread_8h in percent, annualized_carry in percent per year, direction is the position that collects the spread",
+    tags=["Funding Rate"])
+async def get_funding_spreads(
+    limit: int = Query(20, ge=1, le=200, description="Number of opportunities"),
+    min_carry: float = Query(0.0, ge=0, description="Minimum annualized carry (percent)")
+):
+    return spread_scanner.top(limit, min_carry=min_carry)
+
+@app.get("/funding-rate/by-interval",
+    description="### Symbols by Funding Interval\n\n Symbols settling every 1h / 2h / 4h / 8h, read from the funding interval index maintained on every metadata write. With `include_analysis` the last `limit` stored funding periods of each symbol are returned instead",
+    tags=["Funding Rate"])
+async def get_symbols_by_funding_interval(
+    intervals: str = Query("4h,8h", description="Comma separated intervals: 1h, 2h, 4h, 8h"),
+    include_analysis: bool = Query(False, description="Return the stored funding history of every symbol"),
+    limit: int = Query(50, ge=1, le=500, description="Funding periods per symbol with include_analysis")
+):
+    requested = [interval.strip() for interval in intervals.split(",") if interval.strip()]
+    unknown = [interval for interval in requested if interval not in FUNDING_INTERVALS]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown intervals {unknown}, expected some of {list(FUNDING_INTERVALS)}")
+
+    if include_analysis:
+        return await mongod_service.get_funding_rate_histories(redis_memory.get_symbols_by_fr_expiration(requested), limit=limit)
+    return {"intervals": requested, "symbols": redis_memory.get_symbols_by_fr_expiration(requested)}
+
+@app.get("/funding-rate/calendar",
+    description="### Funding Calendar\n\n Next Bitget settlement clusters (ms timestamps) and the symbols settling in each, built from the reported next funding time of every symbol",
+    tags=["Funding Rate"])
+async def get_funding_calendar(
+    limit: int = Query(10, ge=1, le=100, description="Number of settlement clusters")
+):
+    return funding_calendar.upcoming(limit)
+
+@app.get("/funding-rate/top",
+    description="### Funding Rate Leaderboard\n\n Most negative (side=negative) or most positive (side=positive) current funding rates (percent) of an exchange, across every symbol or only the ones settling every 1h / 2h / 4h / 8h. With `symbol`, also returns the rank of that symbol on the same board",
+    tags=["Funding Rate"])
+async def get_funding_rate_top(
+    exchange: str = Query("bitget", description="Exchange: bitget, binance"),
+    interval: str = Query("all", description="Funding interval board: all, 1h, 2h, 4h, 8h"),
+    side: str = Query("negative", description="negative (lowest first) or positive (highest first)"),
+    limit: int = Query(20, ge=1, le=200, description="Number of symbols"),
+    offset: int = Query(0, ge=0, description="Rank offset"),
+    symbol: Optional[str] = Query(None, description="Also return the rank of this symbol")
+):
+    if exchange not in FUNDING_LEADERBOARD_EXCHANGES:
+        raise HTTPException(status_code=400, detail=f"Unknown exchange {exchange}, expected one of {list(FUNDING_LEADERBOARD_EXCHANGES)}")
+    if interval != "all" and interval not in FUNDING_LEADERBOARD_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Unknown interval {interval}, expected all or one of {list(FUNDING_LEADERBOARD_INTERVALS)}")
+    if side not in ("negative", "positive"):
+        raise HTTPException(status_code=400, detail="side must be negative or positive")
+
+    result = redis_memory.get_funding_leaderboard(exchange, interval, side, limit=limit, offset=offset)
+    if symbol:
+        result["symbol_rank"] = redis_memory.get_funding_rank(exchange, FundingIntervalCache.normalize_symbol(symbol), interval, side)
+    return result
+
+@app.get("/funding-rate/percentile/{symbol}",
+    description="### Funding Rate Percentile\n\n Historical percentile of a funding rate (percent) for the symbol, read from its quantile sketch, with the p1..p99 reference quantiles. Without a value the current streamed rate of the first exchange is used. Several exchanges are merged into one distribution",
+    tags=["Funding Rate"])
+async def get_funding_rate_percentile(
+    symbol: str = Path(..., description="Symbol to be searched"),
+    value: Optional[float] = Query(None, description="Funding rate (percent), current rate when empty"),
+    exchanges: str = Query("bitget", description="Comma separated exchanges: bitget, binance")
+):
+    symbol = FundingIntervalCache.normalize_symbol(symbol)
+    requested = [exchange.strip() for exchange in exchanges.split(",") if exchange.strip()]
+    unknown = [exchange for exchange in requested if exchange not in FUNDING_SKETCH_EXCHANGES]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown exchanges {unknown}, expected some of {list(FUNDING_SKETCH_EXCHANGES)}")
+
+    if value is None:
+        current = funding_table.get(requested[0], symbol, max_age=60)
+        if not current or current.get("funding_rate") is None:
+            raise HTTPException(status_code=404, detail=f"No current funding rate for {symbol} on {requested[0]}, pass a value")
+        value = round(current["funding_rate"] * 100, 6)
+
+    # A missing sketch is seeded from the exchange history, which blocks
+    result = await asyncio.to_thread(redis_memory.get_funding_percentile, symbol, value, requested)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"No funding history recorded for {symbol}")
+    return result
+
+@app.get("/funding-rate/event-study",
+    description="### Funding Event Study\n\n Aligns every stored funding event matching the filter on its funding time and returns the mean, median, quantile paths and share of positive returns (percent vs the event candle open) 10 minutes (1m), 8 hours (15m) and 7 days (1H) after it. Cached per filter",
+    tags=["Funding Rate"])
+async def get_funding_event_study(
+    max_funding_rate: Optional[float] = Query(-0.5, description="Events with a funding rate (percent) at or below this value"),
+    min_funding_rate: Optional[float] = Query(None, description="Events with a funding rate (percent) at or above this value"),
+    symbols: Optional[str] = Query(None, description="Comma separated symbols, all when empty"),
+    start: Optional[int] = Query(None, description="Events from this timestamp (ms)"),
+    end: Optional[int] = Query(None, description="Events up to this timestamp (ms)"),
+    horizons: str = Query(",".join(EVENT_STUDY_HORIZONS), description="Comma separated horizons: 10m, 8h, 7d"),
+    limit: int = Query(5000, ge=1, le=20000, description="Maximum number of events (most recent first)")
+):
+    requested = [horizon.strip() for horizon in horizons.split(",") if horizon.strip()]
+    unknown = [horizon for horizon in requested if horizon not in EVENT_STUDY_HORIZONS]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown horizons {unknown}, expected some of {list(EVENT_STUDY_HORIZONS)}")
+
+    symbol_list = sorted({FundingIntervalCache.normalize_symbol(symbol) for symbol in symbols.split(",") if symbol.strip()}) if symbols else None
+    return await event_study.study(
+        max_rate=max_funding_rate, min_rate=min_funding_rate, symbols=symbol_list,
+        start=start, end=end, horizons=requested, limit=limit
+    )
+
 @app.get("/crypto-analysis/today/{symbol}", description="### Get today analysis from a given crypto\n\n ### At this this function doesn't meet with the data schema", tags=["Crypto Analysis"])
 async def get_today_analysis(symbol: str):
-    chart_analysis = FundingRateChart(symbol)
-    period = int(datetime.now(timezone.utc).timestamp() * 1000)
+    # Precomputed by the materializer, only the first request of a symbol computes it inline
+    result = await live_analysis.get(symbol)
+    if result is None:
+        raise HTTPException(status_code=503, detail=f"Analysis for {symbol} is not available")
 
-    # Get Analysis
-    analysis = await chart_analysis.set_analysis(period)
+    return {**result["analysis"], "live_indicators": result["live_indicators"], "as_of": result["as_of"], "version": result["version"]}
 
-    return analysis
+@app.get("/crypto-analysis/live-indicators/{symbol}", description="### Streaming trend / volatility indicators of a crypto\n\n - Updated on every candle close, only for symbols held by the in-memory candle rings", tags=["Crypto Analysis"])
+async def get_live_indicators(symbol: str):
+    summary = live_indicators.summary(FundingIntervalCache.normalize_symbol(symbol))
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"No live indicators for {symbol}, it isn't tracked by the candle rings")
+    return summary
 
 
 @app.get("/crypto/detail/{symbol}", description="Get name and logo of the crypto", tags=["Crypto"],  response_model=Crypto)
@@ -205,12 +437,102 @@ async def websocket_search_crypto(websocket: WebSocket):
         print(f"Error: {e}")
 
 
+@app.websocket("/funding-rate/ws")
+async def websocket_funding_rate(websocket: WebSocket):
+    """
+    Live funding updates from the shared ingest.
+
+    Client messages: {"op": "subscribe" | "unsubscribe", "symbols": [...]}, {"op": "subscribe", "all": true} or {"op": "resync"}
+    Server messages: {"type": "snapshot", "seq": n, "data": [rows]} after every subscribe / resync, then
+    {"type": "delta", "seq": n, "data": [{"exchange", "symbol", <changed fields>}]} once per flush interval.
+    A client seeing a seq gap sends resync. permessage-deflate is negotiated by the websockets server.
+    """
+    await websocket.accept()
+    subscriber = funding_hub.register()
+
+    async def sender():
+        while True:
+            await websocket.send_json(await subscriber.next_message())
+
+    async def receiver():
+        while True:
+            data = await websocket.receive_json()
+            op = data.get('op')
+            symbols = data.get('symbols') or []
+            all_market = bool(data.get('all'))
+            if not isinstance(symbols, list):
+                symbols = [symbols]
+
+            if op == 'subscribe':
+                funding_hub.subscribe(subscriber, symbols, all_market=all_market)
+            elif op == 'resync':
+                funding_hub.resync(subscriber)
+            elif op == 'unsubscribe':
+                funding_hub.unsubscribe(subscriber, symbols, all_market=all_market)
+            else:
+                await websocket.send_json({"type": "error", "detail": f"Unknown op: {op}"})
+
+    tasks = [asyncio.create_task(sender()), asyncio.create_task(receiver())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+
+    except WebSocketDisconnect:
+        print("Client disconnected")
+
+    except Exception as e:
+        await websocket.close()
+        print(f"Error: {e}")
+
+    finally:
+        for task in tasks:
+            task.cancel()
+        funding_hub.unregister(subscriber)
+
+
 @app.delete("/delete_all_cryptos_analysis", description="### Administrative function\n\n - This function is used to clear all the **current analysis**\n\n - Doesn't include the crytpos", tags=["Administrative"])
 async def delete_all_cryptos_analysis():
     response = redis_memory.delete_all_analysis()
         
     return response
 
+@app.get("/metrics/coalescing", description="### Administrative function\n\n - Request coalescing counters: how many upstream calls were shared with an identical in-flight call", tags=["Administrative"])
+async def get_coalescing_metrics():
+    return upstream_flights.stats()
+
+@app.get("/metrics/rate-limits", description="### Administrative function\n\n - Current adaptive concurrency limit per exchange and endpoint class", tags=["Administrative"])
+async def get_rate_limit_metrics():
+    return outbound_limiters.snapshot()
+
+@app.get("/metrics/upstream-health", description="### Administrative function\n\n - Circuit breaker state, latency percentiles and hedged requests per upstream host", tags=["Administrative"])
+async def get_upstream_health_metrics():
+    return host_health.snapshot()
+
+@app.get("/metrics/transport", description="### Administrative function\n\n - Direct / proxy zone routing, HTTP/2 availability and observed latency per route", tags=["Administrative"])
+async def get_transport_metrics():
+    return transport_pool.snapshot()
+
+@app.get("/metrics/funding-stream", description="### Administrative function\n\n - WebSocket funding ingest: connection state, reconnects and message counters per exchange, local fan-out and cross-replica backplane", tags=["Administrative"])
+async def get_funding_stream_metrics():
+    return {**funding_ingest.snapshot(), "broadcast": funding_hub.snapshot(), "backplane": funding_backplane.snapshot(), "spreads": spread_scanner.snapshot(), "settlements": settlement_recorder.snapshot(), "leaderboard": funding_leaderboard.snapshot(), "calendar": funding_calendar.snapshot()}
+
+@app.get("/metrics/candle-rings", description="### Administrative function\n\n - In-memory candle rings: tracked symbols, memory used, hit rate and kline stream state", tags=["Administrative"])
+async def get_candle_ring_metrics():
+    return ring_candle_source.snapshot()
+
+@app.get("/metrics/live-analysis", description="### Administrative function\n\n - Materialized analysis per symbol: version, as_of and what triggered the last recompute", tags=["Administrative"])
+async def get_live_analysis_metrics():
+    return live_analysis.snapshot()
+
+@app.get("/metrics/compute", description="### Administrative function\n\n - Analysis compute pool: executor mode, in-flight and queued tasks, latency percentiles and how arrays crossed the process boundary", tags=["Administrative"])
+async def get_compute_metrics():
+    return compute_executor.snapshot()
+
+@app.get("/metrics/event-study", description="### Administrative function\n\n - Event study cache hits / misses, events aligned and candle downloads", tags=["Administrative"])
+async def get_event_study_metrics():
+    return event_study.snapshot()
+
 @app.patch("/setup-metadata", description="### Administrative function\n\n - This function is used to retrieve all the metadata from the cryptos. \n\n - This process may take a while!", tags=["Administrative"])
 async def setup_enviroment():
 
@@ -218,4 +540,4 @@ async def setup_enviroment():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host='0.0.0.0', port=8080)
\ No newline at end of file
+    uvicorn.run(app, host='0.0.0.0', port=8080, ws="websockets", ws_per_message_deflate=True)
\ No newline at end of file
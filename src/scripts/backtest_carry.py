@@ -0,0 +1,21 @@
+from pprint import pprint
+import asyncio, sys, time
+
+from src.app.funding_rate.backtest import FundingBacktester
+
+
+async def backtest(days: int = 180, symbols=None):
+    """Carry backtest of the last `days` over `symbols` (every symbol listed on both exchanges if None)"""
+    end = int(time.time() * 1000)
+    start = end - days * 24 * 60 * 60 * 1000
+    return await FundingBacktester().run(symbols, start, end)
+
+
+async def main_testing():
+    # python -m src.scripts.backtest_carry [days] [SYMBOL ...]
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+    result = await backtest(days, sys.argv[2:] or None)
+    pprint({key: value for key, value in result.items() if key != "by_symbol"})
+
+if __name__ == "__main__":
+    asyncio.run(main_testing())
@@ -1,53 +1,31 @@
 from pprint import pprint
-import asyncio, uuid
+import asyncio, sys
 
-from app.bitget_layer import BitgetService
-from app.redis_layer import RedisService
-from app.chart_analysis import FundingRateChart
-
-
-
-bitget_service = BitgetService()
-redis_service = RedisService()
+from src.app.funding_rate.backfill import FundingBackfill
 
 
 async def migrate_model(symbol):
-    # Get historical funding rate
-    historical_funding_rate = await bitget_service.get_historical_funding_rate(symbol)
-    crypto_analysis = FundingRateChart(symbol)
-
-    final_model_result = []
-    # Get Analysis if was a funding rate greater than 0.5
-    for fr_day in historical_funding_rate:
-        if fr_day[0] <= -0.5:
-            analysis = await crypto_analysis.set_analysis(fr_day[2])
-            final_model_result.append({
-                "id": str(uuid.uuid4()),
-                "period": fr_day[1],
-                "funding_rate_value": fr_day[0],
-                "analysis": analysis
-            })
-            
-        else:
-            final_model_result.append({
-                "id": str(uuid.uuid4()),
-                "period": fr_day[1],
-                "funding_rate_value": fr_day[0],
-                "analysis": {}
-            })
-
-    
-    return final_model_result
-
-
+    # Every funding period of the symbol, analysed when the funding rate was <= -0.5
+    # (candle windows are downloaded once for all its periods)
+    final_model_result, failed = await FundingBackfill().backfill_symbol(symbol)
+    if failed:
+        print(f"Analysis failed for {len(failed)} periods of {symbol}")
 
+    return final_model_result
 
 
+async def migrate_all(symbols=None):
+    """Backfill the whole universe (or `symbols`) to Mongo, resumable from the checkpoint"""
+    return await FundingBackfill().run(symbols)
 
 
 async def main_tesing():
+    if len(sys.argv) > 1 and sys.argv[1] == "all":
+        pprint(await migrate_all(sys.argv[2:] or None))
+        return
+
     symbol = await migrate_model("BIGTIMEUSDT")
     print(pprint(symbol))
 
 if __name__ == "__main__":
-    asyncio.run(main_tesing())
\ No newline at end of file
+    asyncio.run(main_tesing())
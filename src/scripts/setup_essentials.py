@@ -52,7 +52,7 @@ async def retrieve_list_symbol():
 
     return bitget_filtered_symbols, binance_filtered_symbols
 
-async def fetch_symbol_data(symbol, rate_limiter_metadata, rate_limiter_exchange_metadata, symbol_exchanges):
+async def fetch_symbol_data(symbol, rate_limiter_metadata, symbol_exchanges):
     print(f"Fetching data for {symbol}")
 
     # Rate-limited API calls
@@ -63,12 +63,9 @@ async def fetch_symbol_data(symbol, rate_limiter_metadata, rate_limiter_exchange
             symbol=symbol
         )
     )
+    # Exchange calls are paced by the adaptive limiters inside the data service
     general_exchange_metadata_task = asyncio.create_task(
-        rate_limited_call(
-            func=crypto_data_service.get_general_exchange_metadata,
-            rate_limiter=rate_limiter_exchange_metadata,
-            symbol=symbol
-        )
+        crypto_data_service.get_general_exchange_metadata(symbol=symbol)
     )
 
     # Run both tasks concurrently
@@ -134,19 +131,27 @@ async def set_metadata_symbols(bitget_filtered_symbols, binance_filtered_symbols
         for crypto in set(bitget_filtered_symbols + binance_filtered_symbols)
     }
 
-    # Create separate rate limiters
+    # CoinMarketCap plan quota, exchange calls adapt on their own (see src/app/rate_control.py)
     rate_limiter_metadata = TokenBucketRateLimiter(rate=30/60, capacity=1)  # 30 calls per minute
-    rate_limiter_exchange_metadata = TokenBucketRateLimiter(rate=50/60, capacity=1)  # Adjust as needed
+
+    # Resolve every funding interval up front (one fundingInfo download), later lookups hit the cache
+    await crypto_data_service.get_funding_rate_intervals(all_symbols.tolist())
 
     tasks = [
-        fetch_symbol_data(symbol, rate_limiter_metadata, rate_limiter_exchange_metadata, symbol_exchanges)
+        fetch_symbol_data(symbol, rate_limiter_metadata, symbol_exchanges)
         for symbol in all_symbols
     ]
     await asyncio.gather(*tasks)
 
+async def index_funding_intervals():
+    """Populate the fr_expiration:{interval} sets from the metadata already in mongodb"""
+    indexed = await mongo_service.reindex_funding_intervals()
+    print(f"Indexed the funding interval of {indexed} symbols")
+
 async def main_crypt():
     bitget_filtered_symbols, binance_filtered_symbols = await retrieve_list_symbol()
     await set_metadata_symbols(bitget_filtered_symbols, binance_filtered_symbols)
+    await index_funding_intervals()
 
 if __name__ == "__main__":
     asyncio.run(main_crypt())